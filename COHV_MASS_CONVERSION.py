@@ -1,12 +1,11 @@
 import os
-import time
 import sys
+import time
 import ctypes
-import multiprocessing
+import threading
 from datetime import datetime
 from pathlib import Path
 import logging
-from itertools import cycle
 
 import pandas as pd
 
@@ -19,7 +18,12 @@ from sap_functions import (
     sap_element_exists, get_sap_message,
 )
 from sap_transactions import cohv_mass_processing, partial_matching
-from other_functions import append_status_to_excel
+from session_pool import SessionPool, load_expected_sizes, save_expected_sizes
+from sap_waits import wait_for_status_change, wait_while_busy
+from results_channel import ResultsCollector, to_columnar_batch
+from decision_store import DecisionStore
+from cohv_rules import load_rules
+from instrumentation import TRACER, summary_line, write_chrome_trace
 
 
 # Change variants here if necessary
@@ -35,6 +39,33 @@ BASE_PATH = Path(
     r"P:\Technisch\PLANY PRODUKCJI\PLANIŚCI\PP_TOOLS_TEMP_FILES\04_COHV_MASS_CONVERSION"
 )
 ERROR_LOG_PATH = BASE_PATH / "error.log"
+# Number of rows of each variant from previous runs (used to process the largest variants first)
+VARIANT_SIZES_PATH = BASE_PATH / "variant_row_counts.json"
+# Pipelined run: results are written and remaining orders are loaded while last conversions are still running
+PIPELINED_MODE = True
+# Session workers are threads of this process ("thread") or separate processes ("process"), see SessionPool
+SESSION_POOL_EXECUTOR = "thread"
+# Incremental run: decisions of previous runs are reused for orders whose input values didn't change and
+# skipped positions file contains only newly skipped orders
+INCREMENTAL_MODE = True
+# SQLite file has to be local - its locking (and WAL) isn't reliable on network shares
+DECISION_STORE_PATH = (
+    Path(os.environ.get("LOCALAPPDATA", Path.home())) / "04_COHV_MASS_CONVERSION" / "cohv_decisions.sqlite"
+)
+# Results of all runs (Parquet partitioned by date and variant, see history_store.py)
+HISTORY_PATH = BASE_PATH / "history"
+# Daily converted/skipped Excel files are written only if True, otherwise they can be rendered from the history
+# on demand: python history_store.py excel --root <HISTORY_PATH> --kind skipped --date YYYY-MM-DD --output ...
+WRITE_EXCEL_FILES = False
+# Conversion rules (see cohv_rules.py) - file on BASE_PATH can be changed by planners, rules bundled with the program
+# are used if it doesn't exist
+RULES_PATH = BASE_PATH / "cohv_rules.json"
+DEFAULT_RULES_PATH = Path(__file__).with_name("cohv_rules.json")
+# Time of stages and SAP GUI calls are measured, trace of every run is saved to TRACE_DIR (Chrome trace JSON)
+TRACE_RUN = True
+TRACE_DIR = BASE_PATH / "traces"
+# Columns of the status sheet which are added if they are missing (otherwise their values wouldn't be saved)
+NEW_STATUS_COLUMNS = ["COHV_SESSION_UTILISATION", "COHV_RUN_PROFILE"]
 
 RESULT_COL_NAMES = [
     "AUFNR",
@@ -47,6 +78,8 @@ RESULT_COL_NAMES = [
     "LABST",
     "FEVOR",
 ]
+# Skipped orders have reason of the skip in addition
+SKIPPED_COL_NAMES = RESULT_COL_NAMES + ["REASON"]
 
 
 def is_zero(value):
@@ -124,69 +157,209 @@ def main_cohv_logic_function(logic_parameters):
     return result
 
 
-def select_and_convert(q, s_num, transaction, variant_name):
+def main_cohv_logic_frame(df):
     """
-    :param variant_name: variant of SAP transaction
-    :param q: processing.Queue() object
+    Batch version of main_cohv_logic_function - the same conditions evaluated for all rows of COHV table at once.
+    :param df: DataFrame with LABST, GAMNG, MATNR, MATXT and FEVOR columns (values as read from SAP)
+    :return: boolean Series, False - skip, True - convert
+    """
+    labst_is_zero = df["LABST"].astype("int64") == 0
+    gamng_is_one = df["GAMNG"].astype("int64") == 1
+    matnr_is_configurated = df["MATNR"].str.startswith("99")
+    matxt_is_9H = df["MATXT"].str.contains("9H", regex=False)
+    fevor_is_csr = df["FEVOR"] == "CSR"
+
+    condition1 = ~(fevor_is_csr & ~labst_is_zero)
+    condition2 = matnr_is_configurated | labst_is_zero
+    condition3 = ~(matxt_is_9H & matnr_is_configurated & ~gamng_is_one)
+
+    return (condition1 & condition2 & condition3).astype(bool)
+
+
+COHV_LOGIC_FACTORS = {
+    "LABST": is_zero,
+    "GAMNG": is_one,
+    "MATNR": is_configurated,
+    "MATXT": is_9H,
+    "FEVOR": is_csr,
+}
+
+COHV_TABLE_ID = "wnd[0]/usr/cntlCUSTOM/shellcont/shell/shellcont/shell"
+# Multiple selection of planned orders in COHV selection screen
+PLANNED_ORDERS_BUTTON_ID = ("wnd[0]/usr/tabsTABSTRIP_SELBLOCK/tabpSEL_00/ssub%_SUBSCREEN_SELBLOCK:PPIO_ENTRY:1200/"
+                            "btn%_S_PLNUM_%_APP_%-VALU_PUSH")
+INSERT_TABLE_ID = "wnd[1]/usr/tabsTAB_STRIP/tabpSIVA/ssubSCREEN_HEADER:SAPLALDB:3010/tblSAPLALDBSINGLE"
+
+# Task which loads skipped orders to COHV at the end of pipelined run: (REMAINING_ORDERS_TASK, variant, orders)
+REMAINING_ORDERS_TASK = "REMAINING_ORDERS"
+
+# Decision store of each thread (opened on first use, SQLite connection can't be shared by threads)
+_THREAD_DATA = threading.local()
+# Compiled rules of this process (loaded on first use)
+_RULES = None
+
+
+def get_decision_store():
+    """
+    :return: DecisionStore object in incremental mode, otherwise None
+    """
+    if not INCREMENTAL_MODE:
+        return None
+    decision_store = getattr(_THREAD_DATA, "decision_store", None)
+    if decision_store is None:
+        decision_store = _THREAD_DATA.decision_store = DecisionStore(DECISION_STORE_PATH)
+    return decision_store
+
+
+def get_rules():
+    """
+    :return: RulePolicy object (see cohv_rules.py), rules file is read and compiled only once per process
+    """
+    global _RULES
+    if _RULES is None:
+        rules_path = RULES_PATH if RULES_PATH.exists() else DEFAULT_RULES_PATH
+        _RULES = load_rules(rules_path, COHV_LOGIC_FACTORS.keys())
+    return _RULES
+
+
+def instrument_session(session):
+    """
+    :return: session which counts SAP GUI calls (see instrumentation.py) if TRACE_RUN, otherwise the same session
+    """
+    return TRACER.wrap(session) if TRACE_RUN else session
+
+
+def select_variant_orders(session, s_num, variant_name):
+    """
+    Loads variant in COHV and selects rows which should be converted.
+    :param session: SAP session with COHV selection screen opened
     :param s_num: num of window on which to operate
-    :param transaction: transaction which is opened on that window
-    :return:
+    :param variant_name: variant of SAP transaction
+    :return: {'selected_orders': dict, 'skipped_orders': dict} or None if there wasn't any data, skipped orders
+    have REASON column
     """
-    session = get_client(s_num, transaction)
-    simple_load_variant(session, variant_name, False)
+    with TRACER.stage("load variant", variant=variant_name):
+        simple_load_variant(session, variant_name, False)
 
     # Check if there is any data
     pop_up_id = "wnd[1]/tbar[0]/btn[0]"
     if sap_element_exists(session, pop_up_id):
         session.findById(pop_up_id).press()
-        sap_result = (dict(), dict(), "There wasn't any data.")
-        q.put((variant_name, sap_result))
-        return
-
-    cohv_logic_factors = {
-        "LABST": is_zero,
-        "GAMNG": is_one,
-        "MATNR": is_configurated,
-        "MATXT": is_9H,
-        "FEVOR": is_csr,
-    }
-
-    cohv_table_id = "wnd[0]/usr/cntlCUSTOM/shellcont/shell/shellcont/shell"
+        return None
 
     # Format of the result: {'selected_orders': dict, 'skipped_orders': dict, 'sap_message': str}
     # result = select_rows_in_table("COHV", s_num, cohv_table_id, cohv_logic_factors, main_cohv_logic_function, RESULT_COL_NAMES, session)
-    result = select_rows_in_table(
-        "COHV",
-        s_num,
-        cohv_table_id,
-        cohv_logic_factors,
-        main_cohv_logic_function,
-        RESULT_COL_NAMES,
-    )
+    rule_set = get_rules().for_variant(variant_name)
+    with TRACER.stage("select orders", variant=variant_name):
+        result = select_rows_in_table(
+            "COHV",
+            s_num,
+            COHV_TABLE_ID,
+            COHV_LOGIC_FACTORS,
+            main_cohv_logic_function,
+            RESULT_COL_NAMES,
+            session,
+            cohv_frame_logic_func=rule_set,
+            decision_store=get_decision_store(),
+            logic_version=rule_set.version,
+        )
+
+    return result
 
+
+def convert_selected_orders(session, result, transaction):
+    """
+    Converts orders selected by select_variant_orders and opens transaction again.
+    :param session: SAP session
+    :param result: result of select_variant_orders
+    :param transaction: transaction to be opened after the conversion
+    :return: SAP message
+    """
     # TODO: do the conversion if any order was selected
     if len(result["selected_orders"]) > 0:
-        cohv_mass_processing(session, "210", False)
+        previous_msg = get_sap_message(session)
+        with TRACER.stage("mass processing"):
+            cohv_mass_processing(session, "210", False)
+            # result of the mass processing is shown in the status bar when it's finished
+            wait_for_status_change(session, previous_msg, label="mass processing message")
         sap_msg = get_sap_message(session)
     else:
         sap_msg = "Nothing was selected for conversion."
 
     # TODO: load transaction again
     open_one_transaction(session, transaction)
-    time.sleep(1)
+    wait_while_busy(session, replaced_sleep=1)
 
-    sap_result = (
-        result["selected_orders"],
-        result["skipped_orders"],
+    return sap_msg
+
+
+def select_and_convert(q, s_num, transaction, variant_name):
+    """
+    :param variant_name: variant of SAP transaction
+    :param q: processing.Queue() object, or None if result should be only returned
+    :param s_num: num of window on which to operate
+    :param transaction: transaction which is opened on that window
+    :return: (selected_orders, skipped_orders, sap_msg) tuple
+    """
+    session = instrument_session(get_client(s_num, transaction))
+    with TRACER.stage("select and convert", variant=variant_name):
+        result = select_variant_orders(session, s_num, variant_name)
+
+        if result is None:
+            sap_result = (dict(), dict(), "There wasn't any data.")
+        else:
+            sap_msg = convert_selected_orders(session, result, transaction)
+            sap_result = (
+                result["selected_orders"],
+                result["skipped_orders"],
+                sap_msg,
+            )
+
+    if q is not None:
+        q.put((variant_name, sap_result))
+    return sap_result
+
+
+def select_and_convert_task(sess_num, variant):
+    """
+    Task handler for SessionPool - processes one variant on the session owned by the worker.
+    :return: (selected_batch, skipped_batch, sap_msg), batches are columnar (see results_channel.to_columnar_batch)
+    """
+    selected_orders, skipped_orders, sap_msg = select_and_convert(None, sess_num, "COHV", variant)
+    return (
+        to_columnar_batch(selected_orders, RESULT_COL_NAMES),
+        to_columnar_batch(skipped_orders, SKIPPED_COL_NAMES),
         sap_msg,
     )
-    q.put((variant_name, sap_result))
 
 
-# A wrapper function that locks the session while processing
-def safe_select_and_convert(lock, queue, sess_num, variant):
-    with lock:
-        select_and_convert(queue, sess_num, "COHV", variant)
+def pipelined_task(sess_num, task):
+    """
+    Task handler for pipelined run (generator, see SessionPool). For variant it yields (selected_batch,
+    skipped_batch) as soon as selection is known - before the conversion is finished - and returns
+    (selected_batch, skipped_batch, sap_msg). For REMAINING_ORDERS_TASK it loads remaining orders to COHV.
+    """
+    if isinstance(task, tuple) and task[0] == REMAINING_ORDERS_TASK:
+        _, variant_name, planned_orders = task
+        with TRACER.stage("load remaining orders", orders=len(planned_orders)):
+            load_remaining_orders(instrument_session(get_client(sess_num, "COHV")), variant_name, list(planned_orders))
+        return "Remaining orders loaded."
+
+    session = instrument_session(get_client(sess_num, "COHV"))
+    result = select_variant_orders(session, sess_num, task)
+    if result is None:
+        return (
+            to_columnar_batch(dict(), RESULT_COL_NAMES),
+            to_columnar_batch(dict(), SKIPPED_COL_NAMES),
+            "There wasn't any data.",
+        )
+
+    selected_batch = to_columnar_batch(result["selected_orders"], RESULT_COL_NAMES)
+    skipped_batch = to_columnar_batch(result["skipped_orders"], SKIPPED_COL_NAMES)
+    yield selected_batch, skipped_batch
+
+    sap_msg = convert_selected_orders(session, result, "COHV")
+    return selected_batch, skipped_batch, sap_msg
 
 
 def load_remaining_orders(session, variant_name, planned_orders):
@@ -200,9 +373,6 @@ def load_remaining_orders(session, variant_name, planned_orders):
     if len(planned_orders) < 1:
         return
 
-    insert_table_id = "wnd[1]/usr/tabsTAB_STRIP/tabpSIVA/ssubSCREEN_HEADER:SAPLALDB:3010/tblSAPLALDBSINGLE"
-    planned_orders_multiple_selection_button_id = "wnd[0]/usr/tabsTABSTRIP_SELBLOCK/tabpSEL_00/ssub%_SUBSCREEN_SELBLOCK:PPIO_ENTRY:1200/btn%_S_PLNUM_%_APP_%-VALU_PUSH"
-
     open_one_transaction(session, "COHV")
     simple_load_variant(session, variant_name, True)
 
@@ -227,8 +397,8 @@ def load_remaining_orders(session, variant_name, planned_orders):
     insert_production_orders(
         planned_orders,
         session,
-        planned_orders_multiple_selection_button_id,
-        insert_table_id,
+        PLANNED_ORDERS_BUTTON_ID,
+        INSERT_TABLE_ID,
     )
 
     # Load variant in
@@ -236,13 +406,19 @@ def load_remaining_orders(session, variant_name, planned_orders):
 
 
 if __name__ == "__main__":
+    # Only the main process writes outputs - worker processes (which import this module again) don't load openpyxl
+    # and pyarrow
+    from other_functions import append_status_to_excel
+    from history_store import write_results
+
     username = os.getlogin()
     status_file = (
         f"C:/Users/{username}/OneDrive - Roto Frank DST/General/05_Automatyzacja_narzędzia/100_STATUS"
         f"/02_AUTOMATION_TOOLS_STATUS_BMH.xlsx"
     )
 
-    today = datetime.today().strftime("%Y_%m_%d")
+    run_date = datetime.today()
+    today = run_date.strftime("%Y_%m_%d")
     start_time = datetime.now().strftime("%H:%M:%S")
 
     file_paths = {
@@ -268,12 +444,10 @@ if __name__ == "__main__":
         format="%(asctime)s - %(levelname)s - %(message)s",
     )
 
-    # queue = multiprocessing.Queue()  # Create a shared queue
-    manager = multiprocessing.Manager()
-    queue = manager.Queue()
-    processes = []
-
     try:
+        # errors in the rules file are found before anything is done in SAP
+        get_rules()
+
         sess1, tr1, nu1 = get_last_session(max_num_of_sessions=4)
         sess2, tr2, nu2 = get_last_session(max_num_of_sessions=5)
         sess3, tr3, nu3 = get_last_session(max_num_of_sessions=6)
@@ -284,51 +458,103 @@ if __name__ == "__main__":
         for sess in sessions:
             open_one_transaction(sess, "COHV")
 
-        # Create a lock per session
-        session_locks = [multiprocessing.Lock() for _ in sessions]
-
-        # Start processes
-        processes = []
-        for variant, sess_num, tr, lock in zip(
-            VARIANT_NAMES,
-            cycle(sess_nums),
-            cycle(sess_transactions),
-            cycle(session_locks),
-        ):
-            p = multiprocessing.Process(
-                target=safe_select_and_convert, args=(lock, queue, sess_num, variant)
+        results = ResultsCollector(RESULT_COL_NAMES, SKIPPED_COL_NAMES)
+        result_sap_messages = results.sap_messages
+        df_convrted = None
+        df_skipped = None
+
+        def save_results():
+            #  save results to history
+            df_convrted = results.frame("selected", with_variant=True)
+            df_skipped = results.frame("skipped", with_variant=True)
+            # variants without orders of a kind (also empty variants) replace the results of a previous run as well
+            write_results(
+                HISTORY_PATH, run_date, {"selected": df_convrted, "skipped": df_skipped}, variants=results.sizes.keys()
             )
-            processes.append(p)
-            p.start()
-
-        # Wait for all to finish
-        for p in processes:
-            p.join()
-
-        result_converted_positions = {key: [] for key in RESULT_COL_NAMES}
-        result_skipped_positions = {key: [] for key in RESULT_COL_NAMES}
-        result_sap_messages = dict()
-
-        # Collect operation statuses into dictionaries
-        while not queue.empty():
-            variant, sap_data = queue.get()
-            for key in result_converted_positions:
-                result_converted_positions[key].extend(sap_data[0].get(key, []))
-            for key in result_skipped_positions:
-                result_skipped_positions[key].extend(sap_data[1].get(key, []))
-            result_sap_messages[variant] = sap_data[2]
-
-        #  save results to file
-        df_convrted = pd.DataFrame(result_converted_positions)
-        df_convrted.to_excel(paths["converted_positions"])
-        df_skipped = pd.DataFrame(result_skipped_positions)
-        df_skipped.to_excel(paths["skipped_positions"])
-
-        load_remaining_orders(
-            session=sess3,
-            variant_name=VARIANT_NAMES[0],
-            planned_orders=df_skipped["AUFNR"].to_list(),
+
+            if WRITE_EXCEL_FILES:
+                df_convrted.to_excel(paths["converted_positions"])
+                if INCREMENTAL_MODE:
+                    # only orders skipped for the first time (or with changed input values)
+                    new_keys = get_decision_store().decided_since(run_start_time)
+                    df_skipped[df_skipped["AUFNR"].isin(new_keys)].to_excel(paths["skipped_positions"])
+                else:
+                    df_skipped.to_excel(paths["skipped_positions"])
+            return df_convrted, df_skipped
+
+        # One worker per session, the largest variants are processed first
+        session_pool = SessionPool(
+            sess_nums, pipelined_task if PIPELINED_MODE else select_and_convert_task, SESSION_POOL_EXECUTOR
         )
+        expected_sizes = load_expected_sizes(VARIANT_SIZES_PATH)
+
+        run_start_time = time.time()
+        session_pool.start()
+        try:
+            for variant in session_pool.order_tasks(VARIANT_NAMES, expected_sizes):
+                session_pool.submit(variant)
+            if not PIPELINED_MODE:
+                session_pool.close()
+
+            # Number of variant tasks whose selection is known (variant can be in VARIANT_NAMES more times)
+            num_of_selections = 0
+            # {variant: number of selections sent as event, result of which didn't arrive yet}
+            pending_results = dict()
+
+            # Collect operation statuses into dictionaries
+            for kind, task, sap_data, error in session_pool.messages():
+                if isinstance(task, tuple):
+                    # remaining orders were loaded
+                    if error:
+                        result_sap_messages[REMAINING_ORDERS_TASK] = f"Error: {error}"
+                    continue
+
+                if kind == "event":
+                    # selection is known before the conversion is finished
+                    results.add(task, sap_data[0], sap_data[1])
+                    pending_results[task] = pending_results.get(task, 0) + 1
+                    num_of_selections += 1
+                else:
+                    if pending_results.get(task):
+                        # selection was already added with the event
+                        pending_results[task] -= 1
+                    else:
+                        num_of_selections += 1
+                        if not error:
+                            results.add(task, sap_data[0], sap_data[1])
+                    result_sap_messages[task] = f"Error: {error}" if error else sap_data[2]
+
+                if PIPELINED_MODE and df_skipped is None and num_of_selections == len(VARIANT_NAMES):
+                    # All selections are known - output can be written and remaining orders loaded on the first
+                    # free session while conversions of the last variants are still running
+                    with TRACER.stage("save results"):
+                        df_convrted, df_skipped = save_results()
+                    session_pool.submit(
+                        (REMAINING_ORDERS_TASK, VARIANT_NAMES[0], tuple(df_skipped["AUFNR"].to_list()))
+                    )
+                    session_pool.close()
+        finally:
+            # workers have to be stopped also after an error, otherwise the run never ends
+            session_pool.shutdown()
+
+        save_expected_sizes(VARIANT_SIZES_PATH, results.sizes)
+        if INCREMENTAL_MODE and not any(str(msg).startswith("Error") for msg in result_sap_messages.values()):
+            # orders which no longer appear in any variant
+            with TRACER.stage("compact decision store"):
+                get_decision_store().compact(run_start_time)
+        program_status["COHV_SESSION_UTILISATION"] = session_pool.utilisation_report()
+        print(program_status["COHV_SESSION_UTILISATION"])
+
+        if not PIPELINED_MODE:
+            with TRACER.stage("save results"):
+                df_convrted, df_skipped = save_results()
+
+            with TRACER.stage("load remaining orders", orders=df_skipped.shape[0]):
+                load_remaining_orders(
+                    session=instrument_session(sess3),
+                    variant_name=VARIANT_NAMES[0],
+                    planned_orders=df_skipped["AUFNR"].to_list(),
+                )
 
         # Handle the information for status file
         total_gamng = int(pd.to_numeric(df_convrted["GAMNG"], errors="coerce").sum())
@@ -336,14 +562,29 @@ if __name__ == "__main__":
             f"In total {df_convrted.shape[0]} rows converted. Total sum of "
             f"converted items: {total_gamng}."
         )
-        program_status[
-            "COHV_CONVERTED_LINK"
-        ] = f"Details of converted items: {paths['converted_positions']}"
-        program_status[
-            "COHV_SKIPPED_LINK"
-        ] = f"Details of skipped items: {paths['skipped_positions']}"
+        if WRITE_EXCEL_FILES:
+            program_status[
+                "COHV_CONVERTED_LINK"
+            ] = f"Details of converted items: {paths['converted_positions']}"
+            program_status[
+                "COHV_SKIPPED_LINK"
+            ] = f"Details of {'newly ' if INCREMENTAL_MODE else ''}skipped items: {paths['skipped_positions']}"
+        else:
+            history_date = run_date.strftime("%Y-%m-%d")
+            program_status[
+                "COHV_CONVERTED_LINK"
+            ] = f"Details of converted items: {HISTORY_PATH / 'selected'} (date={history_date})"
+            program_status[
+                "COHV_SKIPPED_LINK"
+            ] = f"Details of skipped items: {HISTORY_PATH / 'skipped'} (date={history_date})"
         program_status["COHV_CONVERSION_SYSTEM_MESSAGE"] = result_sap_messages
 
+        if TRACE_RUN:
+            trace_events = session_pool.trace_events + TRACER.drain()
+            trace_path = TRACE_DIR / f"cohv_trace_{today}_{start_time.replace(':', '')}.json"
+            write_chrome_trace(trace_path, trace_events)
+            program_status["COHV_RUN_PROFILE"] = f"{summary_line(trace_events)} | trace: {trace_path}"
+
     except Exception as e:
         print(e)
         logging.error("Error occurred", exc_info=True)
@@ -354,5 +595,5 @@ if __name__ == "__main__":
         program_status["start_time"] = start_time
         program_status["end_time"] = end_time
         append_status_to_excel(
-            status_file, program_status, ERROR_LOG_PATH, sheet_name="COHV_CONVERSION"
+            status_file, program_status, ERROR_LOG_PATH, sheet_name="COHV_CONVERSION", new_headers=NEW_STATUS_COLUMNS
         )
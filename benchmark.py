@@ -0,0 +1,194 @@
+"""
+Benchmark of the COHV conversion run against the fake SAP GUI backend (fake_sap_gui.py).
+
+Reports wall time, number of COM calls (total and per member), peak Python memory, rows/sec and time spent in
+sap_waits helpers for:
+select_rows_in_table, select_and_convert, insert_production_orders and append_status_to_excel.
+
+Usage:
+    python benchmark.py --sizes 100,1000,10000 --variants 1,5 --output bench_results.json
+"""
+import argparse
+import json
+import os
+import platform
+import queue
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from openpyxl import Workbook
+
+import COHV_MASS_CONVERSION
+import fake_sap_gui
+import sap_waits
+from sap_connection import use_fake_sap_gui
+from sap_functions import open_one_transaction, simple_load_variant, select_rows_in_table, insert_production_orders
+from other_functions import append_status_to_excel
+from COHV_MASS_CONVERSION import (
+    COHV_LOGIC_FACTORS,
+    COHV_TABLE_ID,
+    INSERT_TABLE_ID,
+    PLANNED_ORDERS_BUTTON_ID,
+    RESULT_COL_NAMES,
+    main_cohv_logic_function,
+    main_cohv_logic_frame,
+    select_and_convert,
+)
+
+
+def measure(gui, operation, rows, variants, func):
+    """
+    Runs func once and returns its measurements.
+    :param gui: FakeSapGui object (source of COM call statistics)
+    :param operation: name of measured operation
+    :param rows: number of rows processed by the operation (used for rows/sec)
+    :param variants: number of variants processed by the operation
+    :param func: function without arguments
+    :return: dictionary with results
+    """
+    gui.reset_calls()
+    sap_waits.wait_summary(clear=True)
+    tracemalloc.start()
+    start = time.perf_counter()
+    func()
+    wall_time = time.perf_counter() - start
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "operation": operation,
+        "rows": rows,
+        "variants": variants,
+        "wall_time_s": round(wall_time, 4),
+        "com_calls": gui.total_calls(),
+        "com_calls_by_member": dict(gui.calls.most_common()),
+        "peak_memory_kb": round(peak_memory / 1024, 1),
+        "rows_per_sec": round(rows / wall_time, 1) if wall_time else None,
+        "waits": sap_waits.wait_summary(),
+    }
+
+
+def prepare_gui(num_rows, num_of_variants, latency):
+    variant_names = [f"ZZ_BENCH_{idx}" for idx in range(num_of_variants)]
+    datasets = {
+        name: fake_sap_gui.make_cohv_dataset(num_rows, seed=idx, first_order=10_000_000 + idx * 1_000_000)
+        for idx, name in enumerate(variant_names)
+    }
+    gui = fake_sap_gui.FakeSapGui(datasets, latency=latency)
+    use_fake_sap_gui(gui)
+    return gui, variant_names
+
+
+def bench_select_rows_in_table(num_rows, latency, batch_mode, export_mode=False):
+    gui, variant_names = prepare_gui(num_rows, 1, latency)
+    session = gui.session(0)
+    open_one_transaction(session, "COHV")
+    simple_load_variant(session, variant_names[0])
+
+    operation = "select_rows_in_table" + ("[frame]" if batch_mode else "") + ("[export]" if export_mode else "")
+    return measure(gui, operation, num_rows, 1, lambda: select_rows_in_table(
+        "COHV", 0, COHV_TABLE_ID, COHV_LOGIC_FACTORS, main_cohv_logic_function, RESULT_COL_NAMES, session,
+        cohv_frame_logic_func=main_cohv_logic_frame if batch_mode else None,
+        export_threshold=0 if export_mode else None,
+    ))
+
+
+def bench_select_and_convert(num_rows, num_of_variants, latency):
+    gui, variant_names = prepare_gui(num_rows, num_of_variants, latency)
+    session = gui.session(0)
+    open_one_transaction(session, "COHV")
+    results = queue.Queue()
+
+    def run():
+        for variant_name in variant_names:
+            select_and_convert(results, 0, "COHV", variant_name)
+
+    return measure(gui, "select_and_convert", num_rows * num_of_variants, num_of_variants, run)
+
+
+def bench_insert_production_orders(num_rows, latency):
+    gui, _ = prepare_gui(0, 0, latency)
+    session = gui.session(0)
+    open_one_transaction(session, "COHV")
+    orders = [str(10_000_000 + idx) for idx in range(num_rows)]
+
+    return measure(gui, "insert_production_orders", num_rows, 0, lambda: insert_production_orders(
+        orders, session, PLANNED_ORDERS_BUTTON_ID, INSERT_TABLE_ID
+    ))
+
+
+def bench_append_status_to_excel(num_rows, latency, work_dir):
+    gui, _ = prepare_gui(0, 0, latency)
+    status_file = os.path.join(work_dir, f"status_{num_rows}.xlsx")
+    headers = ["TIMESTAMP", "start_time", "end_time", "COHV_CONVERSION_SUMMARY"]
+
+    # status file with num_rows rows of history
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "COHV_CONVERSION"
+    ws.append(headers)
+    for idx in range(num_rows):
+        ws.append([f"2025-01-01 00:00:{idx % 60:02d}", "05:00:00", "05:10:00", f"In total {idx} rows converted."])
+    wb.save(status_file)
+
+    status = {"start_time": "05:00:00", "end_time": "05:10:00", "COHV_CONVERSION_SUMMARY": "benchmark"}
+    return measure(gui, "append_status_to_excel", num_rows, 0, lambda: append_status_to_excel(
+        status_file, status, os.path.join(work_dir, "error.log"), sheet_name="COHV_CONVERSION"
+    ))
+
+
+def run_benchmarks(sizes, variant_counts, latency):
+    # every run evaluates all orders (no decisions from previous runs)
+    COHV_MASS_CONVERSION.INCREMENTAL_MODE = False
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for num_rows in sizes:
+            results.append(bench_select_rows_in_table(num_rows, latency, batch_mode=False))
+            results.append(bench_select_rows_in_table(num_rows, latency, batch_mode=True))
+            results.append(bench_select_rows_in_table(num_rows, latency, batch_mode=True, export_mode=True))
+            for num_of_variants in variant_counts:
+                results.append(bench_select_and_convert(num_rows, num_of_variants, latency))
+            results.append(bench_insert_production_orders(num_rows, latency))
+            results.append(bench_append_status_to_excel(num_rows, latency, work_dir))
+    use_fake_sap_gui(None)
+    return results
+
+
+def print_results(results):
+    print(f"{'operation':<38}{'rows':>8}{'var':>5}{'time [s]':>11}{'COM calls':>11}{'peak [kB]':>11}{'rows/s':>12}")
+    for result in results:
+        print(
+            f"{result['operation']:<38}{result['rows']:>8}{result['variants']:>5}{result['wall_time_s']:>11.3f}"
+            f"{result['com_calls']:>11}{result['peak_memory_kb']:>11.1f}{result['rows_per_sec'] or 0:>12.1f}"
+        )
+
+
+def parse_int_list(value):
+    return [int(item) for item in value.split(",") if item]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark of COHV conversion against fake SAP GUI")
+    parser.add_argument("--sizes", type=parse_int_list, default=[100, 1_000, 10_000],
+                        help="comma separated numbers of orders per variant")
+    parser.add_argument("--variants", type=parse_int_list, default=[1, 5],
+                        help="comma separated numbers of variants for select_and_convert")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every COM call")
+    parser.add_argument("--output", default=None, help="path of JSON file with results")
+    args = parser.parse_args()
+
+    bench_results = run_benchmarks(args.sizes, args.variants, args.latency)
+    print_results(bench_results)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "timestamp": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "latency": args.latency,
+                "results": bench_results,
+            }, f, indent=2)
+        print(f"Results saved to {args.output}")
@@ -0,0 +1,173 @@
+"""
+Declarative rules of COHV conversion. Rules are read from JSON file once and compiled into column predicates which
+are evaluated for the whole table at once:
+
+{
+    "rule_sets": {
+        "default": {
+            "predicates": {
+                "labst_is_zero": {"column": "LABST", "op": "eq", "value": 0, "type": "int"},
+                "fevor_is_csr": {"column": "FEVOR", "op": "eq", "value": "CSR"}
+            },
+            "skip_rules": [
+                {"reason": "CSR order with stock", "when": ["fevor_is_csr", "not labst_is_zero"]}
+            ]
+        }
+    },
+    "variants": {"ZZ_AUTO_PO8": "default"}
+}
+
+Order is skipped if all terms of any skip rule are true, REASON is the reason of the first such rule. Other orders are
+converted. Variants which are not listed in "variants" use the "default" rule set (rule sets can be made e.g. per plant
+and shared by its variants).
+
+Predicate types: "str" (default), "int", "float" (values are converted from SAP format, see convert_sap_values; values
+with decimal places aren't "int", so the predicate is false for them).
+Operators: eq, ne, lt, le, gt, ge, startswith, endswith, contains, in (value is a list), empty (no value).
+"""
+import hashlib
+import json
+
+import pandas as pd
+
+from sap_functions import convert_sap_values
+
+DEFAULT_RULE_SET = "default"
+TYPES = ("str", "int", "float")
+OPERATORS = {
+    "eq": lambda values, value: values == value,
+    "ne": lambda values, value: values != value,
+    "lt": lambda values, value: values < value,
+    "le": lambda values, value: values <= value,
+    "gt": lambda values, value: values > value,
+    "ge": lambda values, value: values >= value,
+    "startswith": lambda values, value: values.str.startswith(value),
+    "endswith": lambda values, value: values.str.endswith(value),
+    "contains": lambda values, value: values.str.contains(value, regex=False),
+    "in": lambda values, value: values.isin(value),
+    "empty": lambda values, value: values.str.strip() == "",
+}
+STRING_OPERATORS = ("startswith", "endswith", "contains", "empty")
+
+
+def compile_predicate(name, spec, allowed_columns):
+    """
+    :param name: name of the predicate (for error messages)
+    :param spec: {"column", "op", "value", "type"} dictionary
+    :param allowed_columns: columns which can be used in predicates
+    :return: function(df) -> boolean Series
+    """
+    column, op, value, dtype = spec.get("column"), spec.get("op"), spec.get("value"), spec.get("type", "str")
+    if column not in allowed_columns:
+        raise ValueError(f"Predicate '{name}': column {column} can't be used, allowed are {', '.join(allowed_columns)}")
+    if op not in OPERATORS:
+        raise ValueError(f"Predicate '{name}': unknown operator {op}")
+    if dtype not in TYPES:
+        raise ValueError(f"Predicate '{name}': unknown type {dtype}")
+    if op in STRING_OPERATORS and dtype != "str":
+        raise ValueError(f"Predicate '{name}': operator {op} can be used only for 'str' type")
+    if op == "in" and not isinstance(value, list):
+        raise ValueError(f"Predicate '{name}': value of 'in' has to be a list")
+    operator = OPERATORS[op]
+
+    def predicate(df):
+        if dtype == "str":
+            values = df[column].astype(str)
+        else:
+            values = convert_sap_values(pd.DataFrame({column: df[column]}), {column: dtype})[column]
+        # values which couldn't be converted are NA - the predicate is false for them
+        return operator(values, value).fillna(False).astype(bool)
+
+    return predicate
+
+
+class RuleSet:
+    """
+    Compiled rule set - can be used as cohv_frame_logic_func (DataFrame -> boolean Series, True - convert).
+    """
+
+    def __init__(self, name, spec, allowed_columns):
+        """
+        :param name: name of the rule set
+        :param spec: {"predicates": dict, "skip_rules": list} dictionary
+        :param allowed_columns: columns which can be used in predicates
+        """
+        self.name = name
+        # changes whenever the rules change, so decisions made by other rules aren't reused
+        self.version = hashlib.sha1(json.dumps(spec, sort_keys=True).encode("utf-8")).hexdigest()
+        self.predicates = {
+            predicate_name: compile_predicate(predicate_name, predicate_spec, allowed_columns)
+            for predicate_name, predicate_spec in spec.get("predicates", dict()).items()
+        }
+        self.columns = sorted({predicate_spec["column"] for predicate_spec in spec.get("predicates", dict()).values()})
+
+        # [(reason, [(predicate name, negated)])]
+        self.skip_rules = []
+        for idx, rule in enumerate(spec.get("skip_rules", [])):
+            terms = []
+            for term in rule.get("when", []):
+                negated = term.startswith("not ")
+                predicate_name = term[4:].strip() if negated else term.strip()
+                if predicate_name not in self.predicates:
+                    raise ValueError(f"Rule set '{name}', skip rule {idx}: unknown predicate {predicate_name}")
+                terms.append((predicate_name, negated))
+            if not terms:
+                raise ValueError(f"Rule set '{name}', skip rule {idx}: no conditions")
+            self.skip_rules.append((rule.get("reason") or f"skip rule {idx}", terms))
+
+    def skip_reasons(self, df):
+        """
+        :param df: DataFrame with columns used by the rules (values as read from SAP)
+        :return: Series with reason of the first matching skip rule, empty string for orders to be converted
+        """
+        values = dict()
+        reasons = pd.Series("", index=df.index, dtype=object)
+        # the first matching rule wins, so rules are applied from the last one
+        for reason, terms in reversed(self.skip_rules):
+            matched = pd.Series(True, index=df.index)
+            for predicate_name, negated in terms:
+                if predicate_name not in values:
+                    values[predicate_name] = self.predicates[predicate_name](df)
+                matched &= ~values[predicate_name] if negated else values[predicate_name]
+            reasons = reasons.mask(matched, reason)
+        return reasons
+
+    def __call__(self, df):
+        return self.skip_reasons(df) == ""
+
+
+class RulePolicy:
+    """
+    All rule sets of the rules file and assignment of variants to them.
+    """
+
+    def __init__(self, spec, allowed_columns):
+        self.rule_sets = {
+            name: RuleSet(name, rule_set_spec, allowed_columns)
+            for name, rule_set_spec in spec.get("rule_sets", dict()).items()
+        }
+        if DEFAULT_RULE_SET not in self.rule_sets:
+            raise ValueError(f"Rule set '{DEFAULT_RULE_SET}' is missing")
+
+        self.variants = dict(spec.get("variants", dict()))
+        for variant, rule_set_name in self.variants.items():
+            if rule_set_name not in self.rule_sets:
+                raise ValueError(f"Variant {variant}: unknown rule set {rule_set_name}")
+
+    def for_variant(self, variant_name):
+        """
+        :return: RuleSet of the variant
+        """
+        return self.rule_sets[self.variants.get(variant_name, DEFAULT_RULE_SET)]
+
+
+def load_rules(path, allowed_columns):
+    """
+    Reads and compiles rules file. Errors (unknown columns, operators, predicates...) are raised here, at startup.
+    :param path: path to JSON file
+    :param allowed_columns: columns which can be used in predicates
+    :return: RulePolicy object
+    """
+    with open(path, encoding="utf-8") as file:
+        spec = json.load(file)
+    return RulePolicy(spec, list(allowed_columns))
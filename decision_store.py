@@ -0,0 +1,126 @@
+import hashlib
+import os
+import sqlite3
+import time
+
+# Max number of parameters in one SQLite query
+_CHUNK_SIZE = 500
+
+
+class DecisionStore:
+    """
+    Persistent store (local SQLite file) of decisions made for orders in previous runs. Every decision is kept
+    together with fingerprint of the input values it was made from, so decisions of unchanged orders are reused and
+    orders which are new or changed in a run can be found (see decided_since). Reason of skipped orders is kept with
+    the decision. Values of the orders aren't stored, they are always read from the table.
+    """
+
+    def __init__(self, db_path, key_column="AUFNR"):
+        """
+        :param db_path: path to SQLite file on a local disk (not on a network share), it's created if it doesn't exist
+        :param key_column: column which identifies the order
+        """
+        self.db_path = str(db_path)
+        self.key_column = key_column
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        # timeout - store can be used by several session workers at once
+        self._connection = sqlite3.connect(self.db_path, timeout=30)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        # the table is created (or migrated) by one of the workers which open the store at once
+        self._connection.execute("BEGIN IMMEDIATE")
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS decisions (
+                order_key TEXT PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                selected INTEGER NOT NULL,
+                reason TEXT,
+                decided_at REAL NOT NULL,
+                last_seen REAL NOT NULL
+            )
+            """
+        )
+        # values of orders were kept by older versions
+        columns = [column[1] for column in self._connection.execute("PRAGMA table_info(decisions)")]
+        if "row_data" in columns:
+            self._connection.execute("ALTER TABLE decisions DROP COLUMN row_data")
+        # reasons weren't kept by older versions - they are NULL, so the decisions are made again
+        if "reason" not in columns:
+            self._connection.execute("ALTER TABLE decisions ADD COLUMN reason TEXT")
+        self._connection.commit()
+
+    @staticmethod
+    def fingerprint(values):
+        """
+        :param values: input values of the decision (in the same order every time)
+        :return: hash of the values
+        """
+        return hashlib.sha1("\x1f".join(map(str, values)).encode("utf-8")).hexdigest()
+
+    def lookup(self, keys):
+        """
+        :param keys: list of order keys
+        :return: {key: (fingerprint, selected, reason)} dictionary of orders which are in the store, reason is None if
+        it isn't known
+        """
+        keys = list(dict.fromkeys(keys))
+        decisions = dict()
+        for start in range(0, len(keys), _CHUNK_SIZE):
+            chunk = keys[start:start + _CHUNK_SIZE]
+            rows = self._connection.execute(
+                f"SELECT order_key, fingerprint, selected, reason FROM decisions "
+                f"WHERE order_key IN ({','.join('?' * len(chunk))})",
+                chunk,
+            )
+            for key, fingerprint, selected, reason in rows:
+                decisions[key] = (fingerprint, bool(selected), reason)
+        return decisions
+
+    def record(self, decisions, seen_at=None):
+        """
+        Saves decisions. If the fingerprint of the order didn't change, only the time it was seen is updated.
+        :param decisions: list of (key, fingerprint, selected, reason) tuples, reason is an empty string for selected
+        orders and for logic which doesn't give reasons
+        :param seen_at: time of the decision (time.time()), now by default
+        :return:
+        """
+        seen_at = seen_at or time.time()
+        with self._connection:
+            self._connection.executemany(
+                """
+                INSERT INTO decisions (order_key, fingerprint, selected, reason, decided_at, last_seen)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(order_key) DO UPDATE SET
+                    decided_at = CASE WHEN decisions.fingerprint = excluded.fingerprint
+                                      THEN decisions.decided_at ELSE excluded.decided_at END,
+                    fingerprint = excluded.fingerprint,
+                    selected = excluded.selected,
+                    reason = excluded.reason,
+                    last_seen = excluded.last_seen
+                """,
+                [
+                    (key, fingerprint, int(selected), reason, seen_at, seen_at)
+                    for key, fingerprint, selected, reason in decisions
+                ],
+            )
+
+    def decided_since(self, since):
+        """
+        :param since: time.time() value, usually start of the run
+        :return: set of keys of orders which were decided (new or with changed inputs) after given time
+        """
+        rows = self._connection.execute("SELECT order_key FROM decisions WHERE decided_at >= ?", (since,))
+        return {key for (key,) in rows}
+
+    def compact(self, seen_since):
+        """
+        Removes orders which no longer appear (weren't seen since given time).
+        :param seen_since: time.time() value, usually start of the run
+        :return: number of removed orders
+        """
+        with self._connection:
+            cursor = self._connection.execute("DELETE FROM decisions WHERE last_seen < ?", (seen_since,))
+        return cursor.rowcount
+
+    def close(self):
+        self._connection.close()
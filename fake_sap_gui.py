@@ -0,0 +1,695 @@
+"""
+In-process stand-in for the SAP GUI scripting object model (application -> connections -> sessions -> findById).
+
+It behaves like the COM objects returned by win32com: member names are case-insensitive, every property access
+and method call is counted as one COM call and can be delayed by a configurable latency. Only the screens used by
+the COHV conversion are modelled (variant selection, ALV grid, mass processing, multiple selection dialog,
+status bar and pop-ups), other element IDs are created on first access.
+
+Use it with sap_connection.use_fake_sap_gui(FakeSapGui(...)) or by setting SAP_GUI_BACKEND=fake.
+"""
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter
+
+COHV_COLUMNS = [
+    "AUFNR",
+    "KDAUF_AUFK",
+    "KDPOS_AUFK",
+    "MATNR",
+    "MATXT",
+    "GAMNG",
+    "GSTRS",
+    "LABST",
+    "FEVOR",
+]
+
+# Pretty names of COM members used in call statistics
+COM_NAMES = {
+    "findbyid": "findById",
+    "getcellvalue": "GetCellValue",
+    "modifycell": "modifyCell",
+    "press": "press",
+    "sendvkey": "sendVKey",
+    "select": "select",
+    "setfocus": "setFocus",
+    "text": "text",
+    "key": "key",
+    "selected": "selected",
+    "caretposition": "caretPosition",
+    "rowcount": "RowCount",
+    "visiblerowcount": "VisibleRowCount",
+    "firstvisiblerow": "firstVisibleRow",
+    "selectedrows": "selectedRows",
+    "children": "Children",
+    "count": "Count",
+    "item": "Item",
+    "info": "Info",
+    "transaction": "Transaction",
+    "createsession": "createSession",
+    "getscriptingengine": "GetScriptingEngine",
+}
+
+WINDOW_PATTERN = re.compile(r"^wnd\[(\d+)\]")
+SESSION_PREFIX_PATTERN = re.compile(r"^/?app/con\[\d+\]/ses\[\d+\]/")
+
+
+class FakeComError(Exception):
+    """Raised where SAP GUI raises com_error (e.g. element not found)."""
+
+
+class FakeComObject:
+    """
+    Base class of all fake COM objects. COM members are implemented as:
+    _com_<name> (method), _get_<name> / _set_<name> (computed property) or plain values in self._props.
+    """
+
+    def __init__(self, gui, props=None):
+        object.__setattr__(self, "_gui", gui)
+        object.__setattr__(self, "_props", {key.lower(): value for key, value in (props or {}).items()})
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        key = name.lower()
+        method = getattr(type(self), "_com_" + key, None)
+        if method is not None:
+            def call(*args):
+                self._gui.hit(key)
+                return method(self, *args)
+            return call
+
+        getter = getattr(type(self), "_get_" + key, None)
+        if getter is not None:
+            self._gui.hit(key)
+            return getter(self)
+
+        if key in self._props:
+            self._gui.hit(key)
+            return self._props[key]
+
+        raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        if name.startswith("_"):
+            object.__setattr__(self, name, value)
+            return
+        key = name.lower()
+        self._gui.hit(key)
+        setter = getattr(type(self), "_set_" + key, None)
+        if setter is not None:
+            setter(self, value)
+        else:
+            self._props[key] = value
+
+
+class FakeCollection(FakeComObject):
+    """GuiComponentCollection - callable by index, has Count and can be iterated."""
+
+    def __init__(self, gui, items):
+        super().__init__(gui)
+        self._items = list(items)
+
+    def __call__(self, idx):
+        self._gui.hit("item")
+        return self._items[idx]
+
+    def __iter__(self):
+        return iter(list(self._items))
+
+    def __len__(self):
+        self._gui.hit("count")
+        return len(self._items)
+
+    def _get_count(self):
+        return len(self._items)
+
+    def _com_elementat(self, idx):
+        return self._items[idx]
+
+
+class FakeElement(FakeComObject):
+    """Generic screen element (text field, button, menu, window, container...)."""
+
+    def __init__(self, session, element_id, props=None):
+        defaults = {"text": "", "key": "", "selected": False, "caretPosition": 0, "changeable": True}
+        defaults.update(props or {})
+        super().__init__(session._gui, defaults)
+        self._session = session
+        self._element_id = element_id
+
+    def _get_id(self):
+        return f"{self._session._id_prefix}{self._element_id}"
+
+    def _get_name(self):
+        return self._element_id.rsplit("/", 1)[-1]
+
+    def _get_type(self):
+        return type(self).__name__.replace("Fake", "Gui")
+
+    def _get_children(self):
+        return FakeCollection(self._gui, self._session._children_of(self._element_id))
+
+    def _get_verticalscrollbar(self):
+        return self._session._element(self._element_id + "/verticalScrollbar", FakeScrollbar)
+
+    def _com_press(self):
+        self._session._on_press(self._element_id)
+
+    def _com_select(self):
+        self._session._on_select(self._element_id)
+
+    def _com_sendvkey(self, vkey):
+        self._session._on_vkey(self._element_id, vkey)
+
+    def _com_setfocus(self):
+        pass
+
+    def _com_maximize(self):
+        pass
+
+    def _com_getabsoluterow(self, idx):
+        return self._session._element(f"{self._element_id}/row[{idx}]")
+
+
+class FakeScrollbar(FakeElement):
+
+    def __init__(self, session, element_id, props=None):
+        super().__init__(session, element_id, {"position": 0, "minimum": 0, "maximum": 0, "pageSize": 1})
+
+    def _set_position(self, value):
+        self._session._on_scroll(self._element_id.rsplit("/", 1)[0])
+        self._props["position"] = int(value)
+
+
+class FakeStatusBar(FakeElement):
+
+    def __init__(self, session, element_id, props=None):
+        super().__init__(session, element_id, {"MessageType": ""})
+
+
+class FakeGrid(FakeElement):
+    """ALV grid (GuiGridView) over columnar data {COL_NAME: [values]}."""
+
+    def __init__(self, session, element_id, data=None, visible_rows=30):
+        super().__init__(session, element_id)
+        self._data = {col: [str(value) for value in values] for col, values in (data or {}).items()}
+        self._row_count = len(next(iter(self._data.values()), []))
+        self._visible_rows = visible_rows
+        self._first_visible_row = 0
+        self._selected_rows = ""
+
+    def _get_rowcount(self):
+        return self._row_count
+
+    def _get_visiblerowcount(self):
+        return self._visible_rows
+
+    def _get_firstvisiblerow(self):
+        return self._first_visible_row
+
+    def _set_firstvisiblerow(self, value):
+        self._first_visible_row = max(0, min(int(value), max(self._row_count - 1, 0)))
+
+    def _get_selectedrows(self):
+        return self._selected_rows
+
+    def _set_selectedrows(self, value):
+        self._selected_rows = str(value)
+
+    def _get_columncount(self):
+        return len(self._data)
+
+    def _get_columnorder(self):
+        return FakeCollection(self._gui, list(self._data.keys()))
+
+    def _check_cell(self, row, column):
+        if column not in self._data or not 0 <= row < self._row_count:
+            raise FakeComError(f"Invalid cell ({row}, {column})")
+
+    def _com_getcellvalue(self, row, column):
+        self._check_cell(row, column)
+        return self._data[column][row]
+
+    def _com_modifycell(self, row, column, value):
+        self._check_cell(row, column)
+        self._data[column][row] = str(value)
+
+    def _com_setcurrentcell(self, row, column):
+        pass
+
+    def _com_selectall(self):
+        self._selected_rows = ",".join(map(str, range(self._row_count)))
+
+    def _com_presstoolbarbutton(self, button_id):
+        pass
+
+    def _com_presstoolbarcontextbutton(self, button_id):
+        pass
+
+    def _com_selectcontextmenuitem(self, item_id):
+        self._session._open_popup("export")
+
+    def selected_row_indices(self):
+        """Row indices currently selected in the grid (helper for tests/benchmarks, not a COM member)."""
+        return [int(row) for row in self._selected_rows.split(",") if row != ""]
+
+    def rows(self, indices):
+        """Values of given rows as {COL_NAME: [values]} (helper, not a COM member)."""
+        return {col: [values[idx] for idx in indices] for col, values in self._data.items()}
+
+
+class FakeInfo(FakeComObject):
+
+    def __init__(self, session):
+        super().__init__(session._gui)
+        self._session = session
+
+    def _get_transaction(self):
+        return self._session._transaction
+
+    def _get_screennumber(self):
+        return self._session._screen_number
+
+    def _get_program(self):
+        return self._session._program
+
+    def _get_sessionnumber(self):
+        return self._session._session_number
+
+    def _get_systemname(self):
+        return "FAK"
+
+
+class FakeSession(FakeComObject):
+    """GuiSession with a minimal state machine of the screens used by the COHV conversion."""
+
+    GRID_ID = "wnd[0]/usr/cntlCUSTOM/shellcont/shell/shellcont/shell"
+    TEXT_EXPORT_FORMAT_KEY = "33"
+    TEXT_EXPORT_FORMAT_ID = "wnd[1]/usr/subSUBSCREEN_STEPLOOP:SAPLSPO5:0150/sub:SAPLSPO5:0150/radSPOPLI-SELFLAG[0,0]"
+    MULTIPLE_SELECTION_TABLE_ID = "wnd[1]/usr/tabsTAB_STRIP/tabpSIVA/ssubSCREEN_HEADER:SAPLALDB:3010/tblSAPLALDBSINGLE"
+
+    def __init__(self, connection, session_number):
+        super().__init__(connection._gui)
+        self._connection = connection
+        self._session_number = session_number
+        self._transaction = "SESSION_MANAGER"
+        self._screen_number = 0
+        self._program = "SAPLSMTR_NAVIGATION"
+        self._popup = None
+        self._variant = None
+        self._elements = {}
+        self._selection_values = []
+        self._clipboard_upload = []
+        self._busy = False
+
+    @property
+    def _id_prefix(self):
+        return f"/app/con[{self._connection._connection_number}]/ses[{self._session_number}]/"
+
+    # COM members
+    def _get_info(self):
+        return FakeInfo(self)
+
+    def _get_busy(self):
+        return self._busy
+
+    def _get_id(self):
+        return self._id_prefix.rstrip("/")
+
+    def _get_children(self):
+        windows = [self._element("wnd[0]")]
+        if self._popup:
+            windows.append(self._element("wnd[1]"))
+        return FakeCollection(self._gui, windows)
+
+    def _get_activewindow(self):
+        return self._element("wnd[1]" if self._popup else "wnd[0]")
+
+    def _com_findbyid(self, element_id, raise_error=True):
+        element_id = SESSION_PREFIX_PATTERN.sub("", element_id)
+        window = WINDOW_PATTERN.match(element_id)
+        if window and int(window.group(1)) > 0 and not self._popup:
+            if raise_error:
+                raise FakeComError(f"The control could not be found by id: {element_id}")
+            return None
+        if element_id == self.GRID_ID:
+            if self._grid_data() is None:
+                if raise_error:
+                    raise FakeComError(f"The control could not be found by id: {element_id}")
+                return None
+            return self._elements[element_id]
+        if element_id.endswith("/sbar"):
+            return self._element(element_id, FakeStatusBar)
+        return self._element(element_id)
+
+    def _com_createsession(self):
+        self._connection._add_session()
+
+    def _com_starttransaction(self, transaction):
+        self._start_transaction(transaction)
+
+    def _com_endtransaction(self):
+        self._start_transaction("SESSION_MANAGER")
+
+    # Internal state machine
+    def _element(self, element_id, cls=FakeElement):
+        element = self._elements.get(element_id)
+        if element is None:
+            element = cls(self, element_id)
+            self._elements[element_id] = element
+        return element
+
+    def _children_of(self, element_id):
+        prefix = element_id + "/"
+        return [
+            element for child_id, element in self._elements.items()
+            if child_id.startswith(prefix) and "/" not in child_id[len(prefix):]
+            and not child_id.endswith("/verticalScrollbar")
+        ]
+
+    def _grid_data(self):
+        grid = self._elements.get(self.GRID_ID)
+        return grid if isinstance(grid, FakeGrid) else None
+
+    def _open_popup(self, kind):
+        self._popup = kind
+
+    def _close_popup(self):
+        self._popup = None
+        for element_id in [element_id for element_id in self._elements if element_id.startswith("wnd[1]")]:
+            del self._elements[element_id]
+
+    def _set_status(self, text, message_type="S"):
+        status_bar = self._element("wnd[0]/sbar", FakeStatusBar)
+        status_bar._props["text"] = text
+        status_bar._props["messagetype"] = message_type
+
+    def _start_transaction(self, transaction):
+        self._gui.server_wait()
+        self._transaction = transaction.upper() if transaction else "SESSION_MANAGER"
+        self._screen_number = 1000
+        self._program = f"SAPL{self._transaction}"
+        self._popup = None
+        self._variant = None
+        self._selection_values = []
+        self._clipboard_upload = []
+        self._elements = {}
+        if self._transaction == "EX":
+            self._transaction = "SESSION_MANAGER"
+
+    def _execute(self):
+        """F8 on the selection screen - loads the list for the current variant (or entered order numbers)."""
+        self._gui.server_wait()
+        data = self._gui.dataset_for(self._variant, self._selection_values)
+        row_count = len(next(iter(data.values()), [])) if data else 0
+        if row_count == 0:
+            self._open_popup("info")
+            self._set_status("No objects were selected", "I")
+            return
+        self._screen_number = 120
+        self._elements[self.GRID_ID] = FakeGrid(self, self.GRID_ID, data, self._gui.visible_rows)
+
+    def _mass_processing(self):
+        grid = self._grid_data()
+        selected = grid.selected_row_indices() if grid else []
+        self._gui.server_wait(len(selected))
+        self._gui.processed.append((self._variant, grid.rows(selected) if grid else {}))
+        self._set_status(f"{len(selected)} orders were processed")
+
+    def _on_press(self, element_id):
+        if element_id.endswith("VALU_PUSH"):
+            self._open_popup("multiple_selection")
+            self._element(self.MULTIPLE_SELECTION_TABLE_ID)._props["visiblerowcount"] = 8
+            return
+        if element_id == "wnd[0]/tbar[1]/btn[43]":
+            self._open_popup("export")
+            return
+        if not element_id.startswith("wnd[1]"):
+            return
+
+        popup = self._popup
+        if element_id == "wnd[1]/tbar[0]/btn[8]":
+            if popup == "variant":
+                self._variant = self._element("wnd[1]/usr/txtV-LOW")._props["text"]
+            elif popup == "multiple_selection":
+                self._on_scroll(self.MULTIPLE_SELECTION_TABLE_ID)
+                self._selection_values += self._clipboard_upload
+                self._clipboard_upload = []
+            elif popup == "mass_processing":
+                self._close_popup()
+                self._mass_processing()
+                return
+            self._close_popup()
+        elif element_id == "wnd[1]/tbar[0]/btn[24]" and popup == "multiple_selection":
+            self._clipboard_upload += self._gui.read_clipboard()
+        elif element_id == "wnd[1]/tbar[0]/btn[16]" and popup == "multiple_selection":
+            self._clipboard_upload = []
+        elif element_id == "wnd[1]/tbar[0]/btn[0]" and popup == "info":
+            self._close_popup()
+        elif element_id == "wnd[1]/tbar[0]/btn[11]" and popup == "export":
+            self._write_export()
+            self._close_popup()
+        elif element_id in ("wnd[1]/tbar[0]/btn[11]", "wnd[1]/tbar[0]/btn[7]") or "btnSPOP-" in element_id:
+            self._close_popup()
+
+    def _write_export(self):
+        """
+        Saves ALV grid as 'Text with Tabs' (UTF-16) file - header with column titles and one line per row. Other
+        formats are saved as a spreadsheet (zip file).
+        """
+        grid = self._grid_data()
+        directory = self._element("wnd[1]/usr/ctxtDY_PATH")._props.get("text", "")
+        file_name = self._element("wnd[1]/usr/ctxtDY_FILENAME")._props.get("text", "")
+        if grid is None or not file_name:
+            return
+        self._gui.server_wait()
+        format_key = self._element("wnd[1]/usr/cmbG_LISTBOX")._props.get("key")
+        text_format = self._element(self.TEXT_EXPORT_FORMAT_ID)._props.get("selected", False)
+        if format_key != self.TEXT_EXPORT_FORMAT_KEY or not text_format:
+            with open(os.path.join(directory, file_name), "wb") as f:
+                f.write(b"PK\x03\x04" + bytes(64))
+            return
+        columns = list(grid._data.keys())
+        lines = ["\t".join(col.title() for col in columns)]
+        lines += ["\t".join(str(grid._data[col][row]) for col in columns) for row in range(grid._row_count)]
+        with open(os.path.join(directory, file_name), "w", encoding="utf-16", newline="") as f:
+            f.write("\r\n".join(lines) + "\r\n")
+
+    def _on_scroll(self, table_id):
+        """Entries typed into the multiple selection dialog are taken over when the table is scrolled."""
+        if table_id != self.MULTIPLE_SELECTION_TABLE_ID:
+            return
+        for element_id, element in list(self._elements.items()):
+            if element_id.startswith(table_id + "/ctxt") and element._props.get("text"):
+                self._selection_values.append(element._props["text"])
+                element._props["text"] = ""
+
+    def _on_select(self, element_id):
+        if "/radSPOPLI-SELFLAG[" in element_id:
+            self._element(element_id)._props["selected"] = True
+        elif element_id == "wnd[0]/mbar/menu[4]/menu[1]":
+            self._open_popup("mass_processing")
+        elif "/mbar/" in element_id:
+            self._open_popup("menu")
+
+    def _on_vkey(self, element_id, vkey):
+        if element_id == "wnd[0]":
+            if vkey == 0:
+                okcd = self._element("wnd[0]/tbar[0]/okcd")
+                command = okcd._props["text"]
+                okcd._props["text"] = ""
+                if command.lower().startswith("/n"):
+                    self._start_transaction(command[2:])
+            elif vkey == 17:
+                self._open_popup("variant")
+            elif vkey == 4:
+                self._open_popup("f4_help")
+            elif vkey == 8:
+                self._execute()
+        elif element_id == "wnd[1]" and vkey in (0, 2, 12):
+            self._close_popup()
+
+
+class FakeConnection(FakeComObject):
+
+    def __init__(self, gui, connection_number, num_of_sessions=1):
+        super().__init__(gui)
+        self._connection_number = connection_number
+        self._sessions = []
+        for _ in range(num_of_sessions):
+            self._add_session()
+
+    def _add_session(self):
+        if len(self._sessions) >= 6:
+            raise FakeComError("Maximum number of sessions reached")
+        session = FakeSession(self, len(self._sessions))
+        self._sessions.append(session)
+        return session
+
+    def _get_children(self):
+        return FakeCollection(self._gui, self._sessions)
+
+    def _get_sessions(self):
+        return FakeCollection(self._gui, self._sessions)
+
+    def _com_closesession(self, session_id):
+        self._sessions = [session for session in self._sessions if session._get_id() != session_id]
+
+
+class FakeApplication(FakeComObject):
+
+    def __init__(self, gui, num_of_sessions=1):
+        super().__init__(gui)
+        self._connections = [FakeConnection(gui, 0, num_of_sessions)]
+
+    def _get_children(self):
+        return FakeCollection(self._gui, self._connections)
+
+    def _get_connections(self):
+        return FakeCollection(self._gui, self._connections)
+
+    def _com_openconnection(self, description, sync=True):
+        connection = FakeConnection(self._gui, len(self._connections))
+        self._connections.append(connection)
+        return connection
+
+
+class FakeSapGui(FakeComObject):
+    """
+    Object returned by GetObject("SAPGUI"). Holds the configuration and call statistics of the whole fake.
+    :param datasets: {variant_name: {COL_NAME: [values]}} data returned by F8 for the given variant
+    :param latency: seconds added to every COM call
+    :param server_latency: seconds added to every server round trip (transaction start, F8, mass processing)
+    :param visible_rows: number of rows visible in ALV grid
+    :param num_of_sessions: number of sessions opened at the start
+    """
+
+    def __init__(self, datasets=None, latency=0.0, server_latency=0.0, visible_rows=30, num_of_sessions=1):
+        object.__setattr__(self, "_lock", threading.Lock())
+        object.__setattr__(self, "calls", Counter())
+        super().__init__(self)
+        self._datasets = dict(datasets or {})
+        self.__dict__["latency"] = latency
+        self.__dict__["server_latency"] = server_latency
+        self.__dict__["visible_rows"] = visible_rows
+        self.__dict__["processed"] = []
+        self._application = FakeApplication(self, num_of_sessions)
+
+    def __setattr__(self, name, value):
+        if name in ("latency", "server_latency", "visible_rows", "processed"):
+            self.__dict__[name] = value
+        else:
+            super().__setattr__(name, value)
+
+    def _get_getscriptingengine(self):
+        return self._application
+
+    def hit(self, member):
+        """Counts one COM call and waits for the configured latency."""
+        with self._lock:
+            self.calls[COM_NAMES.get(member, member)] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def server_wait(self, units=1):
+        if self.server_latency:
+            time.sleep(self.server_latency * max(units, 1))
+
+    def reset_calls(self):
+        with self._lock:
+            self.calls.clear()
+
+    def total_calls(self):
+        with self._lock:
+            return sum(self.calls.values())
+
+    def add_dataset(self, variant_name, data):
+        self._datasets[variant_name] = data
+
+    def dataset_for(self, variant_name, selection_values=None):
+        """Data for variant or - if order numbers were entered on selection screen - matching rows of all variants"""
+        if not selection_values:
+            return self._datasets.get(variant_name, {})
+
+        wanted = set(selection_values)
+        result = {col: [] for col in COHV_COLUMNS}
+        for data in self._datasets.values():
+            indices = [idx for idx, order in enumerate(data.get("AUFNR", [])) if order in wanted]
+            for col in result:
+                values = data.get(col, [])
+                result[col] += [values[idx] for idx in indices]
+        return result
+
+    @staticmethod
+    def read_clipboard():
+        import pyperclip
+        return [line for line in pyperclip.paste().splitlines() if line]
+
+    def session(self, num_of_window=0, connection=0):
+        """Direct access to a fake session (helper, not a COM member)."""
+        return self._application._connections[connection]._sessions[num_of_window]
+
+
+def make_cohv_dataset(num_rows, seed=None, with_total_row=True, first_order=10_000_000):
+    """
+    Generates synthetic COHV list in the same shape as the ALV grid: {COL_NAME: [values as strings]}
+    :param num_rows: number of planned orders
+    :param seed: random seed (the same seed gives the same data)
+    :param with_total_row: adds row with empty values (except GAMNG sum) at the bottom, as ALV does
+    :param first_order: number of the first planned order
+    :return: dictionary of columns
+    """
+    rnd = random.Random(seed)
+    data = {col: [] for col in COHV_COLUMNS}
+    total_gamng = 0
+    for idx in range(num_rows):
+        configurated = rnd.random() < 0.4
+        gamng = 1 if rnd.random() < 0.6 else rnd.randint(2, 20)
+        total_gamng += gamng
+        data["AUFNR"].append(str(first_order + idx))
+        data["KDAUF_AUFK"].append(str(rnd.randint(30_000_000, 39_999_999)) if rnd.random() < 0.7 else "")
+        data["KDPOS_AUFK"].append(str(rnd.choice([10, 20, 30, 40])) if data["KDAUF_AUFK"][-1] else "0")
+        data["MATNR"].append(
+            f"99{rnd.randint(1_000_000, 9_999_999)}" if configurated else str(rnd.randint(100_000, 999_999))
+        )
+        data["MATXT"].append(rnd.choice(["FENSTERGRIFF 9H", "BESCHLAG", "GETRIEBE 9H WS", "SCHERE", "ECKUMLENKUNG"]))
+        data["GAMNG"].append(str(gamng))
+        data["GSTRS"].append(f"{rnd.randint(1, 28):02d}.{rnd.randint(1, 12):02d}.2025")
+        data["LABST"].append(str(0 if rnd.random() < 0.5 else rnd.randint(1, 500)))
+        data["FEVOR"].append(rnd.choice(["CSR", "", "A01", "A02", "B10"]))
+
+    if with_total_row and num_rows:
+        for col in COHV_COLUMNS:
+            data[col].append("")
+        data["GAMNG"][-1] = str(total_gamng)
+
+    return data
+
+
+_DEFAULT_GUI = None
+
+
+def get_default_fake_gui():
+    """
+    Fake SAP GUI configured from environment (used when SAP_GUI_BACKEND=fake, e.g. in child processes):
+    FAKE_SAP_ROWS (rows per variant, default 1000), FAKE_SAP_VARIANTS (comma separated names),
+    FAKE_SAP_LATENCY (seconds per COM call), FAKE_SAP_SESSIONS (sessions opened at start, default 1)
+    """
+    global _DEFAULT_GUI
+    if _DEFAULT_GUI is None:
+        num_rows = int(os.environ.get("FAKE_SAP_ROWS", "1000"))
+        variants = [name for name in os.environ.get("FAKE_SAP_VARIANTS", "").split(",") if name]
+        datasets = {
+            variant: make_cohv_dataset(num_rows, seed=idx, first_order=10_000_000 + idx * 1_000_000)
+            for idx, variant in enumerate(variants)
+        }
+        _DEFAULT_GUI = FakeSapGui(
+            datasets,
+            latency=float(os.environ.get("FAKE_SAP_LATENCY", "0")),
+            num_of_sessions=int(os.environ.get("FAKE_SAP_SESSIONS", "1")),
+        )
+    return _DEFAULT_GUI
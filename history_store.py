@@ -0,0 +1,154 @@
+"""
+History of COHV conversion results stored as Parquet files partitioned by kind, date and variant:
+
+    <root>/<kind>/date=YYYY-MM-DD/variant=<variant>/data.parquet
+
+kind is "selected" (converted orders) or "skipped". Queries read only needed columns and partitions.
+
+Excel rendering on demand:
+    python history_store.py excel --root <root> --kind skipped --date 2025-01-31 --output skipped.xlsx
+"""
+import argparse
+import os
+import shutil
+from datetime import date, datetime
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+KINDS = ("selected", "skipped")
+_PARTITIONING = ds.partitioning(pa.schema([("date", pa.string()), ("variant", pa.string())]), flavor="hive")
+
+
+def _date_str(day):
+    if isinstance(day, (date, datetime)):
+        return day.strftime("%Y-%m-%d")
+    return str(day)
+
+
+def partition_path(root, kind, day, variant):
+    return os.path.join(str(root), kind, f"date={_date_str(day)}", f"variant={variant}")
+
+
+def write_results(root, day, frames, variants=None):
+    """
+    Writes results of one run. Partitions of the same day and variant are overwritten (run can be repeated).
+    :param root: root directory of the history
+    :param day: date of the run (date or 'YYYY-MM-DD')
+    :param frames: {kind: DataFrame} dictionary, DataFrames have to contain VARIANT column
+    (see ResultsCollector.frame(kind, with_variant=True))
+    :param variants: all variants of the run - partitions of the day of variants without rows of the kind are
+    removed (e.g. orders of a repeated run were converted in the meantime); variants in frames by default
+    :return:
+    """
+    for kind, df in frames.items():
+        variants_with_rows = set()
+        for variant, variant_df in df.groupby("VARIANT", sort=False):
+            variants_with_rows.add(variant)
+            directory = partition_path(root, kind, day, variant)
+            os.makedirs(directory, exist_ok=True)
+            table = pa.Table.from_pandas(variant_df.drop(columns="VARIANT"), preserve_index=False)
+
+            # written to temporary file first, so readers never see incomplete file
+            tmp_path = os.path.join(directory, "data.parquet.tmp")
+            pq.write_table(table, tmp_path)
+            os.replace(tmp_path, os.path.join(directory, "data.parquet"))
+
+        for variant in set(variants or []) - variants_with_rows:
+            directory = partition_path(root, kind, day, variant)
+            if os.path.isdir(directory):
+                shutil.rmtree(directory)
+
+
+def read_history(root, kind, columns=None, start_date=None, end_date=None, variants=None, filter_expression=None):
+    """
+    Reads history of given kind. Only needed columns and partitions are read.
+    :param root: root directory of the history
+    :param kind: "selected" or "skipped"
+    :param columns: list of columns, partition columns 'date' and 'variant' can be used as well; all by default
+    :param start_date: first date (including), date or 'YYYY-MM-DD'
+    :param end_date: last date (including)
+    :param variants: list of variants
+    :param filter_expression: additional pyarrow.dataset expression, e.g. ds.field("AUFNR") == "12345678"
+    :return: DataFrame
+    """
+    directory = os.path.join(str(root), kind)
+    if not os.path.isdir(directory):
+        return pd.DataFrame(columns=columns)
+
+    dataset = ds.dataset(directory, format="parquet", partitioning=_PARTITIONING)
+    expression = filter_expression
+    conditions = []
+    if start_date is not None:
+        conditions.append(ds.field("date") >= _date_str(start_date))
+    if end_date is not None:
+        conditions.append(ds.field("date") <= _date_str(end_date))
+    if variants is not None:
+        conditions.append(ds.field("variant").isin(list(variants)))
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+
+    return dataset.to_table(columns=columns, filter=expression).to_pandas()
+
+
+def order_skip_count(root, order_number, start_date=None, end_date=None):
+    """
+    :param order_number: planned order (AUFNR)
+    :return: number of days on which the order was skipped
+    """
+    df = read_history(
+        root, "skipped", columns=["date"], start_date=start_date, end_date=end_date,
+        filter_expression=ds.field("AUFNR") == str(order_number),
+    )
+    return df["date"].nunique()
+
+
+def converted_gamng_per_day(root, start_date=None, end_date=None):
+    """
+    :return: Series with total quantity (GAMNG) of converted orders per day
+    """
+    df = read_history(root, "selected", columns=["date", "GAMNG"], start_date=start_date, end_date=end_date)
+    gamng = pd.to_numeric(df["GAMNG"], errors="coerce").fillna(0)
+    return gamng.groupby(df["date"]).sum().astype(int).sort_index()
+
+
+def render_excel(root, kind, day, output_path):
+    """
+    Saves results of one day to Excel file (the same format as the former daily files, with VARIANT column).
+    :return: number of rows
+    """
+    df = read_history(root, kind, start_date=day, end_date=day)
+    df = df.drop(columns="date").rename(columns={"variant": "VARIANT"})
+    df.to_excel(output_path)
+    return df.shape[0]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="History of COHV conversion results")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    excel_parser = subparsers.add_parser("excel", help="save results of one day to Excel file")
+    excel_parser.add_argument("--root", required=True)
+    excel_parser.add_argument("--kind", choices=KINDS, default="skipped")
+    excel_parser.add_argument("--date", default=date.today().strftime("%Y-%m-%d"), help="YYYY-MM-DD")
+    excel_parser.add_argument("--output", required=True)
+
+    skipped_parser = subparsers.add_parser("skipped", help="how often was the order skipped")
+    skipped_parser.add_argument("--root", required=True)
+    skipped_parser.add_argument("order")
+
+    gamng_parser = subparsers.add_parser("gamng", help="converted quantity per day")
+    gamng_parser.add_argument("--root", required=True)
+    gamng_parser.add_argument("--start", default=None)
+    gamng_parser.add_argument("--end", default=None)
+
+    args = parser.parse_args()
+    if args.command == "excel":
+        num_of_rows = render_excel(args.root, args.kind, args.date, args.output)
+        print(f"{num_of_rows} rows saved to {args.output}")
+    elif args.command == "skipped":
+        print(f"Order {args.order} was skipped on {order_skip_count(args.root, args.order)} days.")
+    else:
+        print(converted_gamng_per_day(args.root, args.start, args.end).to_string())
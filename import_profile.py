@@ -0,0 +1,96 @@
+"""
+Start-up profile of the program - import time of every module and time from spawning a worker process to its first
+SAP GUI call:
+    python import_profile.py COHV_MASS_CONVERSION --top 20
+    python import_profile.py COHV_MASS_CONVERSION --spawn
+With --spawn the fake SAP GUI is used (SAP_GUI_BACKEND=fake), so it can be run without SAP.
+"""
+import argparse
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+
+
+def import_times(module_name):
+    """
+    Imports the module in a new interpreter with -X importtime.
+    :param module_name: name of the module, e.g. 'COHV_MASS_CONVERSION'
+    :return: list of (module, self_ms, cumulative_ms, level) tuples in order of import
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module_name}"],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1])
+
+    times = []
+    for line in completed.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        level = (len(name) - len(name.lstrip())) // 2
+        times.append((name.strip(), int(self_us) / 1000, int(cumulative_us) / 1000, level))
+    return times
+
+
+def print_import_profile(module_name, top=20):
+    times = import_times(module_name)
+    total_ms = next((cumulative for name, _, cumulative, _ in times if name == module_name), 0.0)
+    print(f"import {module_name}: {total_ms:.0f} ms, {len(times)} modules")
+
+    # only top level packages (e.g. 'pandas', not 'pandas.core.frame')
+    packages = [item for item in times if "." not in item[0]]
+    print(f"{'module':<30}{'cumulative ms':>15}{'self ms':>10}")
+    for name, self_ms, cumulative_ms, _ in sorted(packages, key=lambda item: item[2], reverse=True)[:top]:
+        print(f"{name:<30}{cumulative_ms:>15.1f}{self_ms:>10.1f}")
+
+
+def first_sap_call(module_name, spawned_at, result_queue):
+    """
+    Target of the spawned process - imports the module as a worker would and makes the first SAP GUI call.
+    """
+    imported_at = time.time()
+    __import__(module_name)
+    import sap_connection
+
+    ready_at = time.time()
+    sap_connection.get_client(0)
+    result_queue.put({
+        "start_s": imported_at - spawned_at,
+        "import_s": ready_at - imported_at,
+        "first_call_s": time.time() - spawned_at,
+    })
+
+
+def spawn_profile(module_name, repeat=3):
+    """
+    :return: list of {"start_s", "import_s", "first_call_s"} dictionaries, one per spawned process
+    """
+    os.environ.setdefault("SAP_GUI_BACKEND", "fake")
+    context = multiprocessing.get_context("spawn")
+    result_queue = context.Queue()
+    results = []
+    for _ in range(repeat):
+        process = context.Process(target=first_sap_call, args=(module_name, time.time(), result_queue))
+        process.start()
+        results.append(result_queue.get())
+        process.join()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Start-up profile of the program")
+    parser.add_argument("module", nargs="?", default="COHV_MASS_CONVERSION")
+    parser.add_argument("--top", type=int, default=20, help="number of modules to be shown")
+    parser.add_argument("--spawn", action="store_true", help="measure spawn of a worker process to first SAP call")
+    args = parser.parse_args()
+
+    print_import_profile(args.module, args.top)
+    if args.spawn:
+        for idx, result in enumerate(spawn_profile(args.module)):
+            print(f"spawn {idx}: interpreter start {result['start_s']:.2f} s, import {result['import_s']:.2f} s, "
+                  f"first SAP call after {result['first_call_s']:.2f} s")
@@ -0,0 +1,242 @@
+"""
+Instrumentation of a run - time of stages, number of SAP GUI calls and waits for SAP (see sap_waits). Events are kept
+in Chrome trace format (chrome://tracing or https://ui.perfetto.dev), every process (main and session workers) has its
+own TRACER and workers send their events to the main process (see session_pool.session_worker). Events and counts are
+kept per thread, so workers running as threads are measured separately as well.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime
+
+import sap_waits
+
+# Calls counted on instrumented SAP GUI objects
+COUNTED_METHODS = ("findById", "GetCellValue", "press", "sendVKey")
+_COUNTED_KEYS = {method.lower(): method for method in COUNTED_METHODS}
+# Values which are returned as they are (everything else is a SAP GUI object and is wrapped)
+_PLAIN_TYPES = (str, bytes, int, float, bool, type(None), date, datetime, tuple, list, dict)
+
+
+def _unwrap(value):
+    return value._target if isinstance(value, InstrumentedObject) else value
+
+
+class InstrumentedObject:
+    """
+    Proxy of SAP GUI object (session, element, collection...) which counts COUNTED_METHODS calls. Objects returned
+    by it (e.g. by findById) are instrumented as well.
+    """
+
+    __slots__ = ("_target", "_tracer")
+
+    def __init__(self, target, tracer):
+        object.__setattr__(self, "_target", target)
+        object.__setattr__(self, "_tracer", tracer)
+
+    def _wrap(self, value):
+        if isinstance(value, _PLAIN_TYPES):
+            return value
+        return InstrumentedObject(value, self._tracer)
+
+    def __getattr__(self, name):
+        value = getattr(self._target, name)
+        method = _COUNTED_KEYS.get(name.lower())
+        if method is None:
+            return self._wrap(value)
+
+        def counted_call(*args):
+            self._tracer.count(method)
+            return self._wrap(value(*map(_unwrap, args)))
+
+        return counted_call
+
+    def __setattr__(self, name, value):
+        setattr(self._target, name, _unwrap(value))
+
+    def __call__(self, *args):
+        return self._wrap(self._target(*map(_unwrap, args)))
+
+    def __iter__(self):
+        for item in self._target:
+            yield self._wrap(item)
+
+    def __len__(self):
+        return len(self._target)
+
+    def __bool__(self):
+        return bool(self._target)
+
+    def __repr__(self):
+        return f"InstrumentedObject({self._target!r})"
+
+
+class Tracer:
+    """
+    Collects spans of stages and counts of SAP GUI calls of one process (separately for every thread).
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def _state(self):
+        state = self._local
+        if not hasattr(state, "events"):
+            state.events = []
+            state.counts = dict.fromkeys(COUNTED_METHODS, 0)
+            state.reported_counts = dict.fromkeys(COUNTED_METHODS, 0)
+        return state
+
+    @property
+    def counts(self):
+        """
+        :return: {method: count} of SAP GUI calls made by the current thread
+        """
+        return self._state().counts
+
+    def wrap(self, session):
+        """
+        :param session: SAP session (or any SAP GUI object)
+        :return: instrumented session, calls made through it are counted
+        """
+        if isinstance(session, InstrumentedObject):
+            return session
+        return InstrumentedObject(session, self)
+
+    def count(self, method):
+        self._state().counts[method] += 1
+
+    def set_worker_name(self, name):
+        """
+        :param name: name of the current worker (thread) shown in the trace, e.g. 'session 3'
+        """
+        self._state().events.append({
+            "name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": threading.get_ident(), "args": {"name": name}
+        })
+
+    @contextmanager
+    def stage(self, name, **args):
+        """
+        Measures time and SAP GUI calls of a stage (stages can be nested).
+        :param name: name of the stage, e.g. 'load variant'
+        :param args: additional data shown in the trace, e.g. variant=...
+        """
+        state = self._state()
+        start_counts = dict(state.counts)
+        start_ts = time.time()
+        start_time = time.perf_counter()
+        error = None
+        try:
+            yield
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            duration = time.perf_counter() - start_time
+            event_args = dict(args)
+            event_args["calls"] = {method: state.counts[method] - start_counts[method] for method in COUNTED_METHODS}
+            if error is not None:
+                event_args["error"] = error
+            state.events.append({
+                "name": name,
+                "cat": "stage",
+                "ph": "X",
+                "ts": round(start_ts * 1e6),
+                "dur": round(duration * 1e6),
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": event_args,
+            })
+
+    def drain(self):
+        """
+        Takes all events of the current thread collected so far (SAP GUI calls made since the last drain are added as
+        a counter event, waits for SAP as an instant event with their summary).
+        :return: list of events
+        """
+        state = self._state()
+        waits = sap_waits.wait_summary(clear=True)
+        if waits:
+            state.events.append({
+                "name": "SAP waits",
+                "ph": "i",
+                "s": "t",
+                "ts": round(time.time() * 1e6),
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": waits,
+            })
+        new_counts = {method: state.counts[method] - state.reported_counts[method] for method in COUNTED_METHODS}
+        if any(new_counts.values()):
+            state.events.append({
+                "name": "SAP GUI calls",
+                "ph": "C",
+                "ts": round(time.time() * 1e6),
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": new_counts,
+            })
+            state.reported_counts = dict(state.counts)
+
+        events, state.events = state.events, []
+        return events
+
+
+def summarize(events):
+    """
+    :param events: list of trace events (of all processes)
+    :return: {"stages": {name: {"count", "total_s"}}, "calls": {method: count},
+    "waits": {label: {"count", "waited_s", "timeouts"}}} dictionary
+    """
+    stages = dict()
+    calls = dict.fromkeys(COUNTED_METHODS, 0)
+    waits = dict()
+    for event in events:
+        if event["ph"] == "X":
+            stage = stages.setdefault(event["name"], {"count": 0, "total_s": 0.0})
+            stage["count"] += 1
+            stage["total_s"] = round(stage["total_s"] + event["dur"] / 1e6, 3)
+        elif event["ph"] == "C":
+            for method, count in event["args"].items():
+                calls[method] = calls.get(method, 0) + count
+        elif event["ph"] == "i" and event["name"] == "SAP waits":
+            for label, item in event["args"].items():
+                wait = waits.setdefault(label, {"count": 0, "waited_s": 0.0, "timeouts": 0})
+                wait["count"] += item["count"]
+                wait["waited_s"] = round(wait["waited_s"] + item["waited_s"], 4)
+                wait["timeouts"] += item["timeouts"]
+    return {"stages": stages, "calls": calls, "waits": waits}
+
+
+def summary_line(events):
+    """
+    :return: one line summary for status file, e.g. 'load variant: 5x 12.1 s; ... | findById: 1200, ... | waits:
+    session busy: 40x 3.2 s, ...'
+    """
+    summary = summarize(events)
+    stages = "; ".join(
+        f"{name}: {stage['count']}x {stage['total_s']:.1f} s" for name, stage in summary["stages"].items()
+    )
+    calls = ", ".join(f"{method}: {count}" for method, count in summary["calls"].items())
+    # the longest waits only (labels can contain e.g. file names)
+    longest_waits = sorted(summary["waits"].items(), key=lambda item: item[1]["waited_s"], reverse=True)[:5]
+    waits = ", ".join(
+        f"{label}: {wait['count']}x {wait['waited_s']:.1f} s"
+        + (f" ({wait['timeouts']} timeouts)" if wait["timeouts"] else "")
+        for label, wait in longest_waits
+    )
+    return f"{stages} | {calls} | waits: {waits}"
+
+
+def write_chrome_trace(file_path, events):
+    """
+    Saves events as Chrome trace JSON file.
+    """
+    os.makedirs(os.path.dirname(str(file_path)) or ".", exist_ok=True)
+    with open(file_path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+TRACER = Tracer()
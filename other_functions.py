@@ -1,27 +1,44 @@
-import win32com.client
+try:
+    import win32com.client
+except ImportError:
+    # Excel automation is available only on Windows
+    win32com = None
 import pandas as pd
 import pyperclip
 import logging
+import json
+import os
 
 from openpyxl import load_workbook
 from openpyxl.styles import Border, Side, Alignment
 from datetime import datetime, timedelta
 import numpy as np
 
+from sap_waits import wait_until
 
-def close_excel_file(file_name):
-    # file_name = "mb52_table.xlsx"
+
+def close_excel_file(file_name, timeout=30.0):
+    """
+    Saves and closes workbook opened in Excel, e.g. file exported from SAP (Excel opens it a while after it's saved,
+    so it's waited until the workbook appears in Excel).
+    :param file_name: name of the file, e.g. "mb52_table.xlsx"
+    :param timeout: max number of seconds to wait for the workbook
+    """
     try:
         # Connect to the running Excel application
         excel = win32com.client.Dispatch("Excel.Application")
 
-        # Iterate through open workbooks
-        for workbook in excel.Workbooks:
-            if workbook.FullName.endswith(file_name):  # Match the file name
-                workbook.Save()  # Ensure the file is saved
-                workbook.Close()  # Close the workbook
-                print(f"{file_name} has been saved and closed.")
-                break
+        def find_workbook():
+            for workbook in excel.Workbooks:
+                if workbook.FullName.endswith(file_name):  # Match the file name
+                    return workbook
+            return None
+
+        if wait_until(lambda: find_workbook() is not None, timeout, label=f"workbook {file_name}"):
+            workbook = find_workbook()
+            workbook.Save()  # Ensure the file is saved
+            workbook.Close()  # Close the workbook
+            print(f"{file_name} has been saved and closed.")
         else:
             print(f"{file_name} not found in open Excel instances.")
 
@@ -143,14 +160,76 @@ def copy_row_format(ws, source_row, target_row):
             target_cell.alignment = new_alignment
 
 
-def append_status_to_excel(status_file, status_dict, error_path, sheet_name):
+def _status_index_path(status_file):
+    return f"{status_file}.index.json"
+
+
+def _read_status_index(status_file):
     """
-    Appends a new row to the "MRP_STOCKS" sheet in the given Excel file using the status_dict.
+    :return: {sheet_name: last used row} from sidecar index, or empty dict if the index doesn't match the file
+    (e.g. the file was changed by another tool)
+    """
+    try:
+        with open(_status_index_path(status_file), encoding="utf-8") as f:
+            index = json.load(f)
+        stat = os.stat(status_file)
+        if index.get("mtime_ns") == stat.st_mtime_ns and index.get("size") == stat.st_size:
+            return index.get("sheets", dict())
+    except (OSError, ValueError):
+        pass
+    return dict()
+
+
+def _write_status_index(status_file, sheets):
+    try:
+        stat = os.stat(status_file)
+        with open(_status_index_path(status_file), "w", encoding="utf-8") as f:
+            json.dump({"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "sheets": sheets}, f)
+    except OSError as e:
+        print(f"Status file index couldn't be saved: {e}")
+
+
+def _row_is_empty(ws, row, max_column):
+    return all(ws.cell(row=row, column=col).value in [None, ""] for col in range(1, max_column + 1))
+
+
+def find_first_empty_row(ws, last_used_row=None, num_rows=1):
+    """
+    :param ws: Worksheet object
+    :param last_used_row: last used row known from sidecar index (checked before it's used)
+    :param num_rows: number of rows to be written - all of them have to be empty
+    :return: first row below headers which starts num_rows empty rows
+    """
+    max_column = ws.max_column
+    if last_used_row and (last_used_row == 1 or not _row_is_empty(ws, last_used_row, max_column)) \
+            and all(_row_is_empty(ws, last_used_row + offset, max_column) for offset in range(1, num_rows + 1)):
+        return last_used_row + 1
+
+    # Find the first block of empty rows within the framed area
+    first_empty_row = None
+    for row, values in enumerate(ws.iter_rows(min_row=2, max_col=max_column, values_only=True), start=2):
+        if not all(value in [None, ""] for value in values):
+            first_empty_row = None
+        elif first_empty_row is None:
+            first_empty_row = row
+        if first_empty_row is not None and row - first_empty_row + 1 == num_rows:
+            return first_empty_row
+
+    # Rows below the framed area are empty
+    return first_empty_row or ws.max_row + 1
+
+
+def append_status_rows_to_excel(status_file, status_dicts, error_path, sheet_name, new_headers=()):
+    """
+    Writes several status rows to the given sheet of Excel status file with one save. The last used row of each
+    sheet is kept in sidecar index file (<status_file>.index.json), so the sheet doesn't have to be scanned.
+    Values are written only to columns with matching header - keys without a column are reported.
 
     :param sheet_name: sheet_name of excel status file
     :param error_path: path to error file
     :param status_file: str: Path to the Excel file
-    :param status_dict: dict: Dictionary containing status messages
+    :param status_dicts: list of dictionaries containing status messages, one row per dictionary
+    :param new_headers: headers which are added to the sheet (as last columns) if they are missing
     """
     logging.basicConfig(
         filename=error_path,
@@ -167,39 +246,43 @@ def append_status_to_excel(status_file, status_dict, error_path, sheet_name):
             return
 
         ws = wb[sheet_name]
+        index = _read_status_index(status_file)
 
         # Get headers from the first row
         headers = [ws.cell(row=1, column=col).value for col in range(1, ws.max_column + 1)]
-
-        # Find the first empty row within the framed area
-        first_empty_row = None
-        for row in range(2, ws.max_row + 1):  # Start from row 2 to skip headers
-            if all(ws.cell(row=row, column=col).value in [None, ""] for col in range(1, ws.max_column + 1)):
-                first_empty_row = row
-                break
-
-        # If no empty row is found, insert at the end
-        if first_empty_row is None:
-            first_empty_row = ws.max_row + 1
-
-        # Insert new data at the first empty row
-        ws.insert_rows(first_empty_row)
-
-        # Copy border formatting from the row above
-        if first_empty_row > 2:  # Ensure it's not the header row
-            copy_row_format(ws, first_empty_row - 1, first_empty_row)
-
-        # Add date/time in column A
-        ws.cell(row=first_empty_row, column=1, value=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
-
-        # Fill in values based on dictionary keys matching headers
-        for col, header in enumerate(headers[1:], start=2):  # Start from column 2 (B) as A is for timestamp
-            ws.cell(row=first_empty_row, column=col, value=str(status_dict.get(header, "")))
+        for header in new_headers:
+            if header not in headers:
+                headers.append(header)
+                ws.cell(row=1, column=len(headers), value=header)
+                print(f"Column {header} added to sheet '{sheet_name}'.")
+
+        missing_keys = sorted({key for status_dict in status_dicts for key in status_dict} - set(headers[1:]))
+        if missing_keys:
+            message = f"Sheet '{sheet_name}' has no column for {', '.join(missing_keys)} - values are not saved."
+            print(f"Warning: {message}")
+            logging.error(message)
+
+        row = find_first_empty_row(ws, index.get(sheet_name), len(status_dicts))
+        for status_dict in status_dicts:
+            # Copy border formatting from the row above
+            if row > 2:  # Ensure it's not the header row
+                copy_row_format(ws, row - 1, row)
+
+            # Add date/time in column A
+            ws.cell(row=row, column=1, value=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+
+            # Fill in values based on dictionary keys matching headers
+            for col, header in enumerate(headers[1:], start=2):  # Start from column 2 (B) as A is for timestamp
+                ws.cell(row=row, column=col, value=str(status_dict.get(header, "")))
+            row += 1
 
         # Append the row and save the file
         wb.save(status_file)
+        # last written row - if rows were written to a gap, rows below it are checked by the next call
+        index[sheet_name] = row - 1
+        _write_status_index(status_file, index)
 
-        print("Row added successfully to STATUS FILE!")
+        print(f"{len(status_dicts)} row(s) added successfully to STATUS FILE!")
 
     except Exception as e:
         logging.error("Error occurred", exc_info=True)
@@ -207,6 +290,19 @@ def append_status_to_excel(status_file, status_dict, error_path, sheet_name):
         print(f"Check {error_path} file for details")
 
 
+def append_status_to_excel(status_file, status_dict, error_path, sheet_name, new_headers=()):
+    """
+    Appends a new row to the "MRP_STOCKS" sheet in the given Excel file using the status_dict.
+
+    :param sheet_name: sheet_name of excel status file
+    :param error_path: path to error file
+    :param status_file: str: Path to the Excel file
+    :param status_dict: dict: Dictionary containing status messages
+    :param new_headers: headers which are added to the sheet if they are missing
+    """
+    append_status_rows_to_excel(status_file, [status_dict], error_path, sheet_name, new_headers)
+
+
 def split_dataframe(df, chunk_size):
     """
     Splits a DataFrame into smaller chunks with a specified number of rows.
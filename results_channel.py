@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+
+
+def to_columnar_batch(orders, column_names):
+    """
+    Packs orders into NumPy structured array (one fixed-width string field per column), which is sent between
+    processes as a single buffer instead of lists of Python strings.
+    :param orders: {COL_NAME: [values]} dictionary or DataFrame
+    :param column_names: columns to be packed (missing columns are filled with empty strings)
+    :return: numpy structured array
+    """
+    if isinstance(orders, pd.DataFrame):
+        orders = {col: orders[col].to_numpy() for col in orders.columns}
+    length = len(next(iter(orders.values()), [])) if orders else 0
+
+    columns = [np.asarray(orders[col] if col in orders else [""] * length, dtype=str) for col in column_names]
+    batch = np.empty(length, dtype=[(col, arr.dtype if arr.itemsize else "U1") for col, arr in zip(column_names, columns)])
+    for col, arr in zip(column_names, columns):
+        batch[col] = arr
+    return batch
+
+
+class ResultsCollector:
+    """
+    Collects columnar batches of selected and skipped orders of all variants as they arrive from workers.
+    """
+
+    def __init__(self, column_names, skipped_column_names=None):
+        """
+        :param column_names: columns of batches
+        :param skipped_column_names: columns of skipped batches if they differ (e.g. with REASON column)
+        """
+        self.column_names = {
+            "selected": list(column_names),
+            "skipped": list(skipped_column_names or column_names),
+        }
+        self.batches = {"selected": [], "skipped": []}
+        self.variants = {"selected": [], "skipped": []}
+        self.sap_messages = dict()
+        self.sizes = dict()
+
+    def add(self, variant, selected_batch, skipped_batch):
+        """
+        :param variant: name of variant
+        :param selected_batch: structured array of selected orders (see to_columnar_batch)
+        :param skipped_batch: structured array of skipped orders
+        :return:
+        """
+        for kind, batch in (("selected", selected_batch), ("skipped", skipped_batch)):
+            self.batches[kind].append(batch)
+            self.variants[kind].append(np.full(len(batch), variant))
+        self.sizes[variant] = len(selected_batch) + len(skipped_batch)
+
+    def frame(self, kind, with_variant=False):
+        """
+        :param kind: "selected" or "skipped"
+        :param with_variant: adds VARIANT column
+        :return: DataFrame with all collected orders of given kind
+        """
+        batches = self.batches[kind]
+        data = {
+            col: np.concatenate([batch[col] for batch in batches]) if batches else np.array([], dtype=str)
+            for col in self.column_names[kind]
+        }
+        if with_variant:
+            data["VARIANT"] = np.concatenate(self.variants[kind]) if batches else np.array([], dtype=str)
+        return pd.DataFrame(data)
@@ -0,0 +1,231 @@
+"""
+Batch changes in SAP on several sessions at once. Tasks are taken from a shared queue by one worker per session.
+
+Kanban control cycles (container size and number of containers) - every material goes through PK03 (read current
+data) -> PK31 (containers to be removed are set to 'empty') -> PK02 (new size and number of containers):
+    python sap_batch.py kanban input.xlsx output.xlsx --sessions 3
+input.xlsx has columns MATNR, WERKS, PRVBE, NEW_SIZE, NEW_COUNT.
+
+Storage locations of production orders (CO02) - orders which already have the storage location are skipped, status of
+every order is saved to a ledger, so an interrupted run can be started again and completed orders are not redone:
+    python sap_batch.py co02 input.xlsx output.xlsx --sessions 3 --ledger co02_ledger.sqlite
+input.xlsx has columns AUFNR, LGORT.
+"""
+import argparse
+import logging
+
+import pandas as pd
+
+from sap_connection import get_last_session, get_session, invalidate_session_cache
+from sap_functions import open_one_transaction, get_sap_message, sap_element_exists, cancel_popups
+from sap_transactions import (
+    pk03_get_container_data,
+    pk02_set_container_data,
+    pk31_change_container_status,
+    co02_change_storage_location,
+)
+from session_pool import SessionPool
+from task_ledger import TaskLedger
+
+KANBAN_COLUMNS = ["MATNR", "WERKS", "PRVBE", "NEW_SIZE", "NEW_COUNT"]
+RESULT_COLUMNS = KANBAN_COLUMNS + ["OLD_SIZE", "OLD_COUNT", "RESULT", "MESSAGE", "ATTEMPTS", "SESSION"]
+CO02_COLUMNS = ["AUFNR", "LGORT"]
+# PK31 status of containers which are going to be removed
+EMPTY_STATUS = "2"
+MAX_ATTEMPTS = 3
+
+
+def to_int(value):
+    """
+    :param value: number displayed by SAP, e.g. '1.000', '1 000,000' or '12'
+    :return: int
+    """
+    text = "".join(str(value).split()).replace(".", "")
+    return int(text.split(",")[0])
+
+
+def with_retries(session_num, func, description):
+    """
+    Calls func(session) until it succeeds, at most MAX_ATTEMPTS times. After each failure pop-ups are closed and
+    sessions are looked up again.
+    :param session_num: num of SAP window
+    :param func: function(session) -> result
+    :param description: description of the task for the error log
+    :return: (result or None, number of attempts, error message or None) tuple
+    """
+    error = None
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        session = get_session(session_num)
+        try:
+            return func(session), attempt, None
+        except Exception as e:
+            logging.error(f"Error occurred while {description} (attempt {attempt})", exc_info=True)
+            error = str(e)
+            invalidate_session_cache()
+            try:
+                cancel_popups(session)
+            except Exception:
+                pass
+
+    return None, MAX_ATTEMPTS, error
+
+
+def kanban_change_container(session, mat_nr, plant, prod_supply_area, new_size, new_count):
+    """
+    Changes one control cycle. It's safe to be repeated - current data are read first and nothing is changed if
+    they are already the same as requested.
+    :return: {"OLD_SIZE", "OLD_COUNT", "RESULT", "MESSAGE"} dictionary, RESULT is CHANGED, UNCHANGED or NOT_FOUND
+    """
+    open_one_transaction(session, "PK03")
+    size_of_container, number_of_containers = pk03_get_container_data(mat_nr, plant, prod_supply_area, session)
+    if size_of_container is None:
+        return {"OLD_SIZE": None, "OLD_COUNT": None, "RESULT": "NOT_FOUND", "MESSAGE": get_sap_message(session)}
+
+    old_size, old_count = to_int(size_of_container), to_int(number_of_containers)
+    result = {"OLD_SIZE": old_size, "OLD_COUNT": old_count}
+    if old_size == new_size and old_count == new_count:
+        result.update({"RESULT": "UNCHANGED", "MESSAGE": ""})
+        return result
+
+    # containers which are going to be removed have to be empty
+    if old_count > new_count:
+        open_one_transaction(session, "PK31")
+        for container_idx in range(old_count - 1, new_count - 1, -1):
+            pk31_change_container_status(mat_nr, plant, prod_supply_area, session, container_idx, EMPTY_STATUS)
+
+    open_one_transaction(session, "PK02")
+    pk02_set_container_data(mat_nr, plant, prod_supply_area, session, new_size, new_count, old_count)
+    result.update({"RESULT": "CHANGED", "MESSAGE": get_sap_message(session)})
+    return result
+
+
+def kanban_task(session_num, task):
+    """
+    Task handler for SessionPool.
+    :param task: (row index, MATNR, WERKS, PRVBE, NEW_SIZE, NEW_COUNT) tuple
+    :return: dictionary with RESULT_COLUMNS and row index ("IDX")
+    """
+    idx, mat_nr, plant, prod_supply_area, new_size, new_count = task
+    result = {"IDX": idx, "MATNR": mat_nr, "WERKS": plant, "PRVBE": prod_supply_area, "NEW_SIZE": new_size,
+              "NEW_COUNT": new_count, "SESSION": session_num}
+
+    change, attempts, error = with_retries(
+        session_num,
+        lambda session: kanban_change_container(session, mat_nr, plant, prod_supply_area, new_size, new_count),
+        f"changing {mat_nr}/{plant}/{prod_supply_area}",
+    )
+    result["ATTEMPTS"] = attempts
+    result.update(change if error is None else {"RESULT": "ERROR", "MESSAGE": error})
+    return result
+
+
+def run_kanban_batch(df, session_nums):
+    """
+    :param df: DataFrame with KANBAN_COLUMNS
+    :param session_nums: SAP window numbers to be used (one worker per session)
+    :return: DataFrame with RESULT_COLUMNS in the same order as df
+    """
+    tasks = [
+        (idx, str(mat_nr), str(plant), str(prod_supply_area), int(float(new_size)), int(float(new_count)))
+        for idx, (mat_nr, plant, prod_supply_area, new_size, new_count)
+        in enumerate(df[KANBAN_COLUMNS].itertuples(index=False, name=None))
+    ]
+
+    session_pool = SessionPool(session_nums, kanban_task)
+    results = []
+    for task, result, error in session_pool.run(tasks):
+        if error:
+            result = {"IDX": task[0], **dict(zip(KANBAN_COLUMNS, task[1:])), "RESULT": "ERROR", "MESSAGE": error}
+        results.append(result)
+    print(session_pool.utilisation_report())
+
+    if not results:
+        return pd.DataFrame(columns=RESULT_COLUMNS)
+    return pd.DataFrame(results).sort_values("IDX").reindex(columns=RESULT_COLUMNS).reset_index(drop=True)
+
+
+def co02_change_order(session, auf_nr, storage_loc):
+    """
+    Changes storage location of one production order (nothing is saved if it's already the same).
+    :return: {"RESULT", "MESSAGE"} dictionary, RESULT is CHANGED or UNCHANGED
+    """
+    if not sap_element_exists(session, "wnd[0]/usr/ctxtCAUFVD-AUFNR"):
+        open_one_transaction(session, "CO02")
+
+    status = co02_change_storage_location(session, storage_loc, auf_nr, skip_if_same=True)
+    if status.startswith("Exception"):
+        raise RuntimeError(status)
+    if session.findById("wnd[0]/sbar").MessageType == "E":
+        raise RuntimeError(get_sap_message(session))
+
+    return {"RESULT": "UNCHANGED" if status == "UNCHANGED" else "CHANGED", "MESSAGE": get_sap_message(session)}
+
+
+def co02_task(session_num, task):
+    """
+    Task handler for SessionPool.
+    :param task: (AUFNR, LGORT) tuple
+    :return: {"RESULT", "MESSAGE", "ATTEMPTS", "SESSION"} dictionary
+    """
+    auf_nr, storage_loc = task
+    change, attempts, error = with_retries(
+        session_num, lambda session: co02_change_order(session, auf_nr, storage_loc), f"changing order {auf_nr}"
+    )
+    result = change if error is None else {"RESULT": "ERROR", "MESSAGE": error}
+    result.update({"ATTEMPTS": attempts, "SESSION": session_num})
+    return result
+
+
+def run_co02_batch(df, session_nums, ledger_path):
+    """
+    :param df: DataFrame with CO02_COLUMNS (the last row wins if order is there more times)
+    :param session_nums: SAP window numbers to be used (one worker per session)
+    :param ledger_path: path to SQLite ledger, orders completed in previous (interrupted) runs are skipped
+    :return: DataFrame with AUFNR, LGORT, RESULT, MESSAGE, ATTEMPTS, SESSION, UPDATED_AT columns
+    """
+    targets = dict(zip(df["AUFNR"].astype(str), df["LGORT"].astype(str)))
+    ledger = TaskLedger(ledger_path)
+    pending = ledger.pending(targets)
+    print(f"{len(targets) - len(pending)} orders were already completed, {len(pending)} orders to be changed.")
+
+    if pending:
+        session_pool = SessionPool(session_nums, co02_task)
+        # every result is saved as soon as it arrives
+        for (auf_nr, storage_loc), result, error in session_pool.run(list(pending.items())):
+            if error:
+                ledger.record(auf_nr, storage_loc, "ERROR", error)
+            else:
+                ledger.record(auf_nr, storage_loc, result["RESULT"], result["MESSAGE"], result["ATTEMPTS"],
+                              result["SESSION"])
+        print(session_pool.utilisation_report())
+
+    df_results = ledger.frame(targets.keys())
+    ledger.close()
+    df_results.columns = ["AUFNR", "LGORT", "RESULT", "MESSAGE", "ATTEMPTS", "SESSION", "UPDATED_AT"]
+    return df_results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batch changes in SAP")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    kanban_parser = subparsers.add_parser("kanban", help="change Kanban control cycles (PK02/PK03/PK31)")
+    kanban_parser.add_argument("input", help="Excel file with columns " + ", ".join(KANBAN_COLUMNS))
+
+    co02_parser = subparsers.add_parser("co02", help="change storage locations of production orders (CO02)")
+    co02_parser.add_argument("input", help="Excel file with columns " + ", ".join(CO02_COLUMNS))
+    co02_parser.add_argument("--ledger", default="co02_ledger.sqlite", help="SQLite file with status of orders")
+
+    for sub_parser in (kanban_parser, co02_parser):
+        sub_parser.add_argument("output", help="Excel file with results")
+        sub_parser.add_argument("--sessions", type=int, default=3, help="number of SAP sessions to be used")
+    args = parser.parse_args()
+
+    sess_nums = [get_last_session(max_num_of_sessions=4 + idx)[2] for idx in range(args.sessions)]
+    df_input = pd.read_excel(args.input, dtype=str)
+    if args.command == "kanban":
+        df_results = run_kanban_batch(df_input, sess_nums)
+    else:
+        df_results = run_co02_batch(df_input, sess_nums, args.ledger)
+    df_results.to_excel(args.output)
+    print(df_results["RESULT"].value_counts().to_string())
@@ -1,19 +1,46 @@
 import os
 import sys
 import time
+import threading
 import multiprocessing
 
-import win32com.client
 import subprocess
 
+try:
+    import win32com.client
+except ImportError:
+    # SAP GUI scripting is available only on Windows, elsewhere only the fake backend can be used
+    win32com = None
 
-def get_client(num_of_window=0, transaction="SESSION_MANAGER"):
+from sap_waits import wait_until
+
+# Set by use_fake_sap_gui(), see fake_sap_gui.py
+_FAKE_SAP_GUI = None
+
+
+def use_fake_sap_gui(fake_gui):
     """
-    :param transaction: name of transaction for which the session will be returned, 'SESSION_MANAGER' for empty window
-    :param num_of_window: if there are more than one SESSION_MANAGERS, method will return then num_of_window(th) in
-    sequence.
+    Routes all SAP GUI scripting calls of this module to an in-process fake (fake_sap_gui.FakeSapGui).
+    :param fake_gui: FakeSapGui object, or None to use the real SAP GUI again
     :return:
     """
+    global _FAKE_SAP_GUI
+    _FAKE_SAP_GUI = fake_gui
+    invalidate_session_cache()
+
+
+def get_scripting_engine():
+    """
+    :return: SAP GUI scripting engine (application object) or None if it is not available.
+    Fake SAP GUI is used if it was set with use_fake_sap_gui() or if SAP_GUI_BACKEND environment variable is 'fake'.
+    """
+    if _FAKE_SAP_GUI is None and os.environ.get("SAP_GUI_BACKEND") == "fake":
+        from fake_sap_gui import get_default_fake_gui
+        use_fake_sap_gui(get_default_fake_gui())
+
+    if _FAKE_SAP_GUI is not None:
+        return _FAKE_SAP_GUI.GetScriptingEngine
+
     sap_gui_auto = win32com.client.GetObject("SAPGUI")
     if not type(sap_gui_auto) == win32com.client.CDispatch:
         return
@@ -23,21 +50,130 @@ def get_client(num_of_window=0, transaction="SESSION_MANAGER"):
         sap_gui_auto = None
         return
 
-    for conn in range(application.Children.Count):
-        # Loop through the application and get the connection
-        connection = application.Children(conn)
+    return application
 
-    for idx, sess in enumerate(range(connection.Children.Count)):
-        # print(idx)
-        # Loop through each connection and return sessions that are on the main screen 'SESSION_MANAGER'
-        session = connection.Children(sess)
 
-        if session.Info.Transaction == transaction and idx == num_of_window:
-            return session
+class SessionRegistry:
+    """
+    Per-thread cache of SAP GUI scripting engine and its sessions indexed by num of window (COM objects belong to
+    the apartment of the thread which got them). Sessions are enumerated
+    only on the first use, after invalidate() (session created/closed) or when cached session is no longer valid.
+    """
+
+    def __init__(self):
+        self.application = None
+        self.sessions = dict()  # {num_of_window: session}
+        self.transactions = dict()  # {num_of_window: last seen transaction}
+
+    def invalidate(self):
+        self.application = None
+        self.sessions = dict()
+        self.transactions = dict()
+
+    def refresh(self):
+        """
+        Enumerates all sessions of the (last) connection.
+        :return: True if SAP GUI scripting engine is available
+        """
+        self.invalidate()
+        application = get_scripting_engine()
+        if not application:
+            return False
+
+        connection = None
+        for conn in range(application.Children.Count):
+            # Loop through the application and get the connection
+            connection = application.Children(conn)
+
+        if connection is not None:
+            for idx in range(connection.Children.Count):
+                session = connection.Children(idx)
+                self.sessions[idx] = session
+                self.transactions[idx] = session.Info.Transaction
+
+        self.application = application
+        return True
+
+    def get(self, num_of_window, transaction):
+        """
+        :param num_of_window: num of SAP window
+        :param transaction: expected transaction of the session
+        :return: session if it exists and has given transaction opened, otherwise None
+        """
+        if self.application is None or num_of_window not in self.sessions:
+            if not self.refresh():
+                return
+            session = self.sessions.get(num_of_window)
+            if session is None:
+                return
+            current_transaction = self.transactions[num_of_window]
         else:
-            # Return None and break
-            pass
-            # return
+            session = self.sessions[num_of_window]
+            try:
+                current_transaction = session.Info.Transaction
+            except Exception:
+                # session was closed in the meantime
+                self.invalidate()
+                return self.get(num_of_window, transaction)
+
+        self.transactions[num_of_window] = current_transaction
+        if current_transaction == transaction:
+            return session
+
+    def get_any(self, num_of_window):
+        """
+        :param num_of_window: num of SAP window
+        :return: session of the window (whatever transaction is opened) or None
+        """
+        if self.application is None or num_of_window not in self.sessions:
+            if not self.refresh():
+                return
+        return self.sessions.get(num_of_window)
+
+    def find(self, transaction):
+        """
+        :param transaction: name of transaction
+        :return: list of window numbers on which given transaction was opened when last seen
+        """
+        return [idx for idx, tr in sorted(self.transactions.items()) if tr == transaction]
+
+
+_THREAD_DATA = threading.local()
+
+
+def session_registry():
+    """
+    :return: SessionRegistry of the current thread
+    """
+    registry = getattr(_THREAD_DATA, "session_registry", None)
+    if registry is None:
+        registry = _THREAD_DATA.session_registry = SessionRegistry()
+    return registry
+
+
+def invalidate_session_cache():
+    """
+    Has to be called when SAP session is created or closed outside of this module.
+    """
+    session_registry().invalidate()
+
+
+def get_client(num_of_window=0, transaction="SESSION_MANAGER"):
+    """
+    :param transaction: name of transaction for which the session will be returned, 'SESSION_MANAGER' for empty window
+    :param num_of_window: if there are more than one SESSION_MANAGERS, method will return then num_of_window(th) in
+    sequence.
+    :return:
+    """
+    return session_registry().get(num_of_window, transaction)
+
+
+def get_session(num_of_window):
+    """
+    :param num_of_window: num of SAP window
+    :return: session of the window regardless of opened transaction, None if there isn't such window
+    """
+    return session_registry().get_any(num_of_window)
 
 
 def open_sap():
@@ -60,8 +196,7 @@ def open_sap():
 
 def sap_log_in(sap_system):
     # Initialize SAP GUI scripting engine
-    SapGuiAuto = win32com.client.GetObject("SAPGUI")
-    application = SapGuiAuto.GetScriptingEngine
+    application = get_scripting_engine()
 
     # Open connection to SAP using a system identifier (no need for user credentials if SSO is enabled)
     connection = application.OpenConnection(sap_system, True)
@@ -83,26 +218,14 @@ def get_last_sap_window(max_num_of_sessions=6):
     last_session = None
     last_transaction = None
 
-    sap_gui_auto = win32com.client.GetObject("SAPGUI")
-    if not type(sap_gui_auto) == win32com.client.CDispatch:
-        return
-
-    application = sap_gui_auto.GetScriptingEngine
-    if not type(application) == win32com.client.CDispatch:
-        sap_gui_auto = None
+    registry = session_registry()
+    if not registry.refresh():
         return
 
-    for conn in range(application.Children.Count):
-        # Loop through the application and get the connection
-        connection = application.Children(conn)
-
-    for idx, sess in enumerate(range(connection.Children.Count)):
-        # print(idx)
-        # Loop through each connection and return sessions that are on the main screen 'SESSION_MANAGER'
-        session = connection.Children(sess)
+    for idx, session in sorted(registry.sessions.items()):
         last_session = session
         last_num_of_window = idx
-        last_transaction = session.Info.Transaction
+        last_transaction = registry.transactions[idx]
         if idx == max_num_of_sessions - 1:
             # it enables us to be more flexible and select session which is not last session
             # by adjusting max_num_of_session parameter in get_last_session method
@@ -127,7 +250,8 @@ def get_last_session(max_num_of_sessions=6):
     else:
         # create new session
         last_session.createSession()
-        time.sleep(2)
+        invalidate_session_cache()
+        wait_until(lambda: get_client(last_num_of_window + 1) is not None, label="new session", replaced_sleep=2)
         last_num_of_window += 1
         sess = get_client(last_num_of_window)
         transaction = "SESSION_MANAGER"
@@ -1,12 +1,16 @@
+import csv
+import math
 import multiprocessing
+import os
+import re
 import sys
+import tempfile
 import time
-import psutil
+import pandas as pd
+import pyperclip
 
-from openpyxl import load_workbook
-
-from sap_connection import get_client
-from other_functions import close_excel_file
+from sap_connection import get_client, invalidate_session_cache
+from sap_waits import wait_until, wait_while_busy, wait_for_file
 
 
 def load_variant(variant_name, session_idx, name_of_transaction, open_only, close_sap=False, current_transaction="SESSION_MANAGER"):
@@ -80,6 +84,7 @@ def create_new_sessions(variants_list, max_run_time):
                 print("Program has been running for too long. Exiting.")
                 sys.exit()
         obj_sess.createSession()
+        invalidate_session_cache()
 
 
 def open_transactions(variants, transactions, open_only_modes):
@@ -111,44 +116,62 @@ def open_transactions(variants, transactions, open_only_modes):
 
 
 def get_values_from_table(transaction, num_of_window, table_id, column_names, session=None):
+    """
+    Reads given columns of all rows of ALV grid, see get_table_snapshot.
+    :return: {COL_NAME: [values]} dictionary
+    """
     if not session:
         obj_sess = get_client(num_of_window, transaction)
     else:
         obj_sess = session
 
-    table = obj_sess.findById(table_id)
-    row_count = table.RowCount
-    visible_rows = table.VisibleRowCount
+    return get_table_snapshot(obj_sess.findById(table_id), column_names, session=obj_sess)
 
-    retrieved_values = dict()
-    # idx = 0
 
-    current_row = 0
-    while current_row < row_count:
-        # Set the first visible row to the current row index
-        table.firstVisibleRow = current_row
+# ID of label of a list screen, e.g. '.../usr/lbl[26,7]'
+LIST_LABEL_PATTERN = re.compile(r"/lbl\[(\d+),(\d+)\]$")
 
-        # Read rows currently visible
-        for i in range(visible_rows):
-            if current_row + i == row_count:
-                break
-            for column_name in column_names:
-                table_value = table.GetCellValue(current_row + i, column_name)
-                retrieved_values.setdefault(column_name, []).append(table_value)
+# Longer lists of orders are uploaded to multiple selection dialog from clipboard instead of being typed in
+BULK_INSERT_THRESHOLD = 20
 
-            # # idx += 1
-            # # print(f"Order num: {idx} | order value: {order}")
-            # if order:
-            #     orders.append(order)
 
-    #     Scroll down
-        current_row += visible_rows
+def upload_values_from_clipboard(session, values):
+    """
+    Uploads values to opened multiple selection dialog with 'Upload from clipboard' button (the same way as in
+    coois_load_orders_from_clipboard). Previous content of the clipboard is restored afterwards.
+    :param session: SAP session with multiple selection dialog opened
+    :param values: list of values
+    :return: True if values were uploaded, False if clipboard is not available
+    """
+    try:
+        previous_clipboard = pyperclip.paste()
+        pyperclip.copy("\r\n".join(map(str, values)))
+    except pyperclip.PyperclipException as e:
+        print(f"Clipboard is not available: {e}")
+        return False
 
-    return retrieved_values
+    session.findById("wnd[1]/tbar[0]/btn[24]").press()
+    pyperclip.copy(previous_clipboard)
+    return True
 
 
-def insert_production_orders(production_orders, session, prod_ord_multiple_selection_btn_id, table_id):
+def insert_production_orders(production_orders, session, prod_ord_multiple_selection_btn_id, table_id,
+                             bulk_threshold=BULK_INSERT_THRESHOLD):
+    """
+    Inserts production (planned) orders to multiple selection dialog.
+    :param production_orders: list of orders
+    :param session: SAP session
+    :param prod_ord_multiple_selection_btn_id: id of button which opens multiple selection dialog
+    :param table_id: id of table in multiple selection dialog
+    :param bulk_threshold: lists longer than that are uploaded from clipboard in one step, shorter are typed in
+    :return:
+    """
     session.findById(prod_ord_multiple_selection_btn_id).press()
+
+    if len(production_orders) > bulk_threshold and upload_values_from_clipboard(session, production_orders):
+        session.findById("wnd[1]/tbar[0]/btn[8]").press()
+        return
+
     visible_rows = session.findById(table_id).VisibleRowCount
     # print("Visible rows count:", visible_rows)
 
@@ -167,6 +190,274 @@ def insert_production_orders(production_orders, session, prod_ord_multiple_selec
     session.findById("wnd[1]/tbar[0]/btn[8]").press()
 
 
+def read_list_labels(container):
+    """
+    Reads all labels (lbl[x,y] elements) of the current page of a list screen in one pass.
+    :param container: list container, e.g. session.findById("wnd[1]/usr")
+    :return: {(x, y): label element} dictionary
+    """
+    labels = dict()
+    for element in container.Children:
+        match = LIST_LABEL_PATTERN.search(element.Id)
+        if match:
+            labels[(int(match.group(1)), int(match.group(2)))] = element
+    return labels
+
+
+def read_list_records(session, fields, first_line, lines_per_record, container_id="wnd[1]/usr"):
+    """
+    Reads records of a list screen in which every record takes the same number of lines. Labels of each page are read
+    in one pass and the list is scrolled by whole pages until there are no more records.
+    :param session: SAP session
+    :param fields: {name: (x, line of the record)} dictionary, e.g. {"creator": (26, 1)} - label lbl[26,y+1] of each
+    record starting at line y
+    :param first_line: line (y) of the first record when the list is scrolled to the top
+    :param lines_per_record: number of lines of one record
+    :param container_id: ID of the list container
+    :return: DataFrame with one row per record
+    """
+    records = {name: [] for name in fields}
+
+    num_of_records = 0
+    position = session.findById(container_id).verticalScrollbar.position
+    while True:
+        # the screen is rendered again after each scroll, so the container is taken again for every page
+        labels = read_list_labels(session.findById(container_id))
+
+        # y of labels is relative to the scroll position
+        records_on_page = 0
+        while True:
+            record_line = first_line + num_of_records * lines_per_record - position
+            coordinates = {name: (x, record_line + line) for name, (x, line) in fields.items()}
+            if not all(coordinate in labels for coordinate in coordinates.values()):
+                break
+            for name, coordinate in coordinates.items():
+                records[name].append(labels[coordinate].Text)
+            num_of_records += 1
+            records_on_page += 1
+
+        if records_on_page == 0:
+            break
+
+        # Scroll so the next record is at the top (list can't be scrolled below its end - actual position is read)
+        session.findById(container_id).verticalScrollbar.position = num_of_records * lines_per_record
+        wait_while_busy(session, label="list page")
+        new_position = session.findById(container_id).verticalScrollbar.position
+        if new_position == position:
+            break
+        position = new_position
+
+    return pd.DataFrame(records)
+
+
+class TableControlWriter:
+    """
+    Writes values to SAP table control (e.g. MIGO item list). Cells are addressed by column name and absolute row,
+    the table is scrolled only once per page.
+    """
+
+    def __init__(self, session, table_id, column_ids):
+        """
+        :param session: SAP session
+        :param table_id: ID of the table control
+        :param column_ids: {column name: ID of the cell of the column in any visible row}, e.g.
+        {"matnr": ".../tblSAPLMIGOTV_GOITEM/ctxtGOITEM-MAKTX[4,0]"}
+        """
+        self.session = session
+        self.table_id = table_id
+        # ".../ctxtGOITEM-MAKTX[4,0]" -> ".../ctxtGOITEM-MAKTX[4,"
+        self.column_prefixes = {name: cell_id.rsplit(",", 1)[0] + "," for name, cell_id in column_ids.items()}
+
+        table = session.findById(table_id)
+        self.visible_rows = table.visibleRowCount
+        self.position = table.verticalScrollbar.position
+
+    def cell_id(self, column_name, row):
+        """
+        :param row: absolute row of the table (has to be visible)
+        """
+        return f"{self.column_prefixes[column_name]}{row - self.position}]"
+
+    def scroll_to(self, row, submit=False):
+        """
+        Scrolls table so the row is the first visible one.
+        :param submit: scroll by one row first, so the table takes over entered values (and adds new empty rows)
+        """
+        # scrolling is a round trip which renders the screen again, so the scrollbar is taken again after it (old
+        # object refers to the previous screen)
+        if submit:
+            self.session.findById(self.table_id).verticalScrollbar.position = self.position + 1
+            wait_while_busy(self.session, label="table control scroll", replaced_sleep=0.2)
+        self.session.findById(self.table_id).verticalScrollbar.position = row
+        self.position = row
+        wait_while_busy(self.session, label="table control scroll", replaced_sleep=0.2)
+
+    def write_rows(self, columns_values, start_row=0):
+        """
+        Writes rows page by page. After each full page the last written row becomes the first visible one.
+        :param columns_values: {column name: list of values}, all lists have the same length
+        :param start_row: absolute row of the first value
+        :return:
+        """
+        num_of_rows = len(next(iter(columns_values.values()), []))
+        end_row = start_row + num_of_rows
+
+        row = start_row
+        while row < end_row:
+            if not self.position <= row < self.position + self.visible_rows:
+                # jump directly to the page of the row
+                self.scroll_to(row)
+
+            page_end = min(self.position + self.visible_rows, end_row)
+            for page_row in range(row, page_end):
+                for column_name, values in columns_values.items():
+                    self.session.findById(self.cell_id(column_name, page_row)).text = str(values[page_row - start_row])
+            row = page_end
+
+            if page_end == self.position + self.visible_rows:
+                self.scroll_to(page_end - 1, submit=True)
+
+    def scroll_to_top(self):
+        if self.position > 0:
+            self.scroll_to(0)
+
+
+class GridWriter:
+    """
+    Writes DataFrame to editable ALV grid (GuiGridView), row i of the DataFrame goes to row start_row + i of the grid.
+    The grid has no bulk modification, so every cell is one modifyCell call - values are prepared in advance and the
+    grid is scrolled only once per page. Numbers and dates are written in SAP format (see format_sap_values).
+    """
+
+    def __init__(self, table, session=None, **convert_kwargs):
+        """
+        :param table: ALV grid
+        :param session: SAP session - if given, it's waited until each page is rendered
+        :param convert_kwargs: decimal, thousands and date_format used by SAP (see convert_sap_values)
+        """
+        self.table = table
+        self.session = session
+        self.convert_kwargs = convert_kwargs
+
+    def _scroll_to(self, row):
+        self.table.firstVisibleRow = row
+        if self.session is not None:
+            wait_while_busy(self.session, label="grid page")
+
+    def write(self, df, start_row=0):
+        """
+        :param df: DataFrame with grid columns, empty (NaN/None) cells are not written
+        :param start_row: grid row of the first DataFrame row
+        :return: {"rows", "cells", "seconds", "rows_per_sec"} dictionary
+        """
+        start_time = time.time()
+        num_of_rows = df.shape[0]
+        row_count = self.table.RowCount
+        if start_row + num_of_rows > row_count:
+            raise ValueError(f"{num_of_rows} rows can't be written from row {start_row}, grid has {row_count} rows")
+
+        visible_rows = self.table.VisibleRowCount
+        column_names = [str(column_name) for column_name in df.columns]
+        not_empty = df.notna().to_numpy()
+        values = format_sap_values(df, **self.convert_kwargs).to_numpy()
+        modify_cell = self.table.modifyCell
+
+        num_of_cells = 0
+        for page_start in range(0, num_of_rows, visible_rows):
+            self._scroll_to(start_row + page_start)
+            for idx in range(page_start, min(page_start + visible_rows, num_of_rows)):
+                for col_idx, column_name in enumerate(column_names):
+                    if not_empty[idx, col_idx]:
+                        modify_cell(start_row + idx, column_name, values[idx, col_idx])
+                        num_of_cells += 1
+
+        seconds = time.time() - start_time
+        return {
+            "rows": num_of_rows,
+            "cells": num_of_cells,
+            "seconds": seconds,
+            "rows_per_sec": num_of_rows / seconds if seconds > 0 else float("inf"),
+        }
+
+    def verify(self, df, start_row=0, sample_size=20, dtypes=None):
+        """
+        Reads back sample of written rows (evenly spread, including the first and the last one). Values are compared
+        as numbers/dates where the grid formats them (e.g. 5 is displayed as '5,000'), both written and read values
+        are converted by convert_sap_values.
+        :param df: DataFrame which was written
+        :param start_row: grid row of the first DataFrame row
+        :param sample_size: max number of rows to be read back
+        :param dtypes: {COL_NAME: "int" | "float" | "date"} dictionary, numeric and date columns of df by default
+        :return: list of (grid row, column, expected value, actual value) tuples of cells which differ
+        """
+        num_of_rows = df.shape[0]
+        if num_of_rows == 0 or sample_size <= 0:
+            return []
+        num_of_samples = min(sample_size, num_of_rows)
+        if num_of_samples == 1:
+            sample_idxs = [0]
+        else:
+            sample_idxs = sorted({round(k * (num_of_rows - 1) / (num_of_samples - 1)) for k in range(num_of_samples)})
+
+        df_sample = df.iloc[sample_idxs].reset_index(drop=True)
+        df_sample.columns = [str(column_name) for column_name in df.columns]
+        column_names = list(df_sample.columns)
+        if dtypes is None:
+            dtypes = _value_dtypes(df_sample)
+
+        actual = {column_name: [] for column_name in column_names}
+        rows = [start_row + idx for idx in sample_idxs]
+        for _, page in iter_grid_pages(self.table, column_names, rows, self.session):
+            for column_name in column_names:
+                actual[column_name] += [str(value).strip() for value in page[column_name]]
+        df_actual = pd.DataFrame(actual)
+
+        # the same text as written by write()
+        df_expected = format_sap_values(df_sample, **self.convert_kwargs)
+        not_empty = df_sample.notna().to_numpy()
+        expected_text = df_expected.to_numpy()
+        expected_values = convert_sap_values(df_expected.copy(), dtypes, **self.convert_kwargs).to_numpy()
+        actual_values = convert_sap_values(df_actual.copy(), dtypes, **self.convert_kwargs).to_numpy()
+        actual_text = df_actual.to_numpy()
+
+        mismatches = []
+        for pos, row in enumerate(rows):
+            for col_idx, column_name in enumerate(column_names):
+                if not not_empty[pos, col_idx] or actual_text[pos, col_idx] == expected_text[pos, col_idx].strip():
+                    continue
+                if column_name in dtypes and _same_value(expected_values[pos, col_idx], actual_values[pos, col_idx]):
+                    continue
+                mismatches.append((row, column_name, expected_text[pos, col_idx], actual_text[pos, col_idx]))
+        return mismatches
+
+
+# pandas.api.types.infer_dtype results of columns with numbers and dates
+_NUMBER_KINDS = ("integer", "floating", "mixed-integer-float", "decimal")
+_DATE_KINDS = ("datetime64", "datetime", "date")
+
+
+def _value_dtypes(df):
+    """
+    :return: {COL_NAME: "float" | "date"} dictionary of columns of DataFrame which hold numbers or dates
+    """
+    dtypes = dict()
+    for column_name in df.columns:
+        kind = pd.api.types.infer_dtype(df[column_name], skipna=True)
+        if kind in _NUMBER_KINDS:
+            dtypes[column_name] = "float"
+        elif kind in _DATE_KINDS:
+            dtypes[column_name] = "date"
+    return dtypes
+
+
+def _same_value(expected, actual):
+    if pd.isna(expected) or pd.isna(actual):
+        return False
+    if isinstance(expected, pd.Timestamp) or isinstance(actual, pd.Timestamp):
+        return expected == actual
+    return math.isclose(float(expected), float(actual), rel_tol=1e-9, abs_tol=1e-9)
+
+
 def export_data_to_file(transaction, num_of_window, file_path, file_name):
     obj_sess = get_client(num_of_window, transaction)
 
@@ -180,8 +471,11 @@ def export_data_to_file(transaction, num_of_window, file_path, file_name):
     obj_sess.findById("wnd[1]/usr/ctxtDY_PATH").caretPosition = 74
     obj_sess.findById("wnd[1]/tbar[0]/btn[11]").press()
 
-    time.sleep(2)
-    # Iterate over all running processes
+    if not wait_for_file(os.path.join(file_path, file_name), label="exported file", replaced_sleep=2):
+        print(f"Exported file {file_name} wasn't saved in time.")
+    # imported here - other_functions loads openpyxl and numpy, which session workers don't need
+    from other_functions import close_excel_file
+    # SAP opens exported file in Excel - it's waited until the workbook is opened and it's closed
     close_excel_file(file_name)
 
 
@@ -198,7 +492,7 @@ def clear_sap_warnings(session):
         message_bar = session.findById("wnd[0]/sbar")
         if message_bar.MessageType == "W":  # 'W' stands for Warning (Yellow message)
             session.findById("wnd[0]").sendVKey(0)  # Press Enter to acknowledge the warning
-            time.sleep(0.2)  # Give SAP some time to process
+            wait_while_busy(session, replaced_sleep=0.2)  # Give SAP some time to process
             # print("SAP warning cleared.")
     except Exception as e:
         print(f"Error handling SAP message: {e}")
@@ -216,7 +510,436 @@ def get_sap_message(session):
         return None  # Return None if there's an error
 
 
-def select_rows_in_table(transaction, num_of_window, table_id, cohv_logic_factors, cohv_main_logic_func, result_column_names, session=None):
+def iter_grid_pages(table, column_names, rows=None, session=None):
+    """
+    Reads given columns of ALV grid page by page. Rows are tracked by index, so every row is read exactly once (also
+    identical rows) and in table order.
+    :param table: ALV grid (or any object with RowCount, VisibleRowCount, firstVisibleRow and GetCellValue)
+    :param column_names: list of columns to be read, duplicated names are read only once
+    :param rows: ascending list of row indexes to be read, all rows by default
+    :param session: SAP session - if given, after each scroll it's waited until the page is rendered
+    :return: generator of (row_indexes, {COL_NAME: [values]}) tuples, one per page
+    """
+    column_names = list(dict.fromkeys(column_names))
+    row_count = table.RowCount
+    visible_rows = table.VisibleRowCount
+    if rows is None:
+        rows = range(row_count)
+
+    first_visible_row = None
+    page_rows, page = [], {column_name: [] for column_name in column_names}
+    for row in rows:
+        if first_visible_row is None or not first_visible_row <= row < first_visible_row + visible_rows:
+            if page_rows:
+                yield page_rows, page
+                page_rows, page = [], {column_name: [] for column_name in column_names}
+
+            # Scroll down, so the row is the first visible one
+            table.firstVisibleRow = row
+            first_visible_row = row
+            if session is not None:
+                # grid can't be scrolled below its last page, so first visible row can be lower than requested
+                wait_until(lambda: not session.Busy and table.firstVisibleRow <= row, label="grid page",
+                           replaced_sleep=0.5)
+                first_visible_row = table.firstVisibleRow
+
+        page_rows.append(row)
+        for column_name in column_names:
+            page[column_name].append(table.GetCellValue(row, column_name))
+
+    if page_rows:
+        yield page_rows, page
+
+
+def get_table_snapshot(table, column_names, rows=None, session=None):
+    """
+    Reads given columns of all rows of ALV grid into memory. Every cell is read only once (page by page), so
+    the selection logic can work on the result without any further communication with SAP.
+    :param table: ALV grid (or any object with RowCount, VisibleRowCount, firstVisibleRow and GetCellValue)
+    :param column_names: list of columns to be read, duplicated names are read only once
+    :param rows: ascending list of row indexes to be read, all rows by default
+    :param session: SAP session - if given, it's waited until each page is rendered (see iter_grid_pages)
+    :return: {COL_NAME: [values]} dictionary with one value per (read) table row
+    """
+    column_names = list(dict.fromkeys(column_names))
+    snapshot = {column_name: [] for column_name in column_names}
+    if not column_names:
+        return snapshot
+
+    for _, page in iter_grid_pages(table, column_names, rows, session):
+        for column_name in column_names:
+            snapshot[column_name].extend(page[column_name])
+
+    return snapshot
+
+
+def convert_sap_values(df, dtypes, decimal=",", thousands=".", date_format="%d.%m.%Y"):
+    """
+    Converts columns with values displayed by SAP (strings) to numbers and dates.
+    :param df: DataFrame with string values
+    :param dtypes: {COL_NAME: "int" | "float" | "date"} dictionary, other columns stay strings
+    :param decimal: decimal separator used by SAP
+    :param thousands: thousands separator used by SAP
+    :param date_format: format of dates
+    :return: the same DataFrame with converted columns (values which can't be converted are NaN/NaT, also values
+    with decimal places in "int" columns)
+    """
+    for column_name, dtype in dtypes.items():
+        values = df[column_name].astype(str).str.strip()
+        if dtype in ("int", "float"):
+            values = values.str.replace(thousands, "", regex=False).str.replace(decimal, ".", regex=False)
+            # SAP displays negative numbers with minus at the end, e.g. '10-'
+            values = values.str.replace(r"^(.*)-$", r"-\1", regex=True)
+            numbers = pd.to_numeric(values, errors="coerce")
+            if dtype == "int":
+                # numbers with decimal places aren't rounded (e.g. stock '0,4' is not 0)
+                numbers = numbers.where(numbers == numbers.round()).astype("Int64")
+            df[column_name] = numbers
+        elif dtype == "date":
+            df[column_name] = pd.to_datetime(values, format=date_format, errors="coerce")
+    return df
+
+
+def format_sap_values(df, decimal=",", thousands=".", date_format="%d.%m.%Y"):
+    """
+    Formats values of DataFrame as they are entered to SAP - the reverse of convert_sap_values. Numbers of columns
+    with only whole numbers are written without decimal places (e.g. 5, not 5.0 of a column with NaN).
+    :param df: DataFrame with strings, numbers or dates
+    :param decimal: decimal separator used by SAP
+    :param thousands: thousands separator used by SAP
+    :param date_format: format of dates
+    :return: DataFrame with strings (empty cells stay None)
+    """
+    formatted = dict()
+    for column_name in df.columns:
+        values = df[column_name]
+        kind = pd.api.types.infer_dtype(values, skipna=True)
+        not_empty = values.notna()
+        if kind in _NUMBER_KINDS:
+            numbers = pd.to_numeric(values)
+            if (numbers[not_empty] == numbers[not_empty].round()).all():
+                numbers = numbers.astype("Int64")
+            # '1,234.5' -> '1.234,5'
+            text = numbers[not_empty].map(
+                lambda number: f"{number:,}".replace(",", "\0").replace(".", decimal).replace("\0", thousands)
+            )
+        elif kind in _DATE_KINDS:
+            text = pd.to_datetime(values[not_empty]).dt.strftime(date_format)
+        elif kind in ("string", "empty"):
+            text = values[not_empty].astype(str)
+        else:
+            raise ValueError(f"Column {column_name} can't be written to SAP, it has values of type {kind}")
+        formatted[column_name] = text.reindex(df.index).astype(object).where(not_empty, None)
+    return pd.DataFrame(formatted, index=df.index, columns=df.columns)
+
+
+def grid_to_dataframe(table, column_names, dtypes=None, session=None, **convert_kwargs):
+    """
+    Reads whole ALV grid into DataFrame (one row per grid row, in grid order).
+    :param table: ALV grid
+    :param column_names: list of columns to be read
+    :param dtypes: {COL_NAME: "int" | "float" | "date"} dictionary, see convert_sap_values
+    :param session: SAP session - if given, it's waited until each page is rendered (see iter_grid_pages)
+    :param convert_kwargs: decimal, thousands and date_format for convert_sap_values
+    :return: DataFrame
+    """
+    df = pd.DataFrame(get_table_snapshot(table, column_names, session=session))
+    return convert_sap_values(df, dtypes or dict(), **convert_kwargs)
+
+
+def write_grid_rows(table, column_names, output, session=None, value_func=None, separator="\t"):
+    """
+    Writes rows of ALV grid to text output page by page as they are read (only one page is held in memory).
+    :param table: ALV grid
+    :param column_names: list of columns to be written
+    :param output: object with write method (opened file, io.StringIO, ...)
+    :param session: SAP session - if given, it's waited until each page is rendered (see iter_grid_pages)
+    :param value_func: optional function applied to every value
+    :param separator: separator of values in a line, lines are separated by new line character
+    :return: number of written rows
+    """
+    column_names = list(column_names)
+    num_of_rows = 0
+    for page_rows, page in iter_grid_pages(table, column_names, session=session):
+        for idx in range(len(page_rows)):
+            values = [page[column_name][idx] for column_name in column_names]
+            if value_func is not None:
+                values = [value_func(value) for value in values]
+            output.write(("\n" if num_of_rows else "") + separator.join(values))
+            num_of_rows += 1
+    return num_of_rows
+
+
+# Tables with more rows are read through local export to a file instead of cell by cell
+EXPORT_ROW_THRESHOLD = 2000
+# Export format 'other formats' and 'Text with Tabs' in the list of formats
+TEXT_EXPORT_FORMAT_KEY = "33"
+TEXT_EXPORT_FORMAT_ID = "wnd[1]/usr/subSUBSCREEN_STEPLOOP:SAPLSPO5:0150/sub:SAPLSPO5:0150/radSPOPLI-SELFLAG[0,0]"
+
+
+def read_exported_text_file(file_path):
+    """
+    Reads table exported from SAP as 'Text with Tabs' (encoding is detected by BOM, cp1250 if there's none).
+    :param file_path: path to exported file
+    :return: DataFrame with all values as stripped strings and column titles from the file
+    """
+    with open(file_path, "rb") as f:
+        bom = f.read(3)
+    if bom.startswith((b"\xff\xfe", b"\xfe\xff")):
+        encoding = "utf-16"
+    elif bom == b"\xef\xbb\xbf":
+        encoding = "utf-8-sig"
+    else:
+        encoding = "cp1250"
+
+    df = pd.read_csv(file_path, sep="\t", dtype=str, keep_default_na=False, quoting=csv.QUOTE_NONE,
+                     encoding=encoding)
+    return df.apply(lambda column: column.str.strip())
+
+
+def cancel_popups(session):
+    """
+    Cancels modal windows (e.g. export dialog) left open after an error, so the main window or the next transaction
+    can be used again.
+    """
+    for _ in range(3):
+        if not sap_element_exists(session, "wnd[1]"):
+            return
+        session.findById("wnd[1]").sendVKey(12)
+
+
+def get_table_snapshot_by_export(session, table, column_names, export_dir=None):
+    """
+    The same as get_table_snapshot, but the whole table is exported to a local file (&MB_EXPORT -> &XXL ->
+    'Text with Tabs') and parsed at once. Columns of the file are mapped to technical names by table.ColumnOrder.
+    :param session: SAP session
+    :param table: ALV grid
+    :param column_names: list of columns to be read
+    :param export_dir: directory for the exported file (it's deleted afterwards), temp directory by default
+    :return: {COL_NAME: [values]} dictionary or None if the export can't be used (table has to be read cell by cell)
+    """
+    column_names = list(dict.fromkeys(column_names))
+    column_order = table.ColumnOrder
+    displayed_columns = [column_order.ElementAt(idx) for idx in range(column_order.Count)]
+    missing_columns = [col for col in column_names if col not in displayed_columns]
+    if missing_columns:
+        print(f"Columns {missing_columns} are not displayed, table will be read cell by cell.")
+        return None
+
+    row_count = table.RowCount
+    export_dir = export_dir or tempfile.gettempdir()
+    file_name = f"alv_export_{os.getpid()}_{time.time_ns()}.txt"
+    file_path = os.path.join(export_dir, file_name)
+
+    try:
+        table.pressToolbarContextButton("&MB_EXPORT")
+        table.selectContextMenuItem("&XXL")
+        # 'Text with Tabs' is one of other formats, chosen in the next pop-up (see mb51_export_data_to_excel)
+        session.findById("wnd[1]/usr/cmbG_LISTBOX").key = TEXT_EXPORT_FORMAT_KEY
+        session.findById("wnd[1]/tbar[0]/btn[0]").press()
+        session.findById(TEXT_EXPORT_FORMAT_ID).select()
+        session.findById("wnd[1]/tbar[0]/btn[0]").press()
+        session.findById("wnd[1]/usr/ctxtDY_PATH").text = export_dir
+        session.findById("wnd[1]/usr/ctxtDY_FILENAME").text = file_name
+        session.findById("wnd[1]/tbar[0]/btn[11]").press()
+
+        if not wait_for_file(file_path, label="table export"):
+            cancel_popups(session)
+            return None
+        df = read_exported_text_file(file_path)
+    except Exception as e:
+        print(f"Export of the table failed, it will be read cell by cell: {e}")
+        cancel_popups(session)
+        return None
+    finally:
+        try:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+        except OSError as e:
+            # e.g. the file is opened by another program - the snapshot can still be used
+            print(f"Exported file {file_path} couldn't be removed: {e}")
+
+    if df.shape != (row_count, len(displayed_columns)):
+        print(f"Exported table has {df.shape} rows/columns instead of {(row_count, len(displayed_columns))}, "
+              f"table will be read cell by cell.")
+        return None
+    df.columns = displayed_columns
+
+    # Spot check of a few rows spread over the table (e.g. different number format or shifted columns)
+    for row in sorted({row_count * part // 4 for part in range(4)} | {row_count - 1}):
+        for column_name in column_names:
+            if str(table.GetCellValue(row, column_name)).strip() != df.at[row, column_name]:
+                print(f"Exported value of {column_name} in row {row} differs from the table, table will be read "
+                      f"cell by cell.")
+                return None
+
+    return {column_name: df[column_name].to_list() for column_name in column_names}
+
+
+def select_rows_from_snapshot(snapshot, cohv_logic_factors, cohv_main_logic_func, result_column_names):
+    """
+    Applies COHV selection logic to the table snapshot (see get_table_snapshot)
+    :param snapshot: {COL_NAME: [values]} dictionary
+    :param cohv_logic_factors: {COL_NAME: logic_function} dictionary with logic for COHV orders selection
+    :param cohv_main_logic_func: function which takes logic parameters and returns True if row should be selected
+    :param result_column_names: list of columns values of which we want to get back as a result
+    :return: tuple (rows_to_select, selected_orders, skipped_orders)
+    """
+    rows_to_select = []
+    selected_orders = dict()
+    skipped_orders = dict()
+
+    # stock can be an empty string in the last row (row with total sum at the bottom of the table)
+    not_empty_columns = list(cohv_logic_factors.keys())
+    not_empty_columns.remove('FEVOR')   # Prod planner can be an empty string, so I exclude this column
+
+    row_count = len(next(iter(snapshot.values()), []))
+    for row in range(row_count):
+        if not all(snapshot[key][row] != '' for key in not_empty_columns):
+            continue
+
+        logic_params = dict()
+        for key, func in cohv_logic_factors.items():
+            logic_params[key + "_" + func.__name__] = func(snapshot[key][row])
+
+        if cohv_main_logic_func(logic_params):
+            # to be selected
+            rows_to_select.append(row)
+            orders = selected_orders
+        else:
+            # to be skipped
+            orders = skipped_orders
+
+        # Get data from specified columns
+        for col in result_column_names:
+            orders.setdefault(col, []).append(snapshot[col][row])
+
+    return rows_to_select, selected_orders, skipped_orders
+
+
+def select_rows_from_frame(snapshot, not_empty_columns, frame_logic_func, result_column_names):
+    """
+    Batch version of select_rows_from_snapshot - selection logic is evaluated for all rows at once
+    :param snapshot: {COL_NAME: [values]} dictionary or DataFrame with one row per table row
+    :param not_empty_columns: columns which must not be empty for the row to be taken into account
+    :param frame_logic_func: function which takes DataFrame and returns boolean Series (True - row to be selected).
+    If it has skip_reasons method (DataFrame -> Series with reason, empty string - row to be selected, see
+    cohv_rules.RuleSet), the rows are selected by the reasons and skipped_df has also REASON column
+    :param result_column_names: list of columns values of which we want to get back as a result
+    :return: tuple (rows_to_select, selected_df, skipped_df)
+    """
+    df = pd.DataFrame(snapshot)
+    result_column_names = list(result_column_names)
+    skip_reasons = getattr(frame_logic_func, "skip_reasons", None)
+
+    if df.empty:
+        empty_df = pd.DataFrame(columns=result_column_names)
+        skipped_columns = result_column_names + ["REASON"] if skip_reasons else result_column_names
+        return [], empty_df, pd.DataFrame(columns=skipped_columns)
+
+    # stock can be an empty string in the last row (row with total sum at the bottom of the table)
+    not_empty = (df[list(not_empty_columns)] != '').all(axis=1)
+    df = df[not_empty]
+
+    if skip_reasons:
+        # the rules are evaluated only once - the reasons are kept for skipped rows
+        reasons = skip_reasons(df)
+        to_select = reasons == ""
+    else:
+        reasons = None
+        to_select = frame_logic_func(df).astype(bool)
+    rows_to_select = df.index[to_select].to_list()
+    selected_df = df.loc[to_select, result_column_names].reset_index(drop=True)
+    skipped_df = df.loc[~to_select, result_column_names].reset_index(drop=True)
+    if reasons is not None:
+        skipped_df["REASON"] = reasons[~to_select].to_list()
+
+    return rows_to_select, selected_df, skipped_df
+
+
+def select_rows_with_decision_store(read_snapshot, decision_store, cohv_logic_factors, cohv_main_logic_func,
+                                    result_column_names, cohv_frame_logic_func=None, logic_version=None):
+    """
+    Incremental version of the selection - decisions of orders with unchanged input values (columns of
+    cohv_logic_factors) are taken from decision_store, only new or changed orders are evaluated. All columns are
+    read from the table (result columns can change without changing the decision, e.g. GSTRS), the store is used to
+    find orders decided in this run (see DecisionStore.decided_since).
+    :param read_snapshot: function(column_names, rows=None) -> {COL_NAME: [values]}, see get_table_snapshot
+    :param decision_store: DecisionStore object
+    :param logic_version: version of the selection logic (e.g. RuleSet.version), it's a part of the fingerprint, so
+    decisions made by a different logic aren't reused
+    :return: tuple (rows_to_select, selected_orders, skipped_orders), skipped_orders have REASON column if
+    cohv_frame_logic_func gives reasons (see select_rows_from_frame)
+    """
+    key_column = decision_store.key_column
+    input_columns = list(cohv_logic_factors.keys())
+    snapshot = read_snapshot([key_column] + input_columns + list(result_column_names))
+    keys = snapshot[key_column]
+
+    version = [] if logic_version is None else [logic_version]
+    fingerprints = [
+        decision_store.fingerprint(version + [snapshot[column_name][row] for column_name in input_columns])
+        for row in range(len(keys))
+    ]
+    known_decisions = decision_store.lookup(keys)
+    # decisions without reason were made by older versions of the store
+    new_rows = [
+        row for row, key in enumerate(keys)
+        if key not in known_decisions
+        or known_decisions[key][0] != fingerprints[row]
+        or known_decisions[key][2] is None
+    ]
+
+    # Only new and changed orders are evaluated
+    new_snapshot = {column_name: [values[row] for row in new_rows] for column_name, values in snapshot.items()}
+    if cohv_frame_logic_func:
+        not_empty_columns = [key for key in input_columns if key != 'FEVOR']
+        _, new_selected, new_skipped = select_rows_from_frame(
+            new_snapshot, not_empty_columns, cohv_frame_logic_func, result_column_names
+        )
+        new_selected = new_selected.to_dict("list")
+        new_skipped = new_skipped.to_dict("list")
+    else:
+        _, new_selected, new_skipped = select_rows_from_snapshot(
+            new_snapshot, cohv_logic_factors, cohv_main_logic_func, result_column_names
+        )
+    # {key: (selected, reason)}, reason is an empty string if the logic doesn't give reasons
+    with_reasons = "REASON" in new_skipped
+    new_skipped_keys = new_skipped.get(key_column, [])
+    new_reasons = new_skipped["REASON"] if with_reasons else [""] * len(new_skipped_keys)
+    new_decisions = {key: (False, reason) for key, reason in zip(new_skipped_keys, new_reasons)}
+    new_decisions.update(dict.fromkeys(new_selected.get(key_column, []), (True, "")))
+    new_row_positions = {row: idx for idx, row in enumerate(new_rows)}
+
+    rows_to_select = []
+    selected_orders = dict()
+    skipped_orders = dict()
+    decisions = []
+    for row, key in enumerate(keys):
+        if row not in new_row_positions:
+            selected, reason = known_decisions[key][1:]
+        elif key in new_decisions:
+            selected, reason = new_decisions[key]
+        else:
+            # not evaluated, e.g. row with total sum at the bottom of the table
+            continue
+
+        if selected:
+            rows_to_select.append(row)
+        orders = selected_orders if selected else skipped_orders
+        for col in result_column_names:
+            orders.setdefault(col, []).append(snapshot[col][row])
+        if with_reasons and not selected:
+            orders.setdefault("REASON", []).append(reason)
+        decisions.append((key, fingerprints[row], selected, reason))
+
+    decision_store.record(decisions)
+    return rows_to_select, selected_orders, skipped_orders
+
+
+def select_rows_in_table(transaction, num_of_window, table_id, cohv_logic_factors, cohv_main_logic_func, result_column_names, session=None,
+                         cohv_frame_logic_func=None, decision_store=None, export_threshold=EXPORT_ROW_THRESHOLD,
+                         logic_version=None):
     """
     Selects rows in table which meets the following condition: 'quantity of pcs on the stock equals to 0'
     :param result_column_names: list of columns values of which we want to get back as a result
@@ -225,6 +948,13 @@ def select_rows_in_table(transaction, num_of_window, table_id, cohv_logic_factor
     :param table_id: table id
     :param cohv_logic_factors: {COL_NAME: logic_function} dictionary with logic for COHV orders selection
     :param session: SAP session
+    :param cohv_frame_logic_func: optional batch version of cohv_main_logic_func (DataFrame -> boolean Series),
+    if given the logic is evaluated for the whole table at once
+    :param decision_store: optional DecisionStore object, if given only new or changed orders are evaluated
+    (see select_rows_with_decision_store)
+    :param logic_version: version of the selection logic for decision_store (see select_rows_with_decision_store)
+    :param export_threshold: tables with more rows are read through local export (see get_table_snapshot_by_export),
+    None - always cell by cell
     :return: dictionary with three keys: {'selected_orders': dict, 'skipped_orders': dict, 'sap_message': str}
     """
     if not session:
@@ -232,55 +962,44 @@ def select_rows_in_table(transaction, num_of_window, table_id, cohv_logic_factor
     else:
         obj_sess = session
 
-    rows_to_select = []
-    selected_orders = dict()
-    skipped_orders = dict()
     result = dict()
 
     table = obj_sess.findById(table_id)
-    row_count = table.RowCount
-    visible_rows = table.VisibleRowCount
-
-    # retrieved_values = dict()
-    # idx = 0
-
-    current_row = 0
-    while current_row < row_count:
-        # Set the first visible row to the current row index
-        table.firstVisibleRow = current_row
-
-        # Read rows currently visible
-        for i in range(visible_rows):
-            if current_row + i == row_count:
-                break
-
-            # stock can be an empty string in the last row (row with total sum at the bottom of the table)
-            not_empty_columns = list(cohv_logic_factors.keys())
-            not_empty_columns.remove('FEVOR')   # Prod planner can be an empty string, so I exclude this column
-            not_empty = [True if table.GetCellValue(current_row + i, key) != '' else False for key in not_empty_columns]
-            not_empty = all(not_empty)
-            if not_empty:
-                # stock_quantity = int(table.GetCellValue(current_row + i, cohv_logic))
-                logic_params = dict()
-                for key, func in cohv_logic_factors.items():
-                    col_value = table.GetCellValue(current_row + i, key)
-                    logic_params[key + "_" + func.__name__] = func(col_value)
-                if cohv_main_logic_func(logic_params):
-                    # to be selected
-                    rows_to_select.append(i + current_row)
-
-                    # Get data from specified columns from rows which will be selected
-                    for col in result_column_names:
-                        table_value = table.GetCellValue(current_row + i, col)
-                        selected_orders.setdefault(col, []).append(table_value)
-                else:
-                    # to be skipped
-                    for col in result_column_names:
-                        table_value = table.GetCellValue(current_row + i, col)
-                        skipped_orders.setdefault(col, []).append(table_value)
-
-        # Scroll down
-        current_row += visible_rows
+    needed_columns = list(cohv_logic_factors.keys()) + list(result_column_names)
+    if decision_store is not None:
+        needed_columns.append(decision_store.key_column)
+
+    exported = None
+    if export_threshold is not None and table.RowCount > export_threshold:
+        exported = get_table_snapshot_by_export(obj_sess, table, needed_columns)
+
+    def read_snapshot(column_names, rows=None):
+        if exported is None:
+            return get_table_snapshot(table, column_names, rows)
+        return {
+            col: exported[col] if rows is None else [exported[col][row] for row in rows]
+            for col in dict.fromkeys(column_names)
+        }
+
+    if decision_store is not None:
+        rows_to_select, selected_orders, skipped_orders = select_rows_with_decision_store(
+            read_snapshot, decision_store, cohv_logic_factors, cohv_main_logic_func, result_column_names,
+            cohv_frame_logic_func, logic_version
+        )
+    elif cohv_frame_logic_func:
+        # Each needed column is read only once per row
+        snapshot = read_snapshot(list(cohv_logic_factors.keys()) + list(result_column_names))
+        not_empty_columns = [key for key in cohv_logic_factors.keys() if key != 'FEVOR']
+        rows_to_select, selected_df, skipped_df = select_rows_from_frame(
+            snapshot, not_empty_columns, cohv_frame_logic_func, result_column_names
+        )
+        selected_orders = selected_df.to_dict("list") if not selected_df.empty else dict()
+        skipped_orders = skipped_df.to_dict("list") if not skipped_df.empty else dict()
+    else:
+        snapshot = read_snapshot(list(cohv_logic_factors.keys()) + list(result_column_names))
+        rows_to_select, selected_orders, skipped_orders = select_rows_from_snapshot(
+            snapshot, cohv_logic_factors, cohv_main_logic_func, result_column_names
+        )
 
     rows_to_select = ",".join(map(str, rows_to_select))
     table.selectedRows = rows_to_select
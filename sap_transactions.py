@@ -1,9 +1,16 @@
-import re
-import time
+import io
 
+import pandas as pd
 import pyperclip
-import pywintypes
-from sap_functions import clear_sap_warnings, get_sap_message
+try:
+    import pywintypes
+except ImportError:
+    # pywin32 is available only on Windows
+    pywintypes = None
+from sap_functions import clear_sap_warnings, get_sap_message, TableControlWriter, write_grid_rows, \
+    read_list_records, GridWriter
+from sap_waits import wait_while_busy
+from screen_index import SCREEN_INDEX
 
 
 def pk03_get_container_data(mat_nr, plant, prod_supply_area, session):
@@ -129,41 +136,33 @@ def zfauf_create_production_orders(session, file_path):
         return f"Exception: {str(e)}"
 
 
-def zpp_cserie_insert_data_to_table(session, new_values: dict, table_id, load_variant=False, save_orders=False):
+def zpp_cserie_insert_data_to_table(session, new_values, table_id, load_variant=False, save_orders=False,
+                                    verify_sample_size=20):
     """
     :param session: SAP session to work with
-    :param new_values: :dict: of new values to be inserted, keys must correspond to names of columns
+    :param new_values: DataFrame (or :dict: {column name: list of values}) of new values to be inserted, columns must
+    correspond to names of columns of the table and rows to rows of the table
     :param table_id:
     :param load_variant: boolean , determines if variant should be loaded first
     :param save_orders: boolean , determines if production orders should be saved at the end(by clicking 'Sichern Fauf')
+    :param verify_sample_size: number of rows which are read back after writing (0 - no verification)
     :return: "OK" if successful, or an error message if an error occurs.
     """
     try:
         if load_variant:
             session.findById("wnd[0]/tbar[1]/btn[8]").press()
 
-        column_names = list(new_values.keys())
+        df = new_values if isinstance(new_values, pd.DataFrame) else pd.DataFrame(new_values)
+        grid_writer = GridWriter(session.findById(table_id), session)
+        stats = grid_writer.write(df)
+        print(f"{stats['rows']} rows ({stats['cells']} cells) written in {stats['seconds']:.1f} s "
+              f"({stats['rows_per_sec']:.1f} rows/sec).")
 
-        table = session.findById(table_id)
-        row_count = table.RowCount
-        visible_rows = table.VisibleRowCount
-
-        current_row = 0
-        counter = 0
-        while current_row < row_count:
-            # Set the first visible row to the current row index
-            table.firstVisibleRow = current_row
-
-            # Insert to rows currently visible
-            for i in range(visible_rows):
-                if current_row + i == row_count:
-                    break
-                for column_name in column_names:
-                    table.modifyCell(current_row + i, str(column_name), str(new_values[column_name][counter]))
-                    counter += 1
-
-            #     Scroll down
-            current_row += visible_rows
+        mismatches = grid_writer.verify(df, sample_size=verify_sample_size)
+        if mismatches:
+            row, column_name, expected, actual = mismatches[0]
+            return (f"Exception: {len(mismatches)} sampled cells differ after writing, e.g. row {row} column "
+                    f"{column_name}: expected '{expected}', found '{actual}'")
 
         if save_orders:
             session.findById("wnd[0]/tbar[1]/btn[32]").press()
@@ -217,6 +216,7 @@ def cohv_mass_processing(session, type_of_operation, select_all=True):
 def partial_matching(sap_session, id_element_tag, id_root_pattern=None, id_root="wnd[0]/usr"):
     """
     Recursively searches for an SAP GUI element within a container using a flexible root ID pattern.
+    Element IDs of the screen are read once and kept in SCREEN_INDEX until the screen changes.
 
     :param id_root:
     :param sap_session: Active SAP GUI session object.
@@ -224,27 +224,21 @@ def partial_matching(sap_session, id_element_tag, id_root_pattern=None, id_root=
     :param id_element_tag: The unique part of the element ID to search for (e.g., "txtGOITEM-ERFMG").
     :return: The full ID of the matched element if found, otherwise None.
     """
+    found = partial_matching_many(sap_session, [id_element_tag], id_root_pattern, id_root)
+    return found[id_element_tag] if found else None
 
-    try:
-        # root_container = sap_session.findById(id_root)
-
-        # Search for a matching root ID dynamically
-        if id_root_pattern:
-            # for element in root_container.Children:
-            #     print(f"Checking element: {element.Id}")  # Debugging output
-            #     if re.search(id_root_pattern, element.Id):
-            #         matched_root_id = element.Id
-            #         return recursive_search(sap_session, matched_root_id, id_element_tag)
-            matched_root_id = recursive_search(sap_session, id_root, id_root_pattern)
-            if matched_root_id:
-                return recursive_search(sap_session, matched_root_id, id_element_tag)
 
-            print("Matching root ID not found!")
-            return None
+def partial_matching_many(sap_session, id_element_tags, id_root_pattern=None, id_root="wnd[0]/usr"):
+    """
+    The same as partial_matching, but resolves many tags at once (in a single pass over the element IDs).
 
-        else:
-            # container = sap_session.findById(id_root)
-            return recursive_search(sap_session, id_root, id_element_tag)
+    :return: {tag: full ID of the matched element or None}, None if there was an error or root ID wasn't found.
+    """
+    try:
+        found = SCREEN_INDEX.find_many(sap_session, id_element_tags, id_root_pattern, id_root)
+        if found is None:
+            print("Matching root ID not found!")
+        return found
 
     except Exception as e:
         print(f"Error finding element: {e}")
@@ -261,22 +255,7 @@ def recursive_search(sap_session, container_id, id_element_tag):
     :return: The matched element ID if found, otherwise None.
     """
     try:
-        container = sap_session.findById(container_id)
-        for element in container.Children:
-            # print(f"Checking element: {element.Id}")  # Debugging output
-
-            # Check if the current element ID contains the desired tag
-            if re.search(rf"{id_element_tag}", element.Id):
-                # print(f"Found match: {element.Id}")
-                return element.Id
-
-            # Recursively check child elements
-            if hasattr(element, 'Children') and len(element.Children) > 0:
-                found_id = recursive_search(sap_session, element.Id, id_element_tag)
-                if found_id:
-                    return found_id
-
-        return None  # No match found in this branch
+        return SCREEN_INDEX.find_many(sap_session, [id_element_tag], id_root=container_id)[id_element_tag]
     except Exception as e:
         print(f"Error searching in container {container_id}: {e}")
         return None
@@ -441,37 +420,14 @@ def migo_fill_table_matnr_quantity(session, df):
 
     # Dynamic SAP GUI element IDs
     index = 0
-    matnr_id = partial_matching(session, rf"ctxtGOITEM-MAKTX\[4,{index}\]",
-                                r"wnd\[0\]/usr/ssubSUB_MAIN_CARRIER:SAPLMIGO:\d+/subSUB_ITEMLIST:SAPLMIGO:\d+/tblSAPLMIGOTV_GOITEM")
-    menge_id = partial_matching(session, rf"txtGOITEM-ERFMG\[5,{index}\]",
-                                r"wnd\[0\]/usr/ssubSUB_MAIN_CARRIER:SAPLMIGO:\d+/subSUB_ITEMLIST:SAPLMIGO:\d+/tblSAPLMIGOTV_GOITEM")
-
-    table = session.FindById(table_id)
-    # Retrieve visible row count
-    visible_rows = table.visibleRowCount
+    column_tags = [rf"ctxtGOITEM-MAKTX\[4,{index}\]", rf"txtGOITEM-ERFMG\[5,{index}\]"]
+    column_ids = partial_matching_many(session, column_tags,
+                                       r"wnd\[0\]/usr/ssubSUB_MAIN_CARRIER:SAPLMIGO:\d+/subSUB_ITEMLIST:SAPLMIGO:\d+/tblSAPLMIGOTV_GOITEM") or dict()
+    matnr_id, menge_id = (column_ids.get(tag) for tag in column_tags)
 
-    index_offset = 0
-
-    for index, row in df.iterrows():
-        matnr_id = str.replace(matnr_id, f"[4,{index - 1 - index_offset}]", f"[4,{index - index_offset}]")
-        menge_id = str.replace(menge_id, f"[5,{index - 1 - index_offset}]", f"[5,{index - index_offset}]")
-
-        session.findById(matnr_id).text = str(row['MatNR'])
-        session.findById(menge_id).text = str(row['Menge'])
-
-        if index == visible_rows - 1 + index_offset:
-            session.findById(table_id).verticalScrollbar.position += 1
-            session.findById(table_id).verticalScrollbar.position = visible_rows + index_offset - 1
-            index_offset += (visible_rows - 1)
-            matnr_id = str.replace(matnr_id, f"[4,{visible_rows - 1}]", f"[4,{index - index_offset}]")
-            menge_id = str.replace(menge_id, f"[5,{visible_rows - 1}]", f"[5,{index - index_offset}]")
-            time.sleep(0.2)
-
-    pos = session.findById(table_id).verticalScrollbar.position
-    while pos > 0:
-        session.findById("wnd[0]").sendVKey(81)  # Page Up key
-        time.sleep(0.2)
-        pos = session.findById(table_id).verticalScrollbar.position
+    writer = TableControlWriter(session, table_id, {"MatNR": matnr_id, "Menge": menge_id})
+    writer.write_rows({"MatNR": df["MatNR"].to_list(), "Menge": df["Menge"].to_list()})
+    writer.scroll_to_top()
 
 
 def migo_fill_columns_down(session, cols_to_be_filled_down):
@@ -490,7 +446,7 @@ def migo_fill_columns_down(session, cols_to_be_filled_down):
         # Click the "Take Value" button
         if take_value_btn_id:
             session.findById(take_value_btn_id).press()
-            time.sleep(0.2)
+            wait_while_busy(session, replaced_sleep=0.2)
         else:
             print("Take value button not found!")
             return
@@ -509,29 +465,9 @@ def migo_update_storage_locations(session, df):
     storage_loc_id = partial_matching(session, rf"ctxtGOITEM-LGOBE\[9,{index}\]",
                                       r"wnd\[0\]/usr/ssubSUB_MAIN_CARRIER:SAPLMIGO:\d+/subSUB_ITEMLIST:SAPLMIGO:\d+/tblSAPLMIGOTV_GOITEM")
 
-    table = session.FindById(table_id)
-    # Retrieve visible row count
-    visible_rows = table.visibleRowCount
-
-    index_offset = 0
-
-    for index, row in df.iterrows():
-        storage_loc_id = str.replace(storage_loc_id, f"[9,{index - 1 - index_offset}]", f"[9,{index - index_offset}]")
-
-        session.findById(storage_loc_id).text = str(row['storage_loc'])
-
-        if index == visible_rows - 1 + index_offset:
-            session.findById(table_id).verticalScrollbar.position += 1
-            session.findById(table_id).verticalScrollbar.position = visible_rows + index_offset - 1
-            index_offset += (visible_rows - 1)
-            storage_loc_id = str.replace(storage_loc_id, f"[9,{visible_rows - 1}]", f"[9,{index - index_offset}]")
-            time.sleep(0.2)
-
-    pos = session.findById(table_id).verticalScrollbar.position
-    while pos > 0:
-        session.findById("wnd[0]").sendVKey(81)  # Page Up key
-        time.sleep(0.2)
-        pos = session.findById(table_id).verticalScrollbar.position
+    writer = TableControlWriter(session, table_id, {"storage_loc": storage_loc_id})
+    writer.write_rows({"storage_loc": df["storage_loc"].to_list()})
+    writer.scroll_to_top()
 
 
 def mb51_export_data_to_excel(session):
@@ -630,28 +566,20 @@ def me21n_fill_table_with_delivery_orders_data(session, df, purchasing_dep, purc
         print('Business Unit field missing!')
         return
 
-    # Dynamic SAP GUI element IDs
+    # Dynamic SAP GUI element IDs (resolved in one pass)
     index = 0
-    matnr_id = partial_matching(session, rf"ctxtMEPO1211-EMATN\[4,{index}\]",
-                                r"wnd\[0\]/usr/subSUB0:SAPLMEGUI:\d+/subSUB2:SAPLMEVIEWS:\d+/subSUB2:SAPLMEVIEWS:\d+/subSUB1:SAPLMEGUI:\d+/tblSAPLMEGUITC_1211")
-
-    quantity_id = partial_matching(session, rf"txtMEPO1211-MENGE\[6,{index}\]",
-                                   r"wnd\[0\]/usr/subSUB0:SAPLMEGUI:\d+/subSUB2:SAPLMEVIEWS:\d+/subSUB2:SAPLMEVIEWS:\d+/subSUB1:SAPLMEGUI:\d+/tblSAPLMEGUITC_1211")
-
-    # name_id = partial_matching(session, rf"txtMEPO1211-TXZ01\[5,{index}\]",
-    #                             r"wnd\[0\]/usr/subSUB0:SAPLMEGUI:\d+/subSUB2:SAPLMEVIEWS:\d+/subSUB2:SAPLMEVIEWS:\d+/subSUB1:SAPLMEGUI:\d+/tblSAPLMEGUITC_1211")
-
-    unit_id = partial_matching(session, rf"ctxtMEPO1211-MEINS\[7,{index}\]",
-                               r"wnd\[0\]/usr/subSUB0:SAPLMEGUI:\d+/subSUB2:SAPLMEVIEWS:\d+/subSUB2:SAPLMEVIEWS:\d+/subSUB1:SAPLMEGUI:\d+/tblSAPLMEGUITC_1211")
-
-    type_id = partial_matching(session, rf"ctxtMEPO1211-ELPEI\[8,{index}\]",
-                               r"wnd\[0\]/usr/subSUB0:SAPLMEGUI:\d+/subSUB2:SAPLMEVIEWS:\d+/subSUB2:SAPLMEVIEWS:\d+/subSUB1:SAPLMEGUI:\d+/tblSAPLMEGUITC_1211")
-
-    date_id = partial_matching(session, rf"ctxtMEPO1211-EEIND\[9,{index}\]",
-                               r"wnd\[0\]/usr/subSUB0:SAPLMEGUI:\d+/subSUB2:SAPLMEVIEWS:\d+/subSUB2:SAPLMEVIEWS:\d+/subSUB1:SAPLMEGUI:\d+/tblSAPLMEGUITC_1211")
-
-    plant_id = partial_matching(session, rf"ctxtMEPO1211-NAME1\[15,{index}\]",
-                                r"wnd\[0\]/usr/subSUB0:SAPLMEGUI:\d+/subSUB2:SAPLMEVIEWS:\d+/subSUB2:SAPLMEVIEWS:\d+/subSUB1:SAPLMEGUI:\d+/tblSAPLMEGUITC_1211")
+    item_field_tags = [
+        rf"ctxtMEPO1211-EMATN\[4,{index}\]",
+        rf"txtMEPO1211-MENGE\[6,{index}\]",
+        # rf"txtMEPO1211-TXZ01\[5,{index}\]",
+        rf"ctxtMEPO1211-MEINS\[7,{index}\]",
+        rf"ctxtMEPO1211-ELPEI\[8,{index}\]",
+        rf"ctxtMEPO1211-EEIND\[9,{index}\]",
+        rf"ctxtMEPO1211-NAME1\[15,{index}\]",
+    ]
+    item_field_ids = partial_matching_many(session, item_field_tags,
+                                           r"wnd\[0\]/usr/subSUB0:SAPLMEGUI:\d+/subSUB2:SAPLMEVIEWS:\d+/subSUB2:SAPLMEVIEWS:\d+/subSUB1:SAPLMEGUI:\d+/tblSAPLMEGUITC_1211") or dict()
+    matnr_id, quantity_id, unit_id, type_id, date_id, plant_id = (item_field_ids.get(tag) for tag in item_field_tags)
 
     table_id = partial_matching(session, "tblSAPLMEGUITC_1211",
                                 r"wnd\[0\]/usr/subSUB0:SAPLMEGUI:\d+/subSUB2:SAPLMEVIEWS:\d+/subSUB2:SAPLMEVIEWS:\d+/subSUB1:SAPLMEGUI:\d+")
@@ -707,7 +635,7 @@ def me21n_fill_table_with_delivery_orders_data(session, df, purchasing_dep, purc
             type_id = str.replace(type_id, f"[8,{visible_rows - 1}]", f"[8,{index - index_offset}]")
             date_id = str.replace(date_id, f"[9,{visible_rows - 1}]", f"[9,{index - index_offset}]")
             plant_id = str.replace(plant_id, f"[15,{visible_rows - 1}]", f"[15,{index - index_offset}]")
-            time.sleep(0.2)
+            wait_while_busy(session, replaced_sleep=0.2)
 
             # Click the "Position TAB" button (because it can appear after scrolling)
             position_tab_btn_id = partial_matching(session, r"btnDYN_4000-BUTTON",
@@ -722,19 +650,25 @@ def me21n_fill_table_with_delivery_orders_data(session, df, purchasing_dep, purc
         clear_sap_warnings(session)
 
 
-def co02_change_storage_location(session, new_storage_loc, auf_nr):
+def co02_change_storage_location(session, new_storage_loc, auf_nr, skip_if_same=False):
     """
     :param session: SAP Session
     :param new_storage_loc: str: eg. "0004"
     :param auf_nr: str: number of production order
-    :return: "OK" if everything worked correctly or error if error emerged
+    :param skip_if_same: current storage location is read first and order isn't saved if it's the same
+    :return: "OK" if everything worked correctly, "UNCHANGED" if storage location was already the same (only with
+    skip_if_same) or error if error emerged
     """
+    storage_loc_id = "wnd[0]/usr/tabsTABSTRIP_0115/tabpKOWE/ssubSUBSCR_0115:SAPLCOKO1:0190/ctxtAFPOD-LGORT"
     try:
         session.findById("wnd[0]/usr/ctxtCAUFVD-AUFNR").text = str(auf_nr)
         session.findById("wnd[0]").sendVKey(0)
         session.findById("wnd[0]/usr/tabsTABSTRIP_0115/tabpKOWE").select()
-        session.findById(
-            "wnd[0]/usr/tabsTABSTRIP_0115/tabpKOWE/ssubSUBSCR_0115:SAPLCOKO1:0190/ctxtAFPOD-LGORT").text = new_storage_loc
+        if skip_if_same and session.findById(storage_loc_id).text == new_storage_loc:
+            # Leave the order without saving
+            session.findById("wnd[0]/tbar[0]/btn[3]").press()
+            return "UNCHANGED"
+        session.findById(storage_loc_id).text = new_storage_loc
         session.findById("wnd[0]/tbar[0]/btn[11]").press()
     except Exception as e:
         return f"Exception: {str(e)}"
@@ -808,7 +742,7 @@ def me57_convert_purchase_requisitions(session, skip_stock_requisitions=True):
                 account_assignment_category_id = str.replace(account_assignment_category_id, f"[2,{visible_rows - 1}]",
                                                              f"[2,{index - index_offset}]")
                 matnr_id = str.replace(matnr_id, f"[2,{visible_rows - 1}]", f"[2,{index - index_offset}]")
-                time.sleep(0.2)
+                wait_while_busy(session, replaced_sleep=0.2)
 
         if do_deletion:
             # Delete selected rows
@@ -836,11 +770,11 @@ def md01_run_mrp(session):
 
         # Send Enter key (0 = Enter)
         session.findById("wnd[0]").sendVKey(0)
-        time.sleep(0.2)
+        wait_while_busy(session, replaced_sleep=0.2)
         session.findById("wnd[0]").sendVKey(0)
-        time.sleep(0.2)
+        wait_while_busy(session, replaced_sleep=0.2)
         session.findById("wnd[0]").sendVKey(0)
-        time.sleep(0.2)
+        wait_while_busy(session, replaced_sleep=0.2)
 
         # Handle possible pop-up
         if session.Children.Count > 1:  # Check if a pop-up window appeared
@@ -852,68 +786,39 @@ def md01_run_mrp(session):
     return "MD01 MRP run launched successfully."
 
 
-def zkbp1_copy_sap_grid_to_clipboard(session, columns):
+def zkbp1_copy_sap_grid_to_clipboard(session, columns, file_path=None):
     """
     Reads data from all rows in an SAP GUI grid, including those that require scrolling, and copies it to the clipboard.
     :param columns: columns to be copied from SAP table
     :param session: SAP session object
+    :param file_path: if given, rows are written to this (tab separated) file instead of the clipboard
     """
     grid = session.findById("wnd[0]/usr/cntlGRID1/shellcont/shell/shellcont[1]/shell")
 
-    extracted_data = set()  # Use a set to avoid duplicate rows due to scrolling
-    total_rows = grid.rowCount  # Total number of rows in the grid
-    first_visible_row = 0
-
     try:
-        while first_visible_row < total_rows:
-            row_count = grid.visibleRowCount  # Get the number of currently visible rows
-
-            # Read data from each visible row
-            for row in range(first_visible_row, min(first_visible_row + row_count, total_rows)):
-                row_data = tuple(grid.getCellValue(row, col).replace(".", ",") for col in columns)
-                extracted_data.add(row_data)  # Add to set to avoid duplicates
-
-            # Scroll down
-            first_visible_row += row_count
-            try:
-                grid.firstVisibleRow = first_visible_row
-                time.sleep(0.5)  # Wait for SAP to update the view
-            except:
-                break  # If scrolling is not possible, break the loop
-
-        # Convert extracted data to clipboard-friendly format
-        clipboard_data = "\n".join("\t".join(row) for row in extracted_data)
-        pyperclip.copy(clipboard_data)  # Copy to clipboard
+        # Rows are written as they are read (in grid order, identical rows are kept)
+        output = io.StringIO() if file_path is None else open(file_path, "w", encoding="utf-8")
+        with output:
+            num_of_rows = write_grid_rows(grid, columns, output, session=session,
+                                          value_func=lambda value: value.replace(".", ","))
+            if file_path is None:
+                pyperclip.copy(output.getvalue())  # Copy to clipboard
 
     except Exception as e:
         return f"Exception: {str(e)}"
 
-    return f"{len(extracted_data)} rows copied from ZKBP1 transaction."
+    return f"{num_of_rows} rows copied from ZKBP1 transaction."
 
 
 def zpp3u_va03_get_data(session):
-    retrieved_data = dict()
-
-    table = session.findById("wnd[1]/usr")
-
-    for i in range(6, 10_000, 5):
-        ord_field_id = partial_matching(session, rf"lbl\[0,{6}\]", id_root="wnd[1]/usr")
-        creator_field_id = partial_matching(session, rf"lbl\[26,{7}\]", id_root="wnd[1]/usr")
-        date_field_id = partial_matching(session, rf"lbl\[50,{9}\]", id_root="wnd[1]/usr")
-
-        if ord_field_id and creator_field_id and date_field_id:
-            # Get into VA03
-            customer_ord_num = session.findById(ord_field_id).text
-            creator = session.findById(creator_field_id).text
-            doc_date = session.findById(date_field_id).text
-
-            retrieved_data.setdefault("customer_order", []).append(customer_ord_num)
-            retrieved_data.setdefault("creator", []).append(creator)
-            retrieved_data.setdefault("doc_date", []).append(doc_date)
-
-            table.verticalScrollbar.position = i - 1
-
-        else:
-            break
-
-    return retrieved_data
+    """
+    Reads list of customer orders (pop-up of ZPP3U), every order takes 5 lines of the list.
+    :param session: SAP session
+    :return: DataFrame with customer_order, creator and doc_date columns
+    """
+    fields = {
+        "customer_order": (0, 0),
+        "creator": (26, 1),
+        "doc_date": (50, 3),
+    }
+    return read_list_records(session, fields, first_line=6, lines_per_record=5, container_id="wnd[1]/usr")
@@ -0,0 +1,91 @@
+import os
+import threading
+import time
+
+# Waits of each thread summarised by label, see wait_summary
+_WAITS = threading.local()
+
+
+def _record_wait(label, waited_s, replaced_s, success):
+    summary = getattr(_WAITS, "summary", None)
+    if summary is None:
+        summary = _WAITS.summary = dict()
+    item = summary.setdefault(label, {"count": 0, "waited_s": 0.0, "replaced_s": 0.0, "timeouts": 0})
+    item["count"] += 1
+    item["waited_s"] = round(item["waited_s"] + waited_s, 4)
+    item["replaced_s"] = round(item["replaced_s"] + (replaced_s or 0.0), 4)
+    item["timeouts"] += 0 if success else 1
+
+
+def wait_until(condition, timeout=10.0, label="condition", replaced_sleep=None, initial_delay=0.02, max_delay=0.5,
+               backoff=2.0):
+    """
+    Polls condition with exponential back-off until it's met or timeout expires.
+    :param condition: function without arguments returning True when waiting is over (exceptions count as False)
+    :param timeout: max number of seconds to wait
+    :param label: name of the wait in wait_summary
+    :param replaced_sleep: seconds of fixed time.sleep which this wait replaced (only for statistics)
+    :param initial_delay: first delay between checks
+    :param max_delay: max delay between checks
+    :param backoff: multiplier of delay after each check
+    :return: True if condition was met, False on timeout
+    """
+    start_time = time.perf_counter()
+    delay = initial_delay
+    while True:
+        try:
+            success = bool(condition())
+        except Exception:
+            success = False
+
+        elapsed = time.perf_counter() - start_time
+        if success or elapsed >= timeout:
+            _record_wait(label, elapsed, replaced_sleep, success)
+            if not success:
+                print(f"Timeout ({timeout} s) while waiting for: {label}")
+            return success
+
+        time.sleep(min(delay, timeout - elapsed))
+        delay = min(delay * backoff, max_delay)
+
+
+def wait_while_busy(session, timeout=30.0, label="session busy", replaced_sleep=None):
+    """
+    Waits until SAP session is not busy (server round trip is finished and screen is rendered).
+    """
+    return wait_until(lambda: not session.Busy, timeout, label, replaced_sleep)
+
+
+def wait_for_status_change(session, previous_text, timeout=30.0, label="status bar change", replaced_sleep=None):
+    """
+    Waits until text in status bar is different from previous_text.
+    """
+    return wait_until(lambda: session.findById("wnd[0]/sbar").Text != previous_text, timeout, label, replaced_sleep)
+
+
+def wait_for_file(file_path, timeout=30.0, label=None, replaced_sleep=None):
+    """
+    Waits until file exists and its size doesn't change anymore.
+    """
+    last_size = [None]
+
+    def file_complete():
+        size = os.path.getsize(file_path)
+        complete = size == last_size[0]
+        last_size[0] = size
+        return complete
+
+    return wait_until(file_complete, timeout, label or f"file {file_path}", replaced_sleep)
+
+
+def wait_summary(clear=False):
+    """
+    :param clear: starts a new summary (e.g. after each task, see instrumentation.Tracer.drain)
+    :return: {label: {"count", "waited_s", "replaced_s", "timeouts"}} summary of waits of the current thread,
+    replaced_s is the time which fixed sleeps would have taken
+    """
+    summary = getattr(_WAITS, "summary", None) or dict()
+    if clear:
+        _WAITS.summary = dict()
+        return summary
+    return {label: dict(item) for label, item in summary.items()}
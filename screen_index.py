@@ -0,0 +1,138 @@
+import re
+from functools import lru_cache
+
+
+@lru_cache(maxsize=1024)
+def compile_pattern(pattern):
+    """
+    :param pattern: regex pattern
+    :return: compiled pattern (cached, so every pattern is compiled only once)
+    """
+    return re.compile(pattern)
+
+
+def collect_element_ids(container):
+    """
+    Walks the GUI tree once (depth first, every element before its children - the same order in which
+    recursive_search checked them).
+    :param container: SAP GUI container object
+    :return: list of IDs of all elements inside the container
+    """
+    element_ids = []
+    stack = [iter(container.Children)]
+    while stack:
+        element = next(stack[-1], None)
+        if element is None:
+            stack.pop()
+            continue
+
+        element_ids.append(element.Id)
+        try:
+            children = element.Children
+        except Exception:
+            # not a container
+            continue
+        if len(children) > 0:
+            stack.append(iter(children))
+
+    return element_ids
+
+
+class ScreenIndex:
+    """
+    IDs of all elements under a root container (e.g. 'wnd[0]/usr') read in one traversal and kept until the screen
+    (program and dynpro number) changes. Found IDs are validated with findById, so changes of subscreens within the
+    same dynpro are noticed as well - the index is then rebuilt.
+    """
+
+    def __init__(self):
+        # {(session ID, root ID): (screen key, [element IDs])}
+        self._entries = dict()
+
+    @staticmethod
+    def screen_key(session):
+        info = session.Info
+        return info.Program, info.ScreenNumber
+
+    def invalidate(self):
+        self._entries.clear()
+
+    def element_ids(self, session, root_id, refresh=False):
+        """
+        :param session: SAP session
+        :param root_id: ID of the root container
+        :param refresh: rebuild the index even if the screen didn't change
+        :return: (element_ids, rebuilt) tuple
+        """
+        key = (session.Id, root_id)
+        screen_key = self.screen_key(session)
+        entry = self._entries.get(key)
+        if not refresh and entry is not None and entry[0] == screen_key:
+            return entry[1], False
+
+        element_ids = collect_element_ids(session.findById(root_id))
+        self._entries[key] = (screen_key, element_ids)
+        return element_ids, True
+
+    @staticmethod
+    def _search(element_ids, patterns, prefix=None):
+        """
+        :param element_ids: list of IDs in traversal order
+        :param patterns: list of regex patterns
+        :param prefix: only IDs starting with prefix are searched (elements of a subtree)
+        :return: {pattern: first matching ID or None}
+        """
+        compiled = {pattern: compile_pattern(pattern) for pattern in patterns}
+        found = dict.fromkeys(patterns)
+        remaining = set(patterns)
+        for element_id in element_ids:
+            if not remaining:
+                break
+            if prefix is not None and not element_id.startswith(prefix):
+                continue
+            for pattern in list(remaining):
+                if compiled[pattern].search(element_id):
+                    found[pattern] = element_id
+                    remaining.discard(pattern)
+        return found
+
+    def _resolve(self, element_ids, tags, id_root_pattern):
+        if id_root_pattern:
+            matched_root_id = self._search(element_ids, [id_root_pattern])[id_root_pattern]
+            if matched_root_id is None:
+                return None
+            return self._search(element_ids, tags, prefix=matched_root_id + "/")
+        return self._search(element_ids, tags)
+
+    @staticmethod
+    def _all_exist(session, found):
+        for element_id in found.values():
+            if element_id is None:
+                continue
+            try:
+                session.findById(element_id)
+            except Exception:
+                return False
+        return True
+
+    def find_many(self, session, id_element_tags, id_root_pattern=None, id_root="wnd[0]/usr"):
+        """
+        Resolves many tags in a single pass over the (cached) element IDs.
+        :param session: SAP session
+        :param id_element_tags: list of regex patterns of element IDs
+        :param id_root_pattern: regex pattern of a container inside id_root, tags are searched only in it
+        :param id_root: ID of the root container
+        :return: {tag: element ID or None}, None instead of dictionary if id_root_pattern wasn't found
+        """
+        tags = list(dict.fromkeys(id_element_tags))
+        element_ids, rebuilt = self.element_ids(session, id_root)
+        found = self._resolve(element_ids, tags, id_root_pattern)
+
+        # Something is missing or doesn't exist anymore - subscreens could have changed within the same dynpro
+        if not rebuilt and (found is None or None in found.values() or not self._all_exist(session, found)):
+            element_ids, _ = self.element_ids(session, id_root, refresh=True)
+            found = self._resolve(element_ids, tags, id_root_pattern)
+        return found
+
+
+SCREEN_INDEX = ScreenIndex()
@@ -0,0 +1,278 @@
+import inspect
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+try:
+    import pythoncom
+except ImportError:
+    # pywin32 is available only on Windows
+    pythoncom = None
+
+from instrumentation import TRACER
+from sap_connection import invalidate_session_cache
+
+EXECUTORS = ("process", "thread")
+
+
+def session_worker(session_num, task_queue, result_queue, handler):
+    """
+    Long-lived worker which owns one SAP session and processes tasks from task_queue until it gets None.
+    :param session_num: num of SAP window owned by this worker
+    :param task_queue: queue with tasks (None means there is no more work)
+    :param result_queue: queue for ("event" | "result", session_num, task, value, error),
+    ("trace", session_num, events) and ("done", session_num, stats) messages
+    :param handler: function(session_num, task) -> result, must be importable (top level function). If handler is
+    a generator function, every yielded value is sent immediately as "event" and the returned value as "result".
+    :return:
+    """
+    start_time = time.perf_counter()
+    busy_time = 0.0
+    num_of_tasks = 0
+    TRACER.set_worker_name(f"session {session_num}")
+
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+
+        task_start_time = time.perf_counter()
+        try:
+            result = handler(session_num, task)
+            if inspect.isgenerator(result):
+                stages = result
+                while True:
+                    try:
+                        result_queue.put(("event", session_num, task, next(stages), None))
+                    except StopIteration as stop:
+                        result = stop.value
+                        break
+            result_queue.put(("result", session_num, task, result, None))
+        except Exception as e:
+            logging.error(f"Error occurred in session {session_num} while processing {task}", exc_info=True)
+            result_queue.put(("result", session_num, task, None, str(e)))
+        busy_time += time.perf_counter() - task_start_time
+        num_of_tasks += 1
+
+        # stages measured by the handler (see instrumentation.py)
+        trace_events = TRACER.drain()
+        if trace_events:
+            result_queue.put(("trace", session_num, trace_events))
+
+    stats = {
+        "busy_s": round(busy_time, 3),
+        "total_s": round(time.perf_counter() - start_time, 3),
+        "tasks": num_of_tasks,
+    }
+    result_queue.put(("done", session_num, stats))
+
+
+def session_thread_worker(session_num, task_queue, result_queue, handler):
+    """
+    session_worker running in a thread of the main process. COM is initialised for the thread, so it has its own
+    apartment - SAP GUI objects are looked up again by the thread (sessions are cached per thread, see
+    sap_connection.get_client) instead of being passed from another thread.
+    """
+    if pythoncom is not None:
+        pythoncom.CoInitialize()
+    try:
+        session_worker(session_num, task_queue, result_queue, handler)
+    finally:
+        # references to SAP GUI objects have to be released before COM is uninitialised
+        invalidate_session_cache()
+        if pythoncom is not None:
+            pythoncom.CoUninitialize()
+
+
+class SessionPool:
+    """
+    Pool of N workers (processes or threads), each owning one SAP session. Tasks are taken from a shared queue, the
+    largest (according to expected_sizes) first, so no session idles while there is work left.
+    """
+
+    def __init__(self, session_nums, handler, executor="process"):
+        """
+        :param session_nums: list of SAP window numbers, one worker is started per session
+        :param handler: function(session_num, task) -> result, must be importable (top level function)
+        :param executor: "process" - every worker is a separate process, "thread" - workers are threads of this
+        process (no start-up of interpreters and no pickling of tasks and results, work is waiting for SAP anyway)
+        """
+        if executor not in EXECUTORS:
+            raise ValueError(f"Unknown executor {executor}, use one of {', '.join(EXECUTORS)}")
+        self.session_nums = list(session_nums)
+        self.handler = handler
+        self.executor = executor
+        self.utilisation = dict()
+        # trace events sent by workers (see instrumentation.py)
+        self.trace_events = []
+        self._task_queue = None
+        self._result_queue = None
+        self._workers = []
+        self._closed = False
+        self._finished_workers = 0
+
+    @staticmethod
+    def order_tasks(tasks, expected_sizes=None):
+        """
+        :param tasks: list of tasks
+        :param expected_sizes: {task: expected size} dictionary, tasks without history go first (unknown size)
+        :return: tasks sorted from the largest to the smallest
+        """
+        expected_sizes = expected_sizes or dict()
+        return sorted(tasks, key=lambda task: expected_sizes.get(task, float("inf")), reverse=True)
+
+    def start(self):
+        """
+        Starts workers, tasks can be then added with submit() until close() is called.
+        """
+        self.utilisation = dict()
+        self.trace_events = []
+        self._closed = False
+        self._finished_workers = 0
+        if self.executor == "thread":
+            self._task_queue = queue.Queue()
+            self._result_queue = queue.Queue()
+            self._workers = [
+                threading.Thread(
+                    target=session_thread_worker,
+                    args=(session_num, self._task_queue, self._result_queue, self.handler),
+                    name=f"session {session_num}",
+                )
+                for session_num in self.session_nums
+            ]
+        else:
+            self._task_queue = multiprocessing.Queue()
+            self._result_queue = multiprocessing.Queue()
+            self._workers = [
+                multiprocessing.Process(
+                    target=session_worker, args=(session_num, self._task_queue, self._result_queue, self.handler)
+                )
+                for session_num in self.session_nums
+            ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, task):
+        self._task_queue.put(task)
+
+    def close(self):
+        """
+        No more tasks will be submitted - workers finish after the queue is empty. It can be called more times.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        for _ in self._workers:
+            self._task_queue.put(None)
+
+    def shutdown(self):
+        """
+        Stops workers also if messages weren't read to the end (e.g. after an error in the main process) - tasks
+        which weren't started are dropped, running tasks are finished and their messages discarded, workers are
+        joined. Without it non-daemon workers would wait for tasks forever and the program would never end.
+        """
+        if not self._workers or self._finished_workers == len(self._workers):
+            return
+
+        dropped = 0
+        try:
+            while True:
+                if self._task_queue.get_nowait() is not None:
+                    dropped += 1
+        except queue.Empty:
+            pass
+        if dropped:
+            print(f"{dropped} tasks were not started.")
+
+        # sentinels could have been taken from the queue above
+        self._closed = False
+        self.close()
+        for _ in self.messages():
+            pass
+
+    def messages(self):
+        """
+        Yields messages of workers as they arrive until all workers are finished (close() has to be called).
+        :return: generator of (kind, task, value, error) tuples, kind is "event" (value yielded by handler) or
+        "result" (value returned by handler), error is None if task was processed successfully
+        """
+        # Results have to be taken from the queue before join, otherwise workers may block on a full queue
+        while self._finished_workers < len(self._workers):
+            message = self._result_queue.get()
+            if message[0] == "done":
+                _, session_num, stats = message
+                stats["utilisation"] = round(stats["busy_s"] / stats["total_s"], 3) if stats["total_s"] else 0.0
+                self.utilisation[session_num] = stats
+                self._finished_workers += 1
+            elif message[0] == "trace":
+                self.trace_events.extend(message[2])
+            else:
+                kind, session_num, task, value, error = message
+                yield kind, task, value, error
+
+        for worker in self._workers:
+            worker.join()
+
+    def run(self, tasks, expected_sizes=None):
+        """
+        Processes all tasks and yields results as they arrive.
+        :param tasks: list of tasks (e.g. variant names)
+        :param expected_sizes: {task: expected size} dictionary used for ordering of tasks
+        :return: generator of (task, result, error) tuples, error is None if task was processed successfully
+        """
+        self.start()
+        for task in self.order_tasks(tasks, expected_sizes):
+            self.submit(task)
+        self.close()
+
+        try:
+            for kind, task, value, error in self.messages():
+                if kind == "result":
+                    yield task, value, error
+        finally:
+            # the caller could have stopped reading results (error, break)
+            self.shutdown()
+
+    def utilisation_report(self):
+        """
+        :return: one line summary of the last run, e.g. 'session 3: 92% busy (2 tasks, 41.2 s)'
+        """
+        return "; ".join(
+            f"session {session_num}: {stats['utilisation']:.0%} busy ({stats['tasks']} tasks, {stats['total_s']} s)"
+            for session_num, stats in sorted(self.utilisation.items())
+        )
+
+
+def load_expected_sizes(file_path):
+    """
+    :param file_path: path to JSON file with {task: size} history
+    :return: dictionary, empty if the file doesn't exist or can't be read
+    """
+    if not os.path.exists(file_path):
+        return dict()
+    try:
+        with open(file_path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Error reading {file_path}: {e}")
+        return dict()
+
+
+def save_expected_sizes(file_path, sizes):
+    """
+    Updates {task: size} history with the sizes of the last run.
+    :param file_path: path to JSON file
+    :param sizes: {task: size} dictionary
+    :return:
+    """
+    history = load_expected_sizes(file_path)
+    history.update(sizes)
+    try:
+        with open(file_path, "w", encoding="utf-8") as f:
+            json.dump(history, f, indent=2)
+    except OSError as e:
+        print(f"Error saving {file_path}: {e}")
@@ -0,0 +1,74 @@
+import sqlite3
+from datetime import datetime
+
+import pandas as pd
+
+# Results after which the task doesn't have to be done again
+COMPLETED_RESULTS = ("CHANGED", "UNCHANGED")
+
+
+class TaskLedger:
+    """
+    Status of every task of a batch run saved to a local SQLite file as soon as it's known, so an interrupted run
+    can be resumed without redoing completed tasks.
+    """
+
+    def __init__(self, db_path):
+        """
+        :param db_path: path to SQLite file, it's created if it doesn't exist
+        """
+        self.db_path = str(db_path)
+        self._connection = sqlite3.connect(self.db_path, timeout=30)
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS ledger (
+                task_key TEXT PRIMARY KEY,
+                target TEXT,
+                result TEXT,
+                message TEXT,
+                attempts INTEGER,
+                session INTEGER,
+                updated_at TEXT
+            )
+            """
+        )
+        self._connection.commit()
+
+    def completed(self):
+        """
+        :return: {task key: target} dictionary of successfully completed tasks
+        """
+        rows = self._connection.execute(
+            f"SELECT task_key, target FROM ledger WHERE result IN ({','.join('?' * len(COMPLETED_RESULTS))})",
+            COMPLETED_RESULTS,
+        )
+        return dict(rows.fetchall())
+
+    def pending(self, targets):
+        """
+        :param targets: {task key: target} dictionary of all tasks
+        :return: {task key: target} of tasks which weren't completed yet (or were completed with a different target)
+        """
+        completed = self.completed()
+        return {key: target for key, target in targets.items() if completed.get(key) != target}
+
+    def record(self, task_key, target, result, message=None, attempts=None, session=None):
+        with self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO ledger (task_key, target, result, message, attempts, session, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (task_key, target, result, message, attempts, session, datetime.now().isoformat(timespec="seconds")),
+            )
+
+    def frame(self, task_keys=None):
+        """
+        :param task_keys: list of task keys, all by default
+        :return: DataFrame with the ledger (in order of task_keys if given)
+        """
+        df = pd.read_sql_query("SELECT * FROM ledger", self._connection)
+        if task_keys is None:
+            return df
+        return df.set_index("task_key").reindex(list(task_keys)).rename_axis("task_key").reset_index()
+
+    def close(self):
+        self._connection.close()
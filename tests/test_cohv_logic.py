@@ -0,0 +1,74 @@
+import random
+
+import pandas as pd
+import pytest
+
+from COHV_MASS_CONVERSION import COHV_LOGIC_FACTORS, main_cohv_logic_frame, main_cohv_logic_function
+from sap_functions import select_rows_from_frame, select_rows_from_snapshot
+
+RESULT_COL_NAMES = ["AUFNR", "LABST", "FEVOR"]
+NOT_EMPTY_COLUMNS = [column for column in COHV_LOGIC_FACTORS if column != "FEVOR"]
+
+# values as they are read from SAP - empty string is a missing value (e.g. the row with total sum)
+VALUES = {
+    "LABST": ["0", "00", "-0", " 0", "0 ", "1", "-1", "+1", "2", "2147483648", ""],
+    "GAMNG": ["0", "1", "01", " 1", "-1", "2", "2147483648", ""],
+    "MATNR": ["99", "99123", "990", "9", "099", "9 9", "12345", ""],
+    "MATXT": ["9H", "TEXT 9H", "9h", "9 H", "H9", "X9HX", "TEXT", ""],
+    "FEVOR": ["CSR", "csr", "CSR ", " CSR", "ABC", ""],
+}
+
+
+def random_snapshot(rng, num_rows):
+    snapshot = {"AUFNR": [str(1000000 + row) for row in range(num_rows)]}
+    for column_name, values in VALUES.items():
+        snapshot[column_name] = [rng.choice(values) for _ in range(num_rows)]
+    return snapshot
+
+
+def scalar_decision(row):
+    logic_params = {key + "_" + func.__name__: func(row[key]) for key, func in COHV_LOGIC_FACTORS.items()}
+    return main_cohv_logic_function(logic_params)
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_frame_logic_matches_function(seed):
+    rng = random.Random(seed)
+    snapshot = random_snapshot(rng, rng.choice([0, 1, 2, rng.randint(3, 200)]))
+
+    rows_to_select, selected, skipped = select_rows_from_snapshot(
+        snapshot, COHV_LOGIC_FACTORS, main_cohv_logic_function, RESULT_COL_NAMES
+    )
+    frame_rows_to_select, selected_df, skipped_df = select_rows_from_frame(
+        snapshot, NOT_EMPTY_COLUMNS, main_cohv_logic_frame, RESULT_COL_NAMES
+    )
+
+    assert frame_rows_to_select == rows_to_select
+    for column_name in RESULT_COL_NAMES:
+        assert selected_df[column_name].to_list() == selected.get(column_name, [])
+        assert skipped_df[column_name].to_list() == skipped.get(column_name, [])
+
+
+def test_all_combinations():
+    df = pd.DataFrame(
+        [
+            {"LABST": labst, "GAMNG": gamng, "MATNR": matnr, "MATXT": matxt, "FEVOR": fevor}
+            for labst in ("0", "1") for gamng in ("1", "2") for matnr in ("99", "12")
+            for matxt in ("9H", "TEXT") for fevor in ("CSR", "")
+        ]
+    )
+
+    expected = [scalar_decision(row) for row in df.to_dict("records")]
+    assert main_cohv_logic_frame(df).to_list() == expected
+
+
+@pytest.mark.parametrize("column_name", ["LABST", "GAMNG"])
+@pytest.mark.parametrize("value", [None, float("nan"), "1,5", "1 000"])
+def test_invalid_numbers_are_rejected(column_name, value):
+    row = {"LABST": "0", "GAMNG": "1", "MATNR": "99", "MATXT": "TEXT", "FEVOR": "CSR"}
+    row[column_name] = value
+
+    with pytest.raises((TypeError, ValueError)):
+        scalar_decision(row)
+    with pytest.raises((TypeError, ValueError)):
+        main_cohv_logic_frame(pd.DataFrame([row]))
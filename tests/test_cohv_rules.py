@@ -0,0 +1,76 @@
+import pandas as pd
+import pytest
+
+from COHV_MASS_CONVERSION import COHV_LOGIC_FACTORS, DEFAULT_RULES_PATH, is_zero, main_cohv_logic_frame
+from cohv_rules import RulePolicy, load_rules
+from decision_store import DecisionStore
+from sap_functions import convert_sap_values, select_rows_with_decision_store
+
+
+def cohv_frame(**columns):
+    row = {"LABST": "0", "GAMNG": "1", "MATNR": "99123", "MATXT": "TEXT", "FEVOR": "CSR"}
+    row.update(columns)
+    return pd.DataFrame([row])
+
+
+@pytest.fixture(scope="module")
+def rule_set():
+    return load_rules(DEFAULT_RULES_PATH, COHV_LOGIC_FACTORS.keys()).for_variant("ZZ_AUTO_PO8")
+
+
+@pytest.mark.parametrize("labst", ["0,4", "0,5", "0,001"])
+def test_fractional_stock_is_not_zero(rule_set, labst):
+    df = cohv_frame(LABST=labst)
+
+    # CSR order which still has stock has to be skipped
+    assert not rule_set(df).iloc[0]
+    assert rule_set.skip_reasons(df).iloc[0].startswith("condition1")
+    # the scalar logic doesn't take it as zero either
+    with pytest.raises(ValueError):
+        is_zero(labst)
+
+
+def test_int_conversion_keeps_only_whole_numbers():
+    df = convert_sap_values(pd.DataFrame({"x": ["0,4", "0,5", "1.000", "2,000", "10-", ""]}), {"x": "int"})
+    assert df["x"].tolist() == [pd.NA, pd.NA, 1000, 2, -10, pd.NA]
+
+
+def test_default_rules_match_frame_logic(rule_set):
+    df = pd.concat([
+        cohv_frame(LABST=labst, GAMNG=gamng, MATNR=matnr, MATXT=matxt, FEVOR=fevor)
+        for labst in ("0", "5")
+        for gamng in ("1", "3")
+        for matnr in ("99123", "12345")
+        for matxt in ("TEXT 9H", "TEXT")
+        for fevor in ("CSR", "", "ABC")
+    ], ignore_index=True)
+
+    assert rule_set(df).tolist() == main_cohv_logic_frame(df).tolist()
+
+
+def test_unknown_column_is_rejected():
+    spec = {"rule_sets": {"default": {"predicates": {"x": {"column": "WERKS", "op": "eq", "value": "1000"}}}}}
+    with pytest.raises(ValueError):
+        RulePolicy(spec, COHV_LOGIC_FACTORS.keys())
+
+
+def test_reasons_are_kept_with_decisions(rule_set, tmp_path):
+    df = pd.concat([cohv_frame(LABST="5"), cohv_frame(FEVOR="ABC")], ignore_index=True)
+    df["AUFNR"] = ["1", "2"]
+    snapshot = df.to_dict("list")
+    reasons = rule_set.skip_reasons(df).tolist()
+    assert reasons[0]
+    store = DecisionStore(tmp_path / "decisions.sqlite")
+
+    def select():
+        return select_rows_with_decision_store(
+            lambda column_names, rows=None: snapshot, store, COHV_LOGIC_FACTORS, None, ["AUFNR"], rule_set,
+            rule_set.version
+        )
+
+    # reasons of new orders are given by the rule set, then they are taken from the store
+    for _ in range(2):
+        rows_to_select, selected, skipped = select()
+        assert skipped["REASON"] == [reason for reason in reasons if reason]
+        assert skipped["AUFNR"] == [key for key, reason in zip(["1", "2"], reasons) if reason]
+    store.close()
@@ -0,0 +1,33 @@
+import sqlite3
+
+from decision_store import DecisionStore
+
+
+def test_decisions_of_unchanged_orders_are_kept(tmp_path):
+    store = DecisionStore(tmp_path / "decisions.sqlite")
+    store.record([("1", "a", True, ""), ("2", "b", False, "stock")], seen_at=100.0)
+    store.record([("1", "a", True, ""), ("2", "c", True, "")], seen_at=200.0)
+
+    assert store.lookup(["1", "2", "3"]) == {"1": ("a", True, ""), "2": ("c", True, "")}
+    # only the changed order was decided again
+    assert store.decided_since(200.0) == {"2"}
+    store.close()
+
+
+def test_old_store_with_order_values_is_migrated(tmp_path):
+    db_path = tmp_path / "decisions.sqlite"
+    connection = sqlite3.connect(db_path)
+    connection.execute(
+        "CREATE TABLE decisions (order_key TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, selected INTEGER NOT NULL, "
+        "row_data TEXT NOT NULL, decided_at REAL NOT NULL, last_seen REAL NOT NULL)"
+    )
+    connection.execute("INSERT INTO decisions VALUES ('1', 'a', 1, '{}', 100.0, 100.0)")
+    connection.commit()
+    connection.close()
+
+    store = DecisionStore(db_path)
+    store.record([("2", "b", False, "stock")])
+
+    # reason of the old decision isn't known
+    assert store.lookup(["1", "2"]) == {"1": ("a", True, None), "2": ("b", False, "stock")}
+    store.close()
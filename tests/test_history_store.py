@@ -0,0 +1,34 @@
+import pandas as pd
+
+from history_store import read_history, write_results
+
+DAY = "2025-01-31"
+
+
+def results_frame(rows):
+    return pd.DataFrame(rows, columns=["AUFNR", "GAMNG", "VARIANT"])
+
+
+def test_repeated_run_replaces_partitions(tmp_path):
+    write_results(tmp_path, DAY, {
+        "selected": results_frame([("1", "2", "V1"), ("2", "1", "V2")]),
+        "skipped": results_frame([("3", "1", "V1")]),
+    }, variants=["V1", "V2"])
+    # V2 has no orders in the second run of the day, V3 failed (it isn't in variants)
+    write_results(tmp_path, DAY, {
+        "selected": results_frame([("4", "5", "V1")]),
+        "skipped": results_frame([]),
+    }, variants=["V1", "V2"])
+
+    selected = read_history(tmp_path, "selected", columns=["AUFNR", "variant"])
+    assert selected.values.tolist() == [["4", "V1"]]
+    assert read_history(tmp_path, "skipped").empty
+
+
+def test_variants_of_other_runs_are_kept(tmp_path):
+    write_results(tmp_path, DAY, {"selected": results_frame([("1", "2", "V1")])}, variants=["V1"])
+    write_results(tmp_path, DAY, {"selected": results_frame([("2", "2", "V2")])}, variants=["V2"])
+    write_results(tmp_path, "2025-02-01", {"selected": results_frame([])}, variants=["V1", "V2"])
+
+    selected = read_history(tmp_path, "selected", columns=["AUFNR", "variant"]).sort_values("AUFNR")
+    assert selected.values.tolist() == [["1", "V1"], ["2", "V2"]]
@@ -0,0 +1,31 @@
+import threading
+
+import sap_waits
+from instrumentation import Tracer, summarize, summary_line
+
+
+def test_waits_are_drained_to_trace():
+    tracer = Tracer()
+    tracer.drain()
+    sap_waits.wait_summary(clear=True)
+    sap_waits.wait_until(lambda: True, label="ready")
+    sap_waits.wait_until(lambda: False, timeout=0.01, label="never")
+
+    events = tracer.drain()
+
+    waits = summarize(events)["waits"]
+    assert waits["ready"]["count"] == 1 and waits["ready"]["timeouts"] == 0
+    assert waits["never"]["timeouts"] == 1
+    assert "waits: " in summary_line(events) and "never: 1x" in summary_line(events)
+    # waits are reported only once
+    assert sap_waits.wait_summary() == {}
+    assert summarize(tracer.drain())["waits"] == {}
+
+
+def test_waits_are_kept_per_thread():
+    sap_waits.wait_summary(clear=True)
+    thread = threading.Thread(target=sap_waits.wait_until, args=(lambda: True,), kwargs={"label": "other thread"})
+    thread.start()
+    thread.join()
+
+    assert "other thread" not in sap_waits.wait_summary()
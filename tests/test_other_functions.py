@@ -0,0 +1,56 @@
+import pytest
+from openpyxl import Workbook, load_workbook
+
+from other_functions import append_status_rows_to_excel, append_status_to_excel
+
+SHEET_NAME = "COHV_CONVERSION"
+
+
+@pytest.fixture
+def status_file(tmp_path):
+    file_path = str(tmp_path / "status.xlsx")
+    wb = Workbook()
+    ws = wb.active
+    ws.title = SHEET_NAME
+    ws.append(["TIMESTAMP", "start_time", "COHV_CONVERSION_SUMMARY"])
+    wb.save(file_path)
+    return file_path
+
+
+def read_rows(status_file):
+    return list(load_workbook(status_file)[SHEET_NAME].iter_rows(values_only=True))
+
+
+def test_missing_header_is_added(status_file, tmp_path):
+    status = {"start_time": "10:00:00", "COHV_CONVERSION_SUMMARY": "summary", "COHV_RUN_PROFILE": "profile"}
+    append_status_to_excel(status_file, status, str(tmp_path / "error.log"), SHEET_NAME, ["COHV_RUN_PROFILE"])
+
+    rows = read_rows(status_file)
+    assert rows[0] == ("TIMESTAMP", "start_time", "COHV_CONVERSION_SUMMARY", "COHV_RUN_PROFILE")
+    assert rows[1][1:] == ("10:00:00", "summary", "profile")
+
+
+def test_key_without_column_is_reported(status_file, tmp_path, capsys):
+    error_path = tmp_path / "error.log"
+    append_status_to_excel(status_file, {"start_time": "10:00:00", "UNKNOWN": "x"}, str(error_path), SHEET_NAME)
+
+    assert "no column for UNKNOWN" in capsys.readouterr().out
+    assert len(read_rows(status_file)[0]) == 3
+
+
+def test_rows_are_not_written_over_used_rows(status_file, tmp_path):
+    error_path = str(tmp_path / "error.log")
+    wb = load_workbook(status_file)
+    ws = wb[SHEET_NAME]
+    # one empty row (a gap) between used rows
+    ws.append(["2024-01-01 00:00:00", "first", ""])
+    ws.append([None, None, None])
+    ws.append(["2024-01-01 00:00:00", "third", ""])
+    wb.save(status_file)
+
+    append_status_rows_to_excel(status_file, [{"start_time": "a"}, {"start_time": "b"}], error_path, SHEET_NAME)
+    # rows from the sidecar index are checked as well
+    append_status_rows_to_excel(status_file, [{"start_time": "c"}, {"start_time": "d"}], error_path, SHEET_NAME)
+    append_status_rows_to_excel(status_file, [{"start_time": "e"}], error_path, SHEET_NAME)
+
+    assert [row[1] for row in read_rows(status_file)[1:]] == ["first", None, "third", "a", "b", "c", "d", "e"]
@@ -0,0 +1,107 @@
+import pandas as pd
+import pytest
+
+import fake_sap_gui
+import sap_functions
+from sap_functions import GridWriter, get_table_snapshot, get_table_snapshot_by_export, open_one_transaction, \
+    sap_element_exists, simple_load_variant
+
+TABLE_ID = "wnd[0]/usr/cntlGRID/shellcont/shell"
+COHV_COLUMNS = ["AUFNR", "LABST", "GAMNG"]
+
+
+@pytest.fixture
+def cohv_session():
+    gui = fake_sap_gui.FakeSapGui({"V": fake_sap_gui.make_cohv_dataset(300, seed=1)})
+    session = gui.session(0)
+    open_one_transaction(session, "COHV")
+    simple_load_variant(session, "V")
+    return session
+
+
+def test_export_reads_the_same_values_as_grid(cohv_session, tmp_path):
+    table = cohv_session.findById(fake_sap_gui.FakeSession.GRID_ID)
+
+    snapshot = get_table_snapshot_by_export(cohv_session, table, COHV_COLUMNS, export_dir=str(tmp_path))
+
+    assert snapshot == get_table_snapshot(table, COHV_COLUMNS)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_export_in_other_format_is_not_used(cohv_session, tmp_path, monkeypatch):
+    # spreadsheet format
+    monkeypatch.setattr(sap_functions, "TEXT_EXPORT_FORMAT_KEY", "31")
+    table = cohv_session.findById(fake_sap_gui.FakeSession.GRID_ID)
+
+    assert get_table_snapshot_by_export(cohv_session, table, COHV_COLUMNS, export_dir=str(tmp_path)) is None
+    assert not sap_element_exists(cohv_session, "wnd[1]")
+
+
+def test_locked_export_file_is_left(cohv_session, tmp_path, monkeypatch):
+    def locked_file(path):
+        raise PermissionError(f"file is used by another process: {path}")
+
+    monkeypatch.setattr(sap_functions.os, "remove", locked_file)
+    table = cohv_session.findById(fake_sap_gui.FakeSession.GRID_ID)
+
+    assert get_table_snapshot_by_export(cohv_session, table, COHV_COLUMNS, export_dir=str(tmp_path)) is not None
+
+
+def written_grid(df):
+    gui = fake_sap_gui.FakeSapGui({}, visible_rows=10)
+    session = gui.session(0)
+    grid = fake_sap_gui.FakeGrid(session, TABLE_ID, {column: [""] * len(df) for column in df.columns}, visible_rows=10)
+    session._elements[TABLE_ID] = grid
+    writer = GridWriter(grid, session)
+    writer.write(df)
+    return grid, writer
+
+
+def test_numbers_and_dates_are_written_in_sap_format():
+    df = pd.DataFrame({
+        "MATNR": ["M1", "M2", "M3"],
+        "PSMNG": [5, None, 1000],
+        "PRICE": [0.5, -1234.25, 2.0],
+        "GSTRP": pd.to_datetime(["2025-01-31", "2025-02-01", None]),
+    })
+    grid, writer = written_grid(df)
+
+    assert grid._data == {
+        "MATNR": ["M1", "M2", "M3"],
+        "PSMNG": ["5", "", "1.000"],
+        "PRICE": ["0,5", "-1.234,25", "2,0"],
+        "GSTRP": ["31.01.2025", "01.02.2025", ""],
+    }
+    assert writer.verify(df) == []
+
+
+def test_verify_compares_values_as_displayed_by_sap():
+    df = pd.DataFrame({
+        "MATNR": [f"M{idx}" for idx in range(25)],
+        "PSMNG": [idx * 1000 for idx in range(25)],
+        "GSTRP": pd.to_datetime(["2025-01-31"] * 25),
+    })
+    grid, writer = written_grid(df)
+    # quantities are displayed with decimal places
+    grid._data["PSMNG"] = [value + ",000" for value in grid._data["PSMNG"]]
+
+    assert writer.verify(df) == []
+
+    grid._data["PSMNG"][24] = "24.001"
+    grid._data["GSTRP"][0] = "01.02.2025"
+    assert sorted((row, column) for row, column, _, _ in writer.verify(df)) == [(0, "GSTRP"), (24, "PSMNG")]
+
+
+def test_verify_compares_text_columns_as_text():
+    df = pd.DataFrame({"LGORT": ["0003", "0010"], "QUANTITY": ["1,5", "2"]})
+    grid, writer = written_grid(df)
+    grid._data["QUANTITY"] = ["1,500", "2"]
+
+    assert writer.verify(df) == [(0, "QUANTITY", "1,5", "1,500")]
+    assert writer.verify(df, dtypes={"QUANTITY": "float"}) == []
+
+
+def test_mixed_columns_are_not_written():
+    df = pd.DataFrame({"QUANTITY": [1, "2"]})
+    with pytest.raises(ValueError):
+        written_grid(df)